@@ -0,0 +1,3 @@
+"""
+Benchmarks of the synchronisation and the local stand-in of the newrelic API they run against
+"""
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+Measure the import time of the entry points with `python -X importtime`.
+
+    python benchmarks/startup_benchmark.py [--repeat 10] [--top 10] [--json]
+                                           [--save <baseline.json>] [--baseline <baseline.json> [--tolerance 0.25]]
+
+Every entry point module is imported `--repeat` times in a fresh interpreter
+and the median of its cumulative import time is reported, with the heaviest
+modules it pulls in. The CLI entry point must not import any of the web app
+or on-demand dependencies listed in `DEFERRED`.
+
+With `--baseline` the run fails when an entry point got slower than the
+baseline by more than `--tolerance`, or when the CLI imports a deferred module
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = {
+    "cli": "newrelic_alerting.run",
+    "app": "newrelic_alerting.app"
+}
+
+# modules the CLI only imports when the matching feature is used
+DEFERRED = ("flask", "werkzeug", "jinja2", "dateutil", "sqlite3", "multiprocessing", "cProfile", "aiohttp", "httpx")
+
+
+def import_times(module):
+    """
+    :return: a dictionary mapping every imported module to its (self, cumulative) import time in microseconds
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+                            cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if result.returncode != 0:
+        raise RuntimeError("Importing {} failed:\n{}".format(module, result.stderr))
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(own), int(cumulative))
+    return times
+
+
+def measure(module, repeat, top):
+    runs = [import_times(module) for _ in range(repeat)]
+    modules = set().union(*runs)
+    heaviest = sorted(((statistics.median(run[name][0] for run in runs if name in run), name) for name in modules),
+                      reverse=True)[:top]
+    return {
+        "module": module,
+        "import_ms": statistics.median(run[module][1] for run in runs) / 1000,
+        "modules": len(modules),
+        "deferred": sorted(name for name in DEFERRED if name in modules),
+        "heaviest": [{"module": name, "self_ms": own / 1000} for own, name in heaviest]
+    }
+
+
+def regressions(measurements, baseline, tolerance):
+    failures = []
+    for entry_point, measurement in measurements.items():
+        reference = baseline.get(entry_point)
+        if reference and measurement["import_ms"] > reference["import_ms"] * (1 + tolerance):
+            failures.append("{} imports in {:.1f}ms, {:.1f}ms in the baseline".format(
+                entry_point, measurement["import_ms"], reference["import_ms"]))
+    if measurements.get("cli", {}).get("deferred"):
+        failures.append("cli imports {}".format(", ".join(measurements["cli"]["deferred"])))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-r", "--repeat", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10, help="number of heaviest modules listed")
+    parser.add_argument("--json", action="store_true", help="print the measurements as JSON")
+    parser.add_argument("--save", help="write the measurements to a baseline file")
+    parser.add_argument("--baseline", help="baseline file to compare the measurements with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="accepted slowdown over the baseline")
+    args = parser.parse_args()
+
+    measurements = {entry_point: measure(module, args.repeat, args.top)
+                    for entry_point, module in ENTRY_POINTS.items()}
+
+    if args.save:
+        with open(args.save, "w") as baseline_file:
+            json.dump(measurements, baseline_file, indent=2)
+
+    if args.json:
+        print(json.dumps(measurements, indent=2))
+    else:
+        for entry_point, measurement in measurements.items():
+            print("{} ({}): {:.1f}ms, {} modules".format(
+                entry_point, measurement["module"], measurement["import_ms"], measurement["modules"]))
+            for heavy in measurement["heaviest"]:
+                print("    {:<50} {:>8.1f}ms".format(heavy["module"], heavy["self_ms"]))
+            print()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    failures = regressions(measurements, baseline, args.tolerance)
+    for failure in failures:
+        print("REGRESSION: " + failure, file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
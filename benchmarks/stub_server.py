@@ -0,0 +1,449 @@
+"""
+Local stand-in for the newrelic v2 API, used by the benchmarks.
+
+It serves the endpoints used by the alerts manager with Link header
+pagination, optional latency and 429 rate limiting:
+
+    GET    /v2/servers.json                  filter[name], filter[ids], filter[reported], filter[labels]
+    GET    /v2/servers/<id>.json
+    DELETE /v2/servers/<id>.json
+    GET    /v2/labels.json
+    GET    /v2/alerts_policies.json          filter[name]
+    GET    /v2/alerts_conditions.json        policy_id
+    PUT    /v2/alerts_entity_conditions/<id>.json?entity_type=Server&condition_id=<id>
+    DELETE /v2/alerts_entity_conditions/<id>.json?entity_type=Server&condition_id=<id>
+
+and a couple of control endpoints for the benchmark harness:
+
+    GET    /stub/stats                       the API calls served so far
+    POST   /stub/reset                       restore the initial account and reset the stats
+"""
+import copy
+import gzip
+import json
+import math
+import random
+import re
+import threading
+import time
+
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S+00:00"
+
+ENTITY_PATH = re.compile(r"^/v2/(servers|alerts_entity_conditions)/(\d+)\.json$")
+
+
+class StubError(Exception):
+    def __init__(self, status, title):
+        super(StubError, self).__init__(title)
+        self.status = status
+        self.title = title
+
+
+class StubAPI(object):
+    """
+    Synthetic account data served by the stub. Every API call is counted per
+    `(method, endpoint)` and, with a `rate_limit`, the calls exceeding that
+    many requests per second are answered with a `429` and a `Retry-After`
+    """
+
+    def __init__(self, servers=None, labels=None, policies=None, conditions=None, page_size=200, latency=0.0,
+                 rate_limit=None, clock=time.monotonic):
+        self.initial = (servers or [], labels or [], policies or [], conditions or [])
+        self.page_size = page_size
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.reset()
+
+    @classmethod
+    def from_account(cls, account, **kwargs):
+        return cls(account["servers"], account["labels"], account["policies"], account["conditions"], **kwargs)
+
+    def reset(self):
+        servers, labels, policies, conditions = copy.deepcopy(self.initial)
+        with self.lock:
+            self.servers = servers
+            self.servers_by_id = {server["id"]: server for server in servers}
+            self.labels = labels
+            self.policies = policies
+            self.conditions = conditions
+            self.conditions_by_id = {condition["id"]: condition for condition in conditions}
+            self.calls = Counter()
+            self.throttled = 0
+            self.window = None
+            self.window_requests = 0
+
+    @property
+    def requests(self):
+        return sum(self.calls.values())
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": sum(self.calls.values()),
+                "throttled": self.throttled,
+                "calls": {"{} {}".format(*call): count for call, count in sorted(self.calls.items())}
+            }
+
+    def count(self, method, endpoint):
+        """
+        :return: the seconds to wait before retrying when the call is rate limited, None otherwise
+        """
+        with self.lock:
+            self.calls[(method, endpoint)] += 1
+            if not self.rate_limit:
+                return None
+            now = self.clock()
+            if self.window is None or now - self.window >= 1.0:
+                self.window = now
+                self.window_requests = 0
+            self.window_requests += 1
+            if self.window_requests > self.rate_limit:
+                self.throttled += 1
+                return max(1, math.ceil(1.0 - (now - self.window)))
+            return None
+
+    def listing(self, path, query):
+        """
+        :return: a tuple (entity_name, entities) for the listing endpoints, (None, None) otherwise
+        """
+        def first(name):
+            return query.get(name, [None])[0]
+
+        with self.lock:
+            if path == "/v2/servers.json":
+                servers = self.servers
+                if first("filter[name]") is not None:
+                    servers = [server for server in servers if first("filter[name]") in server["name"]]
+                if first("filter[ids]") is not None:
+                    ids = set(int(server_id) for server_id in first("filter[ids]").split(","))
+                    servers = [server for server in servers if server["id"] in ids]
+                if first("filter[reported]") is not None:
+                    reported = first("filter[reported]") == "true"
+                    servers = [server for server in servers if server["reporting"] == reported]
+                if first("filter[labels]") is not None:
+                    labelled = None
+                    for key in first("filter[labels]").split(";"):
+                        server_ids = set(server_id for label in self.labels if label["key"] == key
+                                         for server_id in label["links"]["servers"])
+                        labelled = server_ids if labelled is None else labelled & server_ids
+                    servers = [server for server in servers if server["id"] in labelled]
+                return "servers", servers
+            if path == "/v2/labels.json":
+                return "labels", self.labels
+            if path == "/v2/alerts_policies.json":
+                policies = self.policies
+                if first("filter[name]") is not None:
+                    policies = [policy for policy in policies if first("filter[name]") in policy["name"]]
+                return "policies", policies
+            if path == "/v2/alerts_conditions.json":
+                if first("policy_id") is None:
+                    raise StubError(422, "policy_id is required")
+                policy_id = int(first("policy_id"))
+                return "conditions", [condition_view(condition) for condition in self.conditions
+                                      if condition["policy_id"] == policy_id]
+        return None, None
+
+    def show_server(self, server_id):
+        with self.lock:
+            if server_id not in self.servers_by_id:
+                raise StubError(404, "Server not found")
+            return {"server": self.servers_by_id[server_id]}
+
+    def delete_server(self, server_id):
+        with self.lock:
+            server = self.servers_by_id.pop(server_id, None)
+            if server is None:
+                raise StubError(404, "Server not found")
+            self.servers = [other for other in self.servers if other["id"] != server_id]
+            for label in self.labels:
+                if server_id in label["links"]["servers"]:
+                    label["links"]["servers"].remove(server_id)
+            for condition in self.conditions:
+                condition["entities"].discard(str(server_id))
+            return {"server": server}
+
+    def update_entity_condition(self, method, entity_id, query):
+        if query.get("entity_type", [None])[0] != "Server":
+            raise StubError(422, "entity_type must be Server")
+        condition_id = int(query.get("condition_id", ["0"])[0])
+        with self.lock:
+            condition = self.conditions_by_id.get(condition_id)
+            if condition is None:
+                raise StubError(404, "Condition not found")
+            if method == "PUT":
+                if entity_id not in self.servers_by_id:
+                    raise StubError(404, "Entity not found")
+                condition["entities"].add(str(entity_id))
+            else:
+                condition["entities"].discard(str(entity_id))
+            return {"condition": condition_view(condition)}
+
+
+def condition_view(condition):
+    view = dict(condition)
+    view.pop("policy_id")
+    view["entities"] = sorted(condition["entities"], key=int)
+    return view
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def api(self):
+        return self.server.api
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, title, headers=None):
+        self.send_json(status, {"error": {"title": title}}, headers)
+
+    def page_links(self, url, query, page, last_page):
+        links = []
+        for rel, number in (("next", page + 1), ("last", last_page)):
+            if page < last_page:
+                page_query = dict(query)
+                page_query["page"] = [str(number)]
+                query_string = "&".join("{}={}".format(key, value) for key, values in page_query.items()
+                                        for value in values)
+                links.append('<{}?{}>; rel="{}"'.format(url, query_string, rel))
+        return ", ".join(links)
+
+    def endpoint(self, path):
+        if path.startswith("/stub/"):
+            return None
+        match = ENTITY_PATH.match(path)
+        if match:
+            return "server" if match.group(1) == "servers" else match.group(1)
+        return path.rsplit("/", 1)[-1].replace(".json", "")
+
+    def dispatch(self, method):
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+
+        if parsed.path == "/stub/stats" and method == "GET":
+            self.send_json(200, self.api.stats())
+            return
+        if parsed.path == "/stub/reset" and method == "POST":
+            self.api.reset()
+            self.send_json(200, {})
+            return
+
+        wait = self.api.count(method, self.endpoint(parsed.path))
+        if self.api.latency:
+            time.sleep(self.api.latency)
+        if wait is not None:
+            self.send_error_json(429, "Too many requests", {"Retry-After": str(wait)})
+            return
+
+        try:
+            match = ENTITY_PATH.match(parsed.path)
+            if match and match.group(1) == "servers" and method in ("GET", "DELETE"):
+                server_id = int(match.group(2))
+                payload = self.api.show_server(server_id) if method == "GET" else self.api.delete_server(server_id)
+                self.send_json(200, payload)
+            elif match and match.group(1) == "alerts_entity_conditions" and method in ("PUT", "DELETE"):
+                self.send_json(200, self.api.update_entity_condition(method, int(match.group(2)), query))
+            elif method == "GET":
+                self.send_listing(parsed.path, query)
+            else:
+                self.send_error_json(405, "Method not allowed")
+        except StubError as e:
+            self.send_error_json(e.status, e.title)
+
+    def send_listing(self, path, query):
+        entity_name, entities = self.api.listing(path, query)
+        if entity_name is None:
+            self.send_error_json(404, "Not found")
+            return
+
+        page = int(query.get("page", ["1"])[0])
+        page_size = self.api.page_size
+        last_page = max(1, (len(entities) + page_size - 1) // page_size)
+        url = "http://{}:{}{}".format(self.server.server_address[0], self.server.server_address[1], path)
+        headers = {}
+        links = self.page_links(url, query, page, last_page)
+        if links:
+            headers["Link"] = links
+        self.send_json(200, {entity_name: entities[(page - 1) * page_size:page * page_size]}, headers)
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_PUT(self):
+        self.read_body()
+        self.dispatch("PUT")
+
+    def do_POST(self):
+        self.read_body()
+        self.dispatch("POST")
+
+    def do_DELETE(self):
+        self.read_body()
+        self.dispatch("DELETE")
+
+
+class StubServer(object):
+
+    def __init__(self, api, handler=StubHandler, host="127.0.0.1", port=0):
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.api = api
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return "http://{}:{}/v2".format(host, port)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        # a stopped server can be stopped again
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def synthetic_servers(count):
+    return [{
+        "id": 100000 + index,
+        "account_id": 1,
+        "name": "server-{}".format(index),
+        "host": "server-{}".format(index),
+        "health_status": "green",
+        "reporting": True,
+        "last_reported_at": "2017-10-20T10:00:00+00:00",
+        "summary": {"cpu": 11.4, "memory": 24.3, "fullest_disk": 38.6},
+        "links": {}
+    } for index in range(count)]
+
+
+def synthetic_account(servers=10000, policies=200, conditions=2000, stale=0.01, drift=0.05, seed=0):
+    """
+    Generate a synthetic account where every policy monitors the servers of
+    one deployment through its conditions. The conditions start out of sync
+    with the deployments by a `drift` fraction of their servers, and a `stale`
+    fraction of the servers stopped reporting two days ago
+    :return: a dictionary with the servers, labels, policies and conditions
+             of the account and the matching `alert_policies` configuration
+    """
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    reported_at = now.strftime(TIMESTAMP_FORMAT)
+    stale_at = (now - timedelta(days=2)).strftime(TIMESTAMP_FORMAT)
+
+    account_servers = synthetic_servers(servers)
+    for server in account_servers:
+        if rng.random() < stale:
+            server.update(reporting=False, health_status="unknown", last_reported_at=stale_at)
+        else:
+            server["last_reported_at"] = reported_at
+
+    deployments = ["deployment-{}".format(index) for index in range(policies)]
+    deployment_servers = [[] for _ in deployments]
+    for index, server in enumerate(account_servers):
+        deployment_servers[index % policies].append(server["id"])
+
+    roles = ["web", "backend", "database", "worker"]
+    labels = [{
+        "key": "Deployment:" + deployment,
+        "category": "Deployment",
+        "name": deployment,
+        "links": {"applications": [], "servers": list(server_ids)}
+    } for deployment, server_ids in zip(deployments, deployment_servers)]
+    labels.extend({
+        "key": "Role:" + role,
+        "category": "Role",
+        "name": role,
+        "links": {"applications": [], "servers": [server["id"] for index, server in enumerate(account_servers)
+                                                  if index % len(roles) == role_index]}
+    } for role_index, role in enumerate(roles))
+
+    account_policies = [{
+        "id": 300000 + index,
+        "incident_preference": "PER_POLICY",
+        "name": "policy-{}".format(index),
+        "created_at": 1508493600000,
+        "updated_at": 1508493600000
+    } for index in range(policies)]
+
+    all_server_ids = [server["id"] for server in account_servers]
+    account_conditions = []
+    for index in range(conditions):
+        policy_index = index % policies
+        server_ids = deployment_servers[policy_index]
+        entities = set(str(server_id) for server_id in server_ids if rng.random() >= drift)
+        strays = int(len(server_ids) * drift)
+        entities.update(str(server_id) for server_id in rng.sample(all_server_ids, min(strays, len(all_server_ids))))
+        account_conditions.append({
+            "id": 500000 + index,
+            "policy_id": account_policies[policy_index]["id"],
+            "type": "servers_metric",
+            "name": "condition-{}".format(index),
+            "enabled": True,
+            "entities": entities,
+            "metric": "cpu_percentage",
+            "terms": [{"duration": "5", "operator": "above", "priority": "critical",
+                       "threshold": "90", "time_function": "all"}]
+        })
+
+    return {
+        "servers": account_servers,
+        "labels": labels,
+        "policies": account_policies,
+        "conditions": account_conditions,
+        "alert_policies": [{"name": policy["name"], "tags": [deployment]}
+                           for policy, deployment in zip(account_policies, deployments)]
+    }
+
+
+def start_stub_account(testcase, page_size=200, **account_options):
+    """
+    Serve a synthetic account from a stub server stopped when the test ends
+    :param testcase: the unittest.TestCase the stub is started for
+    :param account_options: the options of `synthetic_account`
+    :return: a tuple (api, config), the StubAPI and a configuration synchronising its account
+    """
+    from newrelic_alerting.config import BaseConfig
+
+    account = synthetic_account(**account_options)
+    api = StubAPI.from_account(account, page_size=page_size)
+    stub = StubServer(api).start()
+    testcase.addCleanup(stub.stop)
+    config = dict(BaseConfig())
+    config.update(API_KEY="key", API_BASE_URL=stub.url, ALERT_CONFIG={"alert_policies": account["alert_policies"]})
+    return api, config
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""
+Measure a full synchronisation, `run.run_synch`, against a synthetic account
+served by the local stub API running in a separate process.
+
+    python benchmarks/sync_benchmark.py [--servers 10000] [--policies 200] [--conditions 2000]
+                                        [-j <jobs>] [--prefetch <pages>] [--engine <threads|asyncio>]
+                                        [--latency <seconds>] [--rate-limit <requests_per_second>]
+                                        [--repeat <runs>] [--plan-only] [--json]
+                                        [--replay <cassette> --alert-config <alert_config.yml>
+                                         [--replay-latency <factor>]]
+
+Every run starts from the same initial account and reports the wall time and
+the API calls served by the stub. The peak memory allocated by the
+synchronisation is measured with tracemalloc on an extra run, so that tracing
+does not slow down the timed ones.
+
+With `--replay` the runs are served offline from a cassette recorded with
+`newrelic_alerting --record <cassette>` instead of the stub, replaying a real
+account at no latency or at the recorded latency scaled by `--replay-latency`
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+import requests
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from newrelic_alerting import run
+from newrelic_alerting.config import BaseConfig
+from benchmarks.stub_server import StubAPI, StubServer, synthetic_account
+
+
+def serve(queue, account_options, api_options):
+    account = synthetic_account(**account_options)
+    api = StubAPI.from_account(account, **api_options)
+    with StubServer(api) as stub:
+        queue.put((stub.url, account["alert_policies"]))
+        threading.Event().wait()
+
+
+def start_stub(account_options, api_options):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve, args=(queue, account_options, api_options), daemon=True)
+    process.start()
+    url, alert_policies = queue.get(timeout=300)
+    return process, url, alert_policies
+
+
+def synchronise(config, control_url, trace_memory=False):
+    if control_url:
+        requests.post(control_url + "/reset").raise_for_status()
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = run.run_synch(dict(config))
+    wall_time = time.perf_counter() - start
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    stats = requests.get(control_url + "/stats").json() if control_url else {}
+    return {
+        "wall_time": wall_time,
+        "peak_memory": peak,
+        "mutations": len(result),
+        "failed": len(getattr(result, "failed", [])),
+        "requests": stats.get("requests", "-"),
+        "throttled": stats.get("throttled", "-"),
+        "calls": stats.get("calls", {})
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--servers", type=int, default=10000)
+    parser.add_argument("--policies", type=int, default=200)
+    parser.add_argument("--conditions", type=int, default=2000)
+    parser.add_argument("--stale", type=float, default=0.01, help="fraction of not reporting servers")
+    parser.add_argument("--drift", type=float, default=0.05, help="fraction of out of sync condition entities")
+    parser.add_argument("--page-size", type=int, default=200)
+    parser.add_argument("-l", "--latency", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=None, help="requests per second before throttling")
+    parser.add_argument("-j", "--jobs", type=int, default=8)
+    parser.add_argument("--prefetch", type=int, default=0)
+    parser.add_argument("--engine", default="threads", choices=["threads", "asyncio"])
+    parser.add_argument("--plan-only", action="store_true")
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run")
+    parser.add_argument("--json", action="store_true", help="print the measurements as JSON")
+    parser.add_argument("--replay", help="cassette to replay instead of the stub API")
+    parser.add_argument("--alert-config", help="alert configuration of the replayed account")
+    parser.add_argument("--replay-latency", type=float, default=0.0, help="factor of the recorded latency")
+    args = parser.parse_args()
+    if args.replay and not args.alert_config:
+        parser.error("--replay requires the --alert-config of the recorded account")
+    # one log line per mutation would dominate the measurements
+    logging.disable(logging.INFO)
+
+    config = dict(BaseConfig())
+    if args.replay:
+        with open(args.alert_config) as alert_config_file:
+            alert_policies = yaml.safe_load(alert_config_file)["alert_policies"]
+        account_options = {"cassette": args.replay}
+        api_options = {"latency": args.replay_latency}
+        process, url, control_url = None, None, None
+        config.update(REPLAY_PATH=args.replay, REPLAY_LATENCY=args.replay_latency)
+    else:
+        account_options = {"servers": args.servers, "policies": args.policies, "conditions": args.conditions,
+                           "stale": args.stale, "drift": args.drift}
+        api_options = {"page_size": args.page_size, "latency": args.latency, "rate_limit": args.rate_limit}
+        process, url, alert_policies = start_stub(account_options, api_options)
+        control_url = url.rsplit("/", 1)[0] + "/stub"
+
+    config.update(API_KEY="benchmark", ALERT_CONFIG={"alert_policies": alert_policies}, API_BASE_URL=url,
+                  JOBS=args.jobs, PREFETCH_PAGES=args.prefetch, ENGINE=args.engine, PLAN_ONLY=args.plan_only)
+
+    try:
+        runs = [synchronise(config, control_url) for _ in range(args.repeat)]
+        if not args.no_memory:
+            runs.append(synchronise(config, control_url, trace_memory=True))
+    finally:
+        if process is not None:
+            process.terminate()
+
+    if args.json:
+        print(json.dumps({"account": account_options, "api": api_options,
+                          "options": {"jobs": args.jobs, "prefetch": args.prefetch, "engine": args.engine,
+                                      "plan_only": args.plan_only},
+                          "runs": runs}, indent=2))
+        return
+
+    print("{:<10} {:>10} {:>10} {:>10} {:>10} {:>12}".format(
+        "run", "wall time", "requests", "throttled", "mutations", "peak memory"))
+    for index, measurement in enumerate(runs):
+        traced = measurement["peak_memory"] is not None
+        print("{:<10} {:>9.2f}s {:>10} {:>10} {:>10} {:>12}".format(
+            "traced" if traced else str(index + 1), measurement["wall_time"], measurement["requests"],
+            measurement["throttled"], measurement["mutations"],
+            "{:.1f} MiB".format(measurement["peak_memory"] / 2 ** 20) if traced else "-"))
+    print()
+    for call, count in runs[0]["calls"].items():
+        print("{:<40} {:>10}".format(call, count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Compare the default requests session with the tuned transport built by
+`newrelic_alerting.transport.create_session` against the local stub API.
+
+    python benchmarks/transport_benchmark.py [-w <workers>] [-n <requests>] [-l <latency_seconds>]
+
+The HTTP/2 backend is measured too when httpx is installed; against the plain
+HTTP stub it negotiates HTTP/1.1, so it only compares the client overhead
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from newrelic_alerting import transport, pagination
+from benchmarks.stub_server import StubAPI, StubServer, synthetic_servers
+
+
+def default_session(api_key, workers):
+    session = requests.Session()
+    session.headers.update({"X-Api-Key": api_key})
+    return session
+
+
+def tuned_session(api_key, workers):
+    return transport.create_session(api_key, pool_size=workers, connect_timeout=5, read_timeout=30)
+
+
+def http2_session(api_key, workers):
+    return transport.create_session(api_key, pool_size=workers, connect_timeout=5, read_timeout=30, http2=True)
+
+
+def measure(session, url, workers, requests_count):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        responses = list(pool.map(lambda page: session.get(url, params={"page": page % 50 + 1}),
+                                  range(requests_count)))
+    concurrent_time = time.perf_counter() - start
+    assert all(response.status_code == 200 for response in responses)
+
+    start = time.perf_counter()
+    servers = pagination.entities(url, session, "servers", prefetch=workers)
+    sweep_time = time.perf_counter() - start
+    return concurrent_time, sweep_time, len(servers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-w", "--workers", type=int, default=32)
+    parser.add_argument("-n", "--requests", type=int, default=2000)
+    parser.add_argument("-l", "--latency", type=float, default=0.005)
+    parser.add_argument("-s", "--servers", type=int, default=10000)
+    args = parser.parse_args()
+    # the default session discards connections once its pool of 10 is full
+    logging.getLogger("urllib3.connectionpool").setLevel(logging.ERROR)
+
+    backends = [("default requests.Session", default_session), ("tuned transport", tuned_session)]
+    try:
+        import httpx  # noqa: F401
+        backends.append(("httpx transport", http2_session))
+    except ImportError:
+        pass
+
+    api = StubAPI(servers=synthetic_servers(args.servers), latency=args.latency)
+    with StubServer(api) as stub:
+        url = stub.url + "/servers.json"
+        print("{:<28} {:>16} {:>14} {:>10}".format("backend", "concurrent GETs", "page sweep", "servers"))
+        for name, factory in backends:
+            session = factory("benchmark", args.workers)
+            concurrent_time, sweep_time, servers = measure(session, url, args.workers, args.requests)
+            session.close()
+            print("{:<28} {:>15.2f}s {:>13.2f}s {:>10}".format(name, concurrent_time, sweep_time, servers))
+
+
+if __name__ == "__main__":
+    main()
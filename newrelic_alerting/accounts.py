@@ -0,0 +1,180 @@
+"""
+Synchronisation of several newrelic accounts in one process. Every account
+gets its own configuration, hence its own session, rate limit budget, cache
+and snapshot, and a failing account does not stop the others
+"""
+import json
+import os
+import time
+import traceback
+
+from concurrent.futures import ThreadPoolExecutor
+
+from . import helper
+from .exceptions import NewRelicAlertingMissingConfVariable, InvalidConfiguration
+
+logger = helper.getLogger(__name__)
+
+THREADS = "threads"
+PROCESSES = "processes"
+
+# settings of the accounts entries which are not plain configuration overrides
+ACCOUNT_FIELDS = ("name", "api_key", "api_key_env", "alert_policies")
+
+# files which must not be shared between the accounts
+PER_ACCOUNT_PATHS = ("CACHE_PATH", "SNAPSHOT_PATH", "RECORD_PATH", "REPLAY_PATH")
+
+
+def is_multi_account(config):
+    alert_config = config["ALERT_CONFIG"]
+    return isinstance(alert_config, dict) and "accounts" in alert_config
+
+
+def redacted(alert_config):
+    """
+    :return: the alert configuration without the api keys of the accounts, for logging
+    """
+    if not isinstance(alert_config, dict) or "accounts" not in alert_config:
+        return alert_config
+    accounts = [dict(account, api_key="<redacted>") if "api_key" in account else account
+                for account in alert_config["accounts"]]
+    return dict(alert_config, accounts=accounts)
+
+
+def account_path(path, name):
+    """
+    :return: the path of a per account file, ie. `snapshot.production.json` for `snapshot.json`
+    """
+    root, extension = os.path.splitext(path)
+    return "{}.{}{}".format(root, name, extension)
+
+
+def account_configs(config, settings):
+    """
+    build the configuration of every account of a multi-account alert configuration
+    :param config: the global configuration, providing the defaults
+    :param settings: the names of the settings an account may override, ie. `requests_per_minute`
+    :return: a list of tuples (account_name, account_config)
+    """
+    configs = []
+    names = set()
+    for index, account in enumerate(config["ALERT_CONFIG"]["accounts"]):
+        name = str(account.get("name", index))
+        if name in names:
+            raise InvalidConfiguration("Duplicate account name: {}".format(name))
+        names.add(name)
+
+        api_key = account.get("api_key")
+        if api_key is None and "api_key_env" in account:
+            api_key = os.environ.get(account["api_key_env"])
+        if not api_key:
+            raise NewRelicAlertingMissingConfVariable("The api_key of account {} needs to be specified".format(name))
+        if "alert_policies" not in account:
+            raise NewRelicAlertingMissingConfVariable(
+                "The alert_policies of account {} need to be specified".format(name))
+
+        account_config = dict(config)
+        account_config.update(API_KEY=api_key, ALERT_CONFIG={"alert_policies": account["alert_policies"]})
+        for key in PER_ACCOUNT_PATHS:
+            if account_config[key]:
+                account_config[key] = account_path(account_config[key], name)
+        for key, value in account.items():
+            if key in ACCOUNT_FIELDS:
+                continue
+            if key.upper() not in settings:
+                raise InvalidConfiguration("Unknown setting {} for account {}".format(key, name))
+            account_config[key.upper()] = value
+        configs.append((name, account_config))
+    return configs
+
+
+class AccountResult(object):
+    def __init__(self, name, result=None, ok=False, error=None, duration=None):
+        self.name = name
+        self.result = result
+        self.ok = ok
+        self.error = error
+        self.duration = duration
+
+    def to_dict(self):
+        return {
+            "account": self.name,
+            "ok": self.ok,
+            "error": self.error,
+            "duration": self.duration,
+            "result": self.result
+        }
+
+
+class AccountsReport(object):
+    def __init__(self, results=None):
+        self.results = results or []
+
+    @property
+    def succeeded(self):
+        return [result for result in self.results if result.ok]
+
+    @property
+    def failed(self):
+        return [result for result in self.results if not result.ok]
+
+    def __len__(self):
+        return len(self.results)
+
+    def __bool__(self):
+        return not self.failed
+
+    def to_dict(self):
+        return {
+            "total": len(self.results),
+            "succeeded": len(self.succeeded),
+            "failed": len(self.failed),
+            "accounts": [result.to_dict() for result in self.results]
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+
+def synchronise_account(synchronise, name, config):
+    """
+    run `synchronise(config)` for one account, turning its failures into the result
+    :return: an AccountResult holding the serialised report or plan
+    """
+    started_at = time.monotonic()
+    try:
+        result = synchronise(config)
+    except Exception as e:
+        logger.error("Synchronisation of account {} failed: {}".format(name, str(e)))
+        logger.error(traceback.format_exc())
+        return AccountResult(name, error=str(e), duration=time.monotonic() - started_at)
+    # a plan never fails, a report fails with any of its mutations or deletions
+    ok = not hasattr(result, "failed") or bool(result)
+    return AccountResult(name, result.to_dict(), ok, duration=time.monotonic() - started_at)
+
+
+def synchronise_accounts(configs, synchronise, jobs=4, pool=THREADS):
+    """
+    synchronise the accounts concurrently
+    :param configs: a list of tuples (account_name, account_config)
+    :param synchronise: the module level function synchronising a single account
+    :param jobs: the number of accounts synchronised at the same time
+    :param pool: `threads`, or `processes` to run the accounts in worker processes, which are spawned
+    :return: an AccountsReport, in the order of the configurations
+    """
+    if pool not in (THREADS, PROCESSES):
+        raise InvalidConfiguration("Unknown accounts pool: {}".format(pool))
+    workers_count = max(1, min(int(jobs), len(configs)))
+    if pool == PROCESSES:
+        # imports multiprocessing, which the thread pool does not need
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # forking a threaded process, ie. the web app, can deadlock the children on the locks held by other threads
+        workers = ProcessPoolExecutor(max_workers=workers_count, mp_context=multiprocessing.get_context("spawn"))
+    else:
+        workers = ThreadPoolExecutor(max_workers=workers_count)
+    with workers:
+        futures = [workers.submit(synchronise_account, synchronise, name, config) for name, config in configs]
+        report = AccountsReport([future.result() for future in futures])
+    logger.info("Synchronised {} accounts, {} failed".format(len(report), len(report.failed)))
+    return report
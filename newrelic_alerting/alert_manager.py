@@ -1,40 +1,104 @@
 from . import helper
+from . import tracing
+from .executor import MutationExecutor
+from .planner import plan_reconciliation, ReconciliationPlan
+from .policy import PoliciesManager, diff_policies
 
 logger = helper.getLogger(__name__)
 
 class NewRelicAlertManager(object):
 
-    def __init__(self, session, config, policy_manager, server_manager):
+    def __init__(self, session, config, policy_manager, server_manager, jobs=1):
         self.session = session
         self.config = config
         self.pm = policy_manager
         self.sm = server_manager
+        self.jobs = jobs
+        self.executor = MutationExecutor(policy_manager.pdm, jobs)
+        self.initialised = False
 
     def initialise(self):
-        for alert_policy in self.config:
-            self.pm.add_alert_policy(alert_policy)
+        with tracing.span("initialise"):
+            # the policies are swapped once loaded, a running synchronisation keeps using the previous ones
+            loaded = PoliciesManager(self.pm.pdm)
+            loaded.add_alert_policies(self.config, jobs=self.jobs)
+            self.pm.alert_policies = loaded.alert_policies
+            self.initialised = True
+
+    def reconfigure(self, config):
+        """
+        Switch to a new list of alert policy configurations. Once initialised
+        only the added and changed policies are initialised again
+        :return: a PolicyDiff
+        """
+        with tracing.span("reconfigure"):
+            if self.initialised:
+                diff = self.pm.reconfigure(self.config, config, jobs=self.jobs)
+            else:
+                diff = diff_policies(self.config, config)
+            self.config = config
+            logger.info("Alert policies reconfigured: {}".format(diff.to_dict()))
+            return diff
+
+    def ensure_initialised(self):
+        if not self.initialised:
+            self.initialise()
+
+    def plan(self, inventory=None, server_ids=None):
+        """
+        Compute the operations needed to assign the servers to the policies
+        without touching the API
+        :param inventory: the ServerInventory to use, fetched if not given
+        :param server_ids: restrict the plan to these server ids
+        :return: a ReconciliationPlan
+        """
+        with tracing.span("plan"):
+            if inventory is None:
+                inventory = self.sm.get_inventory()
+            return plan_reconciliation(self.pm.alert_policies, inventory, server_ids)
+
+    def plan_server(self, server, label_keys):
+        """
+        Compute the operations needed to attach a single server to the
+        policies whose selector matches its labels and to detach it from all
+        the other policies
+        :param server: the server
+        :param label_keys: the `Category:name` keys of the server labels
+        :return: a ReconciliationPlan
+        """
+        with tracing.span("plan"):
+            matching = self.pm.policies_matching(label_keys)
+
+            plan = ReconciliationPlan()
+            for policy in self.pm.alert_policies:
+                for condition in policy.cm.conditions:
+                    if policy in matching:
+                        mutation = condition.register_mutation(server)
+                    else:
+                        mutation = condition.deregister_mutation(server["id"])
+                    if mutation:
+                        plan.add(mutation)
+            logger.info("Planned {} operations for server {}".format(len(plan), server["name"]))
+            return plan
+
+    def apply(self, plan):
+        with tracing.span("apply", mutations=len(plan)):
+            report = self.executor.execute(plan.mutations())
+            logger.info("Applied plan: {} mutations, {} failed".format(len(report), len(report.failed)))
+            return report
 
     def assign_servers_to_policies(self):
         """
-        Assign servers to policies based on their Deployment tag.
+        Assign servers to policies based on their labels.
         ie. all the servers tagged as `dev` will be added to the
-        policies whose tag list contains `dev`
+        policies whose tag list contains `dev`, and the servers matching
+        the selector of a policy to that policy
 
         In addition to this all the unmatched servers will be deleted
         from the policy
-        :return:
+        :return: a MutationReport with the outcome of every API mutation
         """
         logger.info("Refreshing server policies...")
-        for policy in self.pm.alert_policies:
-            tags = []
-            for tag in policy.tags:
-                tags.append("Deployment:" + tag)
-            params = {"filter[labels]": ";".join(tags)}
-            servers = self.sm.get_servers(params=params)
-            for server in servers:
-                policy.register_server(server)
-            #cleanup the policy
-            policy.deregister_servers(servers)
+        report = self.apply(self.plan())
         logger.info("DONE: Refreshing server policies...")
-
-
+        return report
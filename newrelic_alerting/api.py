@@ -1,9 +1,14 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, url_for, request
 from flask import current_app as app
 
 import traceback
+import yaml
 from . import run
 from . import helper
+from .accounts import is_multi_account
+from .config import load_alert_config
+from .config_reload import reload_alert_config
+from .exceptions import ServerNotFound, InvalidConfiguration, PolicyNotFound
 
 logger = helper.getLogger(__name__)
 
@@ -11,8 +16,34 @@ api = Blueprint("api", __name__)
 
 @api.route("/synchronise", methods = ['POST'])
 def synchronise():
+    job = app.extensions["sync_jobs"].submit()
+    job_url = url_for("api.job_status", job_id=job.id)
+    response = jsonify({"status": 202, "message": "Accepted", "job_id": job.id, "job_url": job_url})
+    response.status_code = 202
+    response.headers["Location"] = job_url
+    return response
+
+@api.route("/jobs/<job_id>", methods = ['GET'])
+def job_status(job_id):
+    job = app.extensions["sync_jobs"].get(job_id)
+    if job is None:
+        response = jsonify({"error": "Unknown job {}".format(job_id)})
+        response.status_code = 404
+        return response
+    return jsonify(job.to_dict())
+
+@api.route("/servers/<server>/synchronise", methods = ['POST'])
+def synchronise_server(server):
+    if is_multi_account(app.config):
+        response = jsonify({"error": "Single server synchronisations are not supported with multiple accounts"})
+        response.status_code = 400
+        return response
     try:
-        run.run_synch(app.config)
+        result = run.run_synch_server(app.config, server, app.extensions["model_cache"])
+    except ServerNotFound as snf:
+        response = jsonify({"error": str(snf)})
+        response.status_code = 404
+        return response
     except Exception as re:
         logger.error(re)
         logger.error(repr(traceback.format_stack()))
@@ -21,4 +52,37 @@ def synchronise():
         })
         response.status_code = 503
         return response
-    return jsonify({"status": 200, "message": "OK"})
\ No newline at end of file
+    return jsonify({"status": 200, "message": "OK", "result": result.to_dict()})
+
+@api.route("/cache/invalidate", methods = ['POST'])
+def invalidate_cache():
+    app.extensions["model_cache"].invalidate()
+    return jsonify({"status": 200, "message": "OK"})
+
+@api.route("/config/reload", methods = ['POST'])
+def reload_config():
+    """
+    reload the alert configuration from its file. The configuration is never
+    taken from the request, which would let any client choose the accounts,
+    their keys and the API they are sent to
+    """
+    if request.get_data():
+        response = jsonify({"error": "The alert configuration is only reloaded from its file, the body must be empty"})
+        response.status_code = 400
+        return response
+    try:
+        if not app.config["ALERT_CONFIG_PATH"]:
+            raise InvalidConfiguration("No alert configuration file to reload")
+        with open(app.config["ALERT_CONFIG_PATH"]) as alert_config_file:
+            alert_config = load_alert_config(alert_config_file)
+        diff = reload_alert_config(app.config, app.extensions["model_cache"], alert_config)
+    except (yaml.YAMLError, InvalidConfiguration, PolicyNotFound) as e:
+        response = jsonify({"error": str(e)})
+        response.status_code = 400
+        return response
+    except Exception as re:
+        logger.error(re)
+        response = jsonify({"error": str(re)})
+        response.status_code = 503
+        return response
+    return jsonify({"status": 200, "message": "OK", "changes": diff.to_dict() if diff is not None else None})
@@ -0,0 +1,71 @@
+"""
+The web app, kept apart from the `run` module so that the CLI does not pay
+for importing Flask
+"""
+import sys
+from os import environ
+
+from flask import Flask, Response, url_for, render_template
+
+from .api import api
+from .config import AppConfig
+from .config_reload import ConfigWatcher, reload_alert_config
+from .jobs import JobQueue
+from .model_cache import ModelCache
+from .run import build_managers, run_synch, run_synch_accounts
+from . import accounts
+from . import metrics
+from . import helper
+
+logger = helper.getLogger(__name__)
+
+def create_app(config):
+    app = Flask(__name__)
+
+    app.config.from_object(config)
+    app.register_blueprint(api, url_prefix="/api")
+    model_cache = ModelCache(lambda: build_managers(app.config), ttl=app.config["MODEL_CACHE_TTL"])
+    app.extensions["model_cache"] = model_cache
+    if accounts.is_multi_account(app.config):
+        app.extensions["sync_jobs"] = JobQueue(lambda: run_synch_accounts(app.config))
+    else:
+        app.extensions["sync_jobs"] = JobQueue(lambda: run_synch(app.config, model_cache))
+        if app.config["API_KEY"] and app.config["ENGINE"] != "asyncio":
+            model_cache.warm()
+
+    if app.config["ALERT_CONFIG_PATH"] and app.config["ALERT_CONFIG_POLL_INTERVAL"] > 0:
+        watcher = ConfigWatcher(app.config["ALERT_CONFIG_PATH"],
+                                lambda alert_config: reload_alert_config(app.config, model_cache, alert_config),
+                                interval=app.config["ALERT_CONFIG_POLL_INTERVAL"])
+        watcher.start()
+        app.extensions["config_watcher"] = watcher
+
+    @app.route("/")
+    def index():
+        index_css_url =  url_for('static', filename='styles/index.css')
+        return render_template("index.html.j2", index_css_url=index_css_url)
+
+    @app.route("/metrics")
+    def prometheus_metrics():
+        return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+    return app
+
+
+def main_app():
+
+    config = AppConfig()
+    try:
+        config.load_app_config()
+    except Exception as e:
+        logger.error(e)
+        sys.exit(1)
+
+    logger.info(config)
+    app = create_app(config)
+
+    if "PORT" in environ:
+        app.run("0.0.0.0", int(environ["PORT"]))
+    else:
+        app.debug = config.DEBUG
+        app.run()
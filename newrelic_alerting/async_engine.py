@@ -0,0 +1,433 @@
+"""
+asyncio based synchronisation engine, overlapping all the API calls of a
+synchronisation within one event loop. It mirrors the requests based data
+managers and requires the optional `aiohttp` dependency
+"""
+import asyncio
+import json
+import random
+import time
+
+from collections import deque
+from itertools import islice
+
+import aiohttp
+import requests
+
+from requests.utils import parse_header_links
+
+from . import helper
+from . import metrics
+from . import tracing
+from . import transport
+from .exceptions import UnexpectedStatusCode, PaginationError, PolicyNotFound
+from .executor import MutationResult, MutationReport
+from .inventory import ServerInventory
+from .pagination import handle_response_status, remaining_page_urls
+from .planner import plan_reconciliation, ReconciliationPlan
+from .policy import Policy, PolicyDataManager
+from .records import ServerRecord, ConditionRecord
+from .scheduler import AIMDLimit, TokenBucket, retry_after, THROTTLING_STATUS_CODES
+from .server import ServersDataManager, CleanupResult, CleanupReport, filter_not_reporting
+from .snapshot import reconciliation_scope, drift_scope
+
+logger = helper.getLogger(__name__)
+
+
+class AsyncResponse(object):
+    """
+    Fully read aiohttp response exposing the subset of the requests.Response
+    interface used by the pagination helpers
+    """
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.links = {}
+        if "Link" in headers:
+            for link in parse_header_links(headers["Link"]):
+                self.links[link.get("rel") or link["url"]] = link
+
+    def json(self):
+        return json.loads(self.content.decode("utf-8"))
+
+
+class AsyncConcurrencyLimit(AIMDLimit):
+    """
+    Bound on the number of requests in flight within an event loop,
+    following the same AIMDLimit as the threaded scheduler
+    """
+
+    def __init__(self, maximum, minimum=1):
+        super(AsyncConcurrencyLimit, self).__init__(maximum, minimum)
+        self.condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.available)
+            self.in_flight += 1
+
+    async def release(self):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    async def on_success(self):
+        async with self.condition:
+            self.increase()
+            self.condition.notify_all()
+
+    def on_throttle(self):
+        self.decrease()
+
+
+class AsyncRequestScheduler(object):
+    """
+    Coroutine counterpart of the RequestScheduler: requests are paced by an
+    optional TokenBucket, bounded by an AsyncConcurrencyLimit and throttled
+    requests are retried honouring `Retry-After` or with jittered
+    exponential backoff
+    """
+
+    def __init__(self, session, requests_per_minute=None, max_concurrency=10, max_retries=5,
+                 backoff=1.0, max_backoff=60.0):
+        self.session = session
+        self.bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.concurrency = AsyncConcurrencyLimit(max_concurrency)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def delay(self, attempt, response):
+        requested = retry_after(response)
+        if requested is not None:
+            return requested + random.uniform(0, self.backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    async def _send(self, method, url, params):
+        try:
+            async with self.session.request(method, url, params=params) as raw:
+                return AsyncResponse(raw.status, raw.headers, await raw.read())
+        except asyncio.TimeoutError as e:
+            raise requests.exceptions.Timeout(str(e))
+        except aiohttp.ClientError as e:
+            raise requests.exceptions.ConnectionError(str(e))
+
+    async def request(self, method, url, params=None):
+        attempt = 0
+        while True:
+            if self.bucket:
+                wait = self.bucket.try_acquire()
+                while wait:
+                    await asyncio.sleep(wait)
+                    wait = self.bucket.try_acquire()
+            await self.concurrency.acquire()
+            started_at = time.perf_counter()
+            response = None
+            try:
+                response = await self._send(method, url, params)
+            finally:
+                await self.concurrency.release()
+                finished_at = time.perf_counter()
+                metrics.observe_request(method, url, response, finished_at - started_at)
+                if tracing.active():
+                    # concurrent requests share the event loop thread, draw one track per task
+                    tracing.record("{} {}".format(method, metrics.endpoint_name(url)), tracing.API,
+                                   started_at, finished_at, tid=id(asyncio.current_task()),
+                                   url=url, status=response.status_code if response is not None else "error")
+
+            if response.status_code not in THROTTLING_STATUS_CODES:
+                await self.concurrency.on_success()
+                return response
+
+            self.concurrency.on_throttle()
+            if attempt >= self.max_retries:
+                logger.error("Giving up on {} {} after {} retries".format(method, url, attempt))
+                return response
+
+            delay = self.delay(attempt, response)
+            logger.info("Throttled with status {} on {} {}, retrying in {:.1f}s".format(
+                response.status_code, method, url, delay))
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def get(self, url, params=None):
+        return await self.request("GET", url, params=params)
+
+    async def put(self, url, params=None):
+        return await self.request("PUT", url, params=params)
+
+    async def delete(self, url, params=None):
+        return await self.request("DELETE", url, params=params)
+
+
+async def handle_response(request):
+    try:
+        response = await request
+        handle_response_status(response, 200)
+    except (requests.exceptions.RequestException, UnexpectedStatusCode) as re:
+        logger.error(str(re))
+        return None
+    return response
+
+
+async def get_page(session, url, params=None):
+    try:
+        response = await session.get(url, params=params)
+        handle_response_status(response, 200)
+    except (requests.exceptions.RequestException, UnexpectedStatusCode) as re:
+        logger.error("error while getting the paginated response {}".format(str(re)))
+        raise PaginationError(re)
+    return response
+
+
+async def pages(url, session, params=None, prefetch=0):
+    count = 0
+    async for response in _pages(url, session, params=params, prefetch=prefetch):
+        count += 1
+        yield response
+    metrics.observe_sweep(url, count)
+
+
+async def _pages(url, session, params=None, prefetch=0):
+    response = await get_page(session, url, params=params)
+    yield response
+
+    if prefetch > 0:
+        urls = remaining_page_urls(response)
+        if urls is not None:
+            urls = iter(urls)
+            in_flight = deque(asyncio.ensure_future(get_page(session, url)) for url in islice(urls, prefetch))
+            try:
+                while in_flight:
+                    response = await in_flight.popleft()
+                    next_url = next(urls, None)
+                    if next_url is not None:
+                        in_flight.append(asyncio.ensure_future(get_page(session, next_url)))
+                    yield response
+            finally:
+                for task in in_flight:
+                    task.cancel()
+            return
+
+    while 'next' in response.links:
+        response = await get_page(session, response.links['next']['url'])
+        yield response
+
+
+async def iter_entities(url, session, entity_name, params=None, prefetch=0, record=None):
+    async for response in pages(url, session, params=params, prefetch=prefetch):
+        try:
+            json_response = response.json()
+        except json.decoder.JSONDecodeError as je:
+            logger.error(str(je))
+            break
+        for entity in json_response.get(entity_name, []):
+            yield record(entity) if record else entity
+
+
+async def entities(url, session, entity_name, params=None, prefetch=0, record=None):
+    return [entity async for entity in iter_entities(url, session, entity_name, params=params,
+                                                     prefetch=prefetch, record=record)]
+
+
+class AsyncPolicyDataManager(object):
+
+    def __init__(self, session, prefetch=0, base_url=None):
+        self.session = session
+        self.prefetch = prefetch
+        urls = PolicyDataManager(None, base_url=base_url)
+        self.alert_policies_url = urls.alert_policies_url
+        self.alert_conditions_url = urls.alert_conditions_url
+        self.alerts_entity_conditions_url = urls.alerts_entity_conditions_url
+
+    async def all_policies(self, params=None):
+        return await entities(self.alert_policies_url, self.session, "policies", params=params,
+                              prefetch=self.prefetch)
+
+    async def all_conditions(self, params=None, record=ConditionRecord):
+        return await entities(self.alert_conditions_url, self.session, "conditions", params=params,
+                              prefetch=self.prefetch, record=record)
+
+    async def deregister_server(self, server_id, condition_id):
+        params = {
+            "entity_type": "Server",
+            "condition_id": condition_id
+        }
+        logger.info("REMOVING entity: {} from condition: {}".format(server_id, condition_id))
+        url = self.alerts_entity_conditions_url.format(entity_id=server_id)
+        return await handle_response(self.session.delete(url, params=params))
+
+    async def register_server(self, server, condition_id):
+        params = {
+            "entity_type": "Server",
+            "condition_id": condition_id
+        }
+        logger.info("ADDING entity: {} to condition: {}".format(server["name"], condition_id))
+        url = self.alerts_entity_conditions_url.format(entity_id=server["id"])
+        return await handle_response(self.session.put(url, params=params))
+
+
+class AsyncServersDataManager(object):
+
+    def __init__(self, session, prefetch=0, base_url=None):
+        self.session = session
+        self.prefetch = prefetch
+        urls = ServersDataManager(None, base_url=base_url)
+        self.servers_url = urls.servers_url
+        self.server_delete_url = urls.server_delete_url
+        self.labels_url = urls.labels_url
+
+    async def delete_server(self, server_id):
+        return await handle_response(self.session.delete(self.server_delete_url.format(server_id=server_id)))
+
+    async def get_servers(self, params=None, record=ServerRecord):
+        return await entities(self.servers_url, self.session, "servers", params=params,
+                              prefetch=self.prefetch, record=record)
+
+    async def get_labels(self, params=None):
+        return await entities(self.labels_url, self.session, "labels", params=params, prefetch=self.prefetch)
+
+    async def get_inventory(self):
+        with tracing.span("inventory"):
+            servers, labels = await asyncio.gather(self.get_servers(), self.get_labels())
+            inventory = ServerInventory(servers, labels)
+            logger.info("Fetched server inventory: {}".format(str(inventory)))
+            return inventory
+
+
+class AsyncNewRelicAlertManager(object):
+
+    def __init__(self, config, pdm, sdm, jobs=1):
+        self.config = config
+        self.pdm = pdm
+        self.sdm = sdm
+        self.jobs = max(1, int(jobs))
+        self.alert_policies = []
+
+    async def initialise(self):
+        with tracing.span("initialise"):
+            policies_by_name = {}
+            for policy in await self.pdm.all_policies():
+                policies_by_name.setdefault(policy["name"], policy)
+
+            missing = [policy["name"] for policy in self.config if policy["name"] not in policies_by_name]
+            if missing:
+                raise PolicyNotFound("No newrelic alert policy named: {}".format(", ".join(missing)))
+
+            policies = [Policy(self.pdm, policy) for policy in self.config]
+            for policy in policies:
+                policy.id = policies_by_name[policy.name]["id"]
+            conditions = await asyncio.gather(*[
+                self.pdm.all_conditions(params={"policy_id": policy.id}) for policy in policies])
+            for policy, policy_conditions in zip(policies, conditions):
+                policy.cm.load_conditions(policy_conditions)
+            self.alert_policies = policies
+
+    def plan(self, inventory, server_ids=None):
+        with tracing.span("plan"):
+            return plan_reconciliation(self.alert_policies, inventory, server_ids)
+
+    async def apply(self, plan):
+        semaphore = asyncio.Semaphore(self.jobs)
+
+        async def execute(mutation):
+            async with semaphore:
+                try:
+                    ok = bool(await mutation.execute(self.pdm))
+                    error = None if ok else "unexpected API response"
+                except Exception as e:
+                    logger.error("Mutation failed {}: {}".format(str(mutation), str(e)))
+                    ok, error = False, str(e)
+            if ok:
+                mutation.apply()
+            result = MutationResult(mutation, ok, error)
+            metrics.observe_mutation(result)
+            return result
+
+        with tracing.span("apply", mutations=len(plan)):
+            report = MutationReport(list(await asyncio.gather(*[execute(mutation) for mutation in plan.mutations()])))
+        logger.info("Applied plan: {} mutations, {} failed".format(len(report), len(report.failed)))
+        return report
+
+    async def cleanup_not_reporting_servers(self, hours=24):
+        semaphore = asyncio.Semaphore(self.jobs)
+
+        async def delete(server):
+            logger.info("Permanently deleting server: {}".format(server["name"]))
+            async with semaphore:
+                try:
+                    ok = await self.sdm.delete_server(server["id"])
+                except Exception as e:
+                    logger.error("Failed deleting server {}: {}".format(server["name"], str(e)))
+                    return CleanupResult(server, False, str(e))
+            if not ok:
+                return CleanupResult(server, False, "unexpected API response")
+            return CleanupResult(server, True)
+
+        with tracing.span("cleanup"):
+            servers = await self.sdm.get_servers(params={"filter[reported]": "false"})
+            report = CleanupReport(list(await asyncio.gather(*[
+                delete(server) for server in filter_not_reporting(servers, hours)])))
+        logger.info("Cleaned up not reporting servers: {} deleted, {} failed".format(
+            len(report.deleted), len(report.failed)))
+        return report
+
+
+async def reconcile(config, alert_manager, inventory):
+    snapshot_path = config["SNAPSHOT_PATH"]
+    with tracing.span("snapshot"):
+        snapshot, previous, unchanged, server_ids = reconciliation_scope(
+            config["ALERT_CONFIG"]["alert_policies"], inventory, snapshot_path)
+    if unchanged:
+        return ReconciliationPlan() if config["PLAN_ONLY"] else MutationReport()
+
+    await alert_manager.initialise()
+    server_ids = drift_scope(previous, alert_manager.alert_policies, server_ids)
+    plan = alert_manager.plan(inventory, server_ids)
+    if config["PLAN_ONLY"]:
+        return plan
+
+    report = await alert_manager.apply(plan)
+    if snapshot_path and report:
+        snapshot.record_conditions(alert_manager.alert_policies)
+        snapshot.save(snapshot_path)
+    return report
+
+
+async def synchronise(config):
+    workers = max(1, config["JOBS"], config["PREFETCH_PAGES"])
+    headers = dict(transport.DEFAULT_HEADERS)
+    headers.pop("Connection")
+    headers["X-Api-Key"] = config["API_KEY"]
+    timeout = aiohttp.ClientTimeout(sock_connect=config["CONNECT_TIMEOUT"], sock_read=config["READ_TIMEOUT"])
+    connector = aiohttp.TCPConnector(limit=max(10, workers))
+    if config["CACHE_PATH"]:
+        logger.info("The response cache is not supported by the asyncio engine, ignoring it")
+    if config["RECORD_PATH"] or config["REPLAY_PATH"]:
+        logger.info("Cassettes are not supported by the asyncio engine, ignoring them")
+
+    async with aiohttp.ClientSession(headers=headers, timeout=timeout, connector=connector) as session:
+        scheduler = AsyncRequestScheduler(session,
+                                          requests_per_minute=config["REQUESTS_PER_MINUTE"],
+                                          max_concurrency=workers,
+                                          max_retries=config["MAX_RETRIES"])
+        sdm = AsyncServersDataManager(scheduler, prefetch=config["PREFETCH_PAGES"],
+                                      base_url=config["API_BASE_URL"])
+        pdm = AsyncPolicyDataManager(scheduler, prefetch=config["PREFETCH_PAGES"],
+                                     base_url=config["API_BASE_URL"])
+        alert_manager = AsyncNewRelicAlertManager(config["ALERT_CONFIG"]["alert_policies"], pdm, sdm,
+                                                  jobs=config["JOBS"])
+
+        with tracing.span("synchronise", tracing.SYNC):
+            result = await reconcile(config, alert_manager, await sdm.get_inventory())
+            if config["PLAN_ONLY"]:
+                return result
+
+            result.cleanup = await alert_manager.cleanup_not_reporting_servers(config["MAX_INACTIVITY"])
+            return result
+
+
+def run_synch_async(config):
+    return asyncio.run(synchronise(config))
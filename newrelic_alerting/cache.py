@@ -0,0 +1,131 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from . import helper
+
+logger = helper.getLogger(__name__)
+
+
+class ResponseCache(object):
+    """
+    Persistent store of GET responses backed by a local SQLite database.
+    Entries older than `ttl` seconds are evicted
+    """
+
+    def __init__(self, path, ttl=86400):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, "
+                "url TEXT, "
+                "headers TEXT, "
+                "body BLOB, "
+                "stored_at REAL)")
+        self.evict_expired()
+
+    def evict_expired(self):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM responses WHERE stored_at < ?", (time.time() - self.ttl,))
+
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT url, headers, body, stored_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        url, headers, body, stored_at = row
+        if stored_at < time.time() - self.ttl:
+            self.delete(key)
+            return None
+        return {"url": url, "headers": json.loads(headers), "body": body}
+
+    def set(self, key, url, headers, body):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, url, headers, body, stored_at) VALUES (?, ?, ?, ?, ?)",
+                (key, url, json.dumps(dict(headers)), body, time.time()))
+
+    def delete(self, key):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class CachingHTTPAdapter(BaseAdapter):
+    """
+    Transport adapter revalidating GET requests against a ResponseCache with
+    `If-None-Match`/`If-Modified-Since`. A `304 Not Modified` answer is
+    served from the cache, any other request goes through the wrapped adapter
+    """
+
+    def __init__(self, cache, adapter=None):
+        super(CachingHTTPAdapter, self).__init__()
+        self.cache = cache
+        self.adapter = adapter or HTTPAdapter()
+
+    @staticmethod
+    def cache_key(request):
+        # the api key is part of the key so that accounts never share entries
+        api_key = request.headers.get("X-Api-Key", "")
+        return hashlib.sha256((api_key + " " + request.url).encode("utf-8")).hexdigest()
+
+    def send(self, request, **kwargs):
+        if request.method != "GET":
+            return self.adapter.send(request, **kwargs)
+
+        key = self.cache_key(request)
+        entry = self.cache.get(key)
+        if entry is not None:
+            headers = CaseInsensitiveDict(entry["headers"])
+            if "ETag" in headers:
+                request.headers["If-None-Match"] = headers["ETag"]
+            if "Last-Modified" in headers:
+                request.headers["If-Modified-Since"] = headers["Last-Modified"]
+
+        response = self.adapter.send(request, **kwargs)
+
+        if response.status_code == 304 and entry is not None:
+            response.close()
+            logger.debug("Cache hit for {}".format(request.url))
+            self.cache.set(key, entry["url"], entry["headers"], entry["body"])
+            return self.build_response(request, entry)
+
+        if response.status_code == 200 and ("ETag" in response.headers or "Last-Modified" in response.headers):
+            # the body is stored already decoded
+            headers = {name: value for name, value in response.headers.items()
+                       if name.lower() not in ("content-encoding", "content-length", "transfer-encoding")}
+            self.cache.set(key, request.url, headers, response.content)
+        return response
+
+    @staticmethod
+    def build_response(request, entry):
+        response = Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = entry["body"]
+        response.url = entry["url"]
+        response.request = request
+        response.from_cache = True
+        return response
+
+    def close(self):
+        # closing a ResponseCache shared by the adapters of a session twice is harmless
+        self.adapter.close()
+        self.cache.close()
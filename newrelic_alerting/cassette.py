@@ -0,0 +1,228 @@
+"""
+Record and replay of the API traffic. A RecordingHTTPAdapter writes every
+request and response of a synchronisation, with its timing, to a cassette
+file, and a ReplayHTTPAdapter serves a cassette back without any network
+access, instantly or at the recorded latency scaled by a factor.
+
+Cassettes are JSON lines files, gzip compressed when their name ends with
+`.gz`. The first line is a header, every other line an interaction. Request
+headers, hence the API key, are never recorded
+"""
+import base64
+import gzip
+import json
+import threading
+import time
+
+from collections import deque
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.exceptions import ConnectionError
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from . import helper
+
+logger = helper.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+# the bodies are stored decoded
+SKIPPED_HEADERS = ("content-encoding", "content-length", "transfer-encoding", "connection")
+
+
+class CassetteMiss(ConnectionError):
+    """
+    The replayed cassette has no interaction for a request
+    """
+
+
+def interaction_key(method, url):
+    """
+    :return: the key matching a request with its recordings: the method, path
+             and sorted query parameters, so that a cassette recorded against
+             one API base url replays against any other
+    """
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return "{} {}".format(method, urlunsplit(("", "", parts.path, query, "")))
+
+
+def open_cassette(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def encode_body(content):
+    try:
+        return {"body": content.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"body_base64": base64.b64encode(content).decode("ascii")}
+
+
+def decode_body(interaction):
+    if "body_base64" in interaction:
+        return base64.b64decode(interaction["body_base64"])
+    return interaction.get("body", "").encode("utf-8")
+
+
+class CassetteWriter(object):
+    """
+    Appends the interactions to a cassette file as they complete, so that
+    a cassette is usable even when the synchronisation fails half way
+    """
+
+    def __init__(self, path, clock=time.perf_counter):
+        self.path = path
+        self.clock = clock
+        self.origin = clock()
+        self.interactions = 0
+        self.lock = threading.Lock()
+        self.file = open_cassette(path, "w")
+        self.write({"version": FORMAT_VERSION, "recorded_at": time.time()})
+
+    def write(self, entry):
+        self.file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self.file.flush()
+
+    def record(self, request, response, started_at, finished_at):
+        interaction = {
+            "method": request.method,
+            "url": request.url,
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": {name: value for name, value in response.headers.items()
+                        if name.lower() not in SKIPPED_HEADERS},
+            "offset": round(started_at - self.origin, 6),
+            "duration": round(finished_at - started_at, 6)
+        }
+        interaction.update(encode_body(response.content))
+        with self.lock:
+            if self.file.closed:
+                return
+            self.write(interaction)
+            self.interactions += 1
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+                logger.info("Recorded {} API interactions to {}".format(self.interactions, self.path))
+
+
+class Cassette(object):
+    """
+    The interactions of a recorded cassette, indexed by request. Repeated
+    requests are answered in the recorded order, and once exhausted with
+    the last recorded response
+    """
+
+    def __init__(self, interactions, version=FORMAT_VERSION):
+        self.version = version
+        self.lock = threading.Lock()
+        self.recorded = {}
+        for interaction in interactions:
+            key = interaction_key(interaction["method"], interaction["url"])
+            self.recorded.setdefault(key, deque()).append(interaction)
+
+    @classmethod
+    def load(cls, path):
+        with open_cassette(path, "r") as cassette_file:
+            header = json.loads(cassette_file.readline() or "{}")
+            if header.get("version") != FORMAT_VERSION:
+                raise ValueError("Unsupported cassette format in {}: {}".format(path, header.get("version")))
+            interactions = [json.loads(line) for line in cassette_file if line.strip()]
+        logger.info("Loaded {} API interactions from {}".format(len(interactions), path))
+        return cls(interactions)
+
+    def __len__(self):
+        return sum(len(recorded) for recorded in self.recorded.values())
+
+    def next(self, method, url):
+        """
+        :return: the interaction answering a request
+        :raise CassetteMiss: when the request was never recorded
+        """
+        key = interaction_key(method, url)
+        with self.lock:
+            recorded = self.recorded.get(key)
+            if not recorded:
+                raise CassetteMiss("No recorded interaction for {}".format(key))
+            return recorded.popleft() if len(recorded) > 1 else recorded[0]
+
+
+class RecordingHTTPAdapter(BaseAdapter):
+    """
+    Transport adapter recording the requests sent through the wrapped adapter
+    """
+
+    def __init__(self, writer, adapter=None):
+        super(RecordingHTTPAdapter, self).__init__()
+        self.writer = writer
+        self.adapter = adapter or HTTPAdapter()
+
+    def send(self, request, **kwargs):
+        started_at = self.writer.clock()
+        response = self.adapter.send(request, **kwargs)
+        # reading the content also waits for the whole body, like the callers do
+        response.content
+        self.writer.record(request, response, started_at, self.writer.clock())
+        return response
+
+    def close(self):
+        self.adapter.close()
+        self.writer.close()
+
+
+class ReplayHTTPAdapter(BaseAdapter):
+    """
+    Transport adapter answering the requests from a Cassette
+    :param latency: the factor applied to the recorded durations, 0 to answer
+    instantly, 1 to reproduce the recorded latency
+    """
+
+    def __init__(self, cassette, latency=0.0, sleep=time.sleep):
+        super(ReplayHTTPAdapter, self).__init__()
+        self.cassette = cassette
+        self.latency = latency
+        self.sleep = sleep
+
+    def send(self, request, **kwargs):
+        interaction = self.cassette.next(request.method, request.url)
+        if self.latency:
+            self.sleep(interaction["duration"] * self.latency)
+        return self.build_response(request, interaction)
+
+    @staticmethod
+    def build_response(request, interaction):
+        response = Response()
+        response.status_code = interaction["status"]
+        response.reason = interaction.get("reason")
+        response.headers = CaseInsensitiveDict(interaction["headers"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = decode_body(interaction)
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def wrap_adapter(config):
+    """
+    :return: the function wrapping the transport adapter to record or replay
+             the API traffic as configured, or None
+    """
+    if config["REPLAY_PATH"]:
+        cassette = Cassette.load(config["REPLAY_PATH"])
+        latency = config["REPLAY_LATENCY"]
+        return lambda adapter: ReplayHTTPAdapter(cassette, latency)
+    if config["RECORD_PATH"]:
+        # the cassette is only opened once the adapter is actually mounted
+        path = config["RECORD_PATH"]
+        return lambda adapter: RecordingHTTPAdapter(CassetteWriter(path), adapter)
+    return None
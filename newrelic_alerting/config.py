@@ -6,30 +6,133 @@ import yaml
 
 from contextlib import contextmanager
 
-from .exceptions import NewRelicAlertingMissingConfVariable
+from .exceptions import NewRelicAlertingMissingConfVariable, InvalidConfiguration
+from .accounts import is_multi_account, redacted
+from .label_selector import policy_selector
 from . import helper
 
 logger = helper.getLogger(__name__)
 
+# the libyaml based loader is much faster on large configurations
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def load_alert_config(stream):
+    """
+    parse an alert configuration with the safe YAML loader
+    :param stream: a string or a file
+    """
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def validate_alert_config(alert_config):
+    """
+    :raise InvalidConfiguration: when the alert configuration has neither alert policies nor accounts,
+                                 or when a policy selector is not valid
+    """
+    if not isinstance(alert_config, dict):
+        raise InvalidConfiguration("The alert configuration must be a mapping")
+    if is_multi_account({"ALERT_CONFIG": alert_config}):
+        for account in alert_config["accounts"]:
+            if isinstance(account, dict) and isinstance(account.get("alert_policies"), list):
+                validate_selectors(account["alert_policies"])
+        return
+    policies = alert_config.get("alert_policies")
+    if not isinstance(policies, list) or not all(isinstance(policy, dict) and "name" in policy
+                                                 for policy in policies):
+        raise InvalidConfiguration("The alert configuration needs a list of named alert_policies")
+    validate_selectors(policies)
+
+
+def validate_selectors(policies):
+    """
+    compile the selector of every alert policy, before any server is fetched
+    :raise InvalidConfiguration: when a policy selector is not valid
+    """
+    for policy in policies:
+        if isinstance(policy, dict):
+            policy_selector(policy.get("tags") or [], policy.get("selector"))
+
+
+def env_flag(name, default=False):
+    """
+    :return: whether a boolean environment variable is set, ie. to `1`, `true` or `yes`
+    """
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes")
+
 
 class BaseConfig(object):
     MAX_INACTIVITY = 24
+    JOBS = 1
+    PREFETCH_PAGES = 0
+    PLAN_ONLY = False
+    CACHE_PATH = None
+    CACHE_TTL = 86400
+    SNAPSHOT_PATH = None
+    REQUESTS_PER_MINUTE = None
+    MAX_RETRIES = 5
+    CONNECT_TIMEOUT = 10
+    READ_TIMEOUT = 60
+    HTTP2 = False
+    ENGINE = "threads"
+    MODEL_CACHE_TTL = 300
+    API_BASE_URL = None
+    ACCOUNT_JOBS = 4
+    ACCOUNT_POOL = "threads"
+    RECORD_PATH = None
+    REPLAY_PATH = None
+    REPLAY_LATENCY = 0.0
+    ALERT_CONFIG_PATH = None
+    ALERT_CONFIG_POLL_INTERVAL = 10
     DEBUG = False
     API_KEY = None
     ALERT_CONFIG = None
 
     def validate(self):
         mandatory = {
-            "api_key": self.API_KEY,
             "alert config": self.ALERT_CONFIG
         }
+        # every account of a multi-account configuration carries its own key
+        if not is_multi_account(dict(self)):
+            mandatory["api_key"] = self.API_KEY
 
         for description, value in mandatory.items():
             if value is None:
                 raise NewRelicAlertingMissingConfVariable("The variable {} needs to be specified".format(description))
 
+        validate_alert_config(self.ALERT_CONFIG)
+
+        if self.RECORD_PATH and self.REPLAY_PATH:
+            raise InvalidConfiguration("A synchronisation cannot record and replay a cassette at the same time")
+        if self.RECORD_PATH and self.HTTP2:
+            raise InvalidConfiguration("A cassette cannot be recorded with the HTTP/2 transport")
+
     def __iter__(self):
         yield 'MAX_INACTIVITY', self.MAX_INACTIVITY
+        yield 'JOBS', self.JOBS
+        yield 'PREFETCH_PAGES', self.PREFETCH_PAGES
+        yield 'PLAN_ONLY', self.PLAN_ONLY
+        yield 'CACHE_PATH', self.CACHE_PATH
+        yield 'CACHE_TTL', self.CACHE_TTL
+        yield 'SNAPSHOT_PATH', self.SNAPSHOT_PATH
+        yield 'REQUESTS_PER_MINUTE', self.REQUESTS_PER_MINUTE
+        yield 'MAX_RETRIES', self.MAX_RETRIES
+        yield 'CONNECT_TIMEOUT', self.CONNECT_TIMEOUT
+        yield 'READ_TIMEOUT', self.READ_TIMEOUT
+        yield 'HTTP2', self.HTTP2
+        yield 'ENGINE', self.ENGINE
+        yield 'MODEL_CACHE_TTL', self.MODEL_CACHE_TTL
+        yield 'API_BASE_URL', self.API_BASE_URL
+        yield 'ACCOUNT_JOBS', self.ACCOUNT_JOBS
+        yield 'ACCOUNT_POOL', self.ACCOUNT_POOL
+        yield 'RECORD_PATH', self.RECORD_PATH
+        yield 'REPLAY_PATH', self.REPLAY_PATH
+        yield 'REPLAY_LATENCY', self.REPLAY_LATENCY
+        yield 'ALERT_CONFIG_PATH', self.ALERT_CONFIG_PATH
+        yield 'ALERT_CONFIG_POLL_INTERVAL', self.ALERT_CONFIG_POLL_INTERVAL
         yield 'DEBUG', self.DEBUG
         yield 'API_KEY', self.API_KEY
         yield 'ALERT_CONFIG', self.ALERT_CONFIG
@@ -39,10 +142,43 @@ class BaseConfig(object):
         Configuration:
         
         MAX_INACTIVITY: {max_inactivity}
+        JOBS: {jobs}
+        PREFETCH_PAGES: {prefetch_pages}
+        PLAN_ONLY: {plan_only}
+        CACHE_PATH: {cache_path}
+        CACHE_TTL: {cache_ttl}
+        SNAPSHOT_PATH: {snapshot_path}
+        REQUESTS_PER_MINUTE: {requests_per_minute}
+        MAX_RETRIES: {max_retries}
+        CONNECT_TIMEOUT: {connect_timeout}
+        READ_TIMEOUT: {read_timeout}
+        HTTP2: {http2}
+        ENGINE: {engine}
+        MODEL_CACHE_TTL: {model_cache_ttl}
+        API_BASE_URL: {api_base_url}
+        ACCOUNT_JOBS: {account_jobs}
+        ACCOUNT_POOL: {account_pool}
+        RECORD_PATH: {record_path}
+        REPLAY_PATH: {replay_path}
+        REPLAY_LATENCY: {replay_latency}
+        ALERT_CONFIG_PATH: {alert_config_path}
+        ALERT_CONFIG_POLL_INTERVAL: {alert_config_poll_interval}
         DEBUG: {debug}
         ALERT_CONFIG: {alert_config}
         API_KEY: <redacted>
-        """.format(max_inactivity=self.MAX_INACTIVITY, debug=self.DEBUG, alert_config=self.ALERT_CONFIG)
+        """.format(max_inactivity=self.MAX_INACTIVITY, jobs=self.JOBS,
+                   prefetch_pages=self.PREFETCH_PAGES, plan_only=self.PLAN_ONLY,
+                   cache_path=self.CACHE_PATH, cache_ttl=self.CACHE_TTL,
+                   snapshot_path=self.SNAPSHOT_PATH,
+                   requests_per_minute=self.REQUESTS_PER_MINUTE, max_retries=self.MAX_RETRIES,
+                   connect_timeout=self.CONNECT_TIMEOUT, read_timeout=self.READ_TIMEOUT, http2=self.HTTP2,
+                   engine=self.ENGINE, model_cache_ttl=self.MODEL_CACHE_TTL,
+                   api_base_url=self.API_BASE_URL, account_jobs=self.ACCOUNT_JOBS,
+                   account_pool=self.ACCOUNT_POOL, record_path=self.RECORD_PATH,
+                   replay_path=self.REPLAY_PATH, replay_latency=self.REPLAY_LATENCY,
+                   alert_config_path=self.ALERT_CONFIG_PATH,
+                   alert_config_poll_interval=self.ALERT_CONFIG_POLL_INTERVAL, debug=self.DEBUG,
+                   alert_config=redacted(self.ALERT_CONFIG))
 
         return conf_string
 
@@ -55,8 +191,35 @@ class AppConfig(BaseConfig):
         else:
             self.API_KEY = os.getenv("NEWRELIC_API_KEY")
 
-        self.ALERT_CONFIG = yaml.load(os.getenv("ALERT_CONFIG"))
-        self.MAX_INACTIVITY = os.environ.get('SERVER_MAX_INACTIVITY', 24)
+        # a configuration file can be reloaded while the app runs
+        self.ALERT_CONFIG_PATH = os.environ.get('ALERT_MANAGER_ALERT_CONFIG_PATH', None)
+        self.ALERT_CONFIG_POLL_INTERVAL = float(os.environ.get('ALERT_MANAGER_ALERT_CONFIG_POLL_INTERVAL', 10))
+        if self.ALERT_CONFIG_PATH:
+            with open(self.ALERT_CONFIG_PATH) as alert_config_file:
+                self.ALERT_CONFIG = load_alert_config(alert_config_file)
+        else:
+            self.ALERT_CONFIG = load_alert_config(os.getenv("ALERT_CONFIG"))
+        self.MAX_INACTIVITY = int(os.environ.get('SERVER_MAX_INACTIVITY', 24))
+        self.JOBS = int(os.environ.get('ALERT_MANAGER_JOBS', 1))
+        self.PREFETCH_PAGES = int(os.environ.get('ALERT_MANAGER_PREFETCH_PAGES', 0))
+        self.PLAN_ONLY = env_flag('ALERT_MANAGER_PLAN_ONLY')
+        self.CACHE_PATH = os.environ.get('ALERT_MANAGER_CACHE_PATH', None)
+        self.CACHE_TTL = int(os.environ.get('ALERT_MANAGER_CACHE_TTL', 86400))
+        self.SNAPSHOT_PATH = os.environ.get('ALERT_MANAGER_SNAPSHOT_PATH', None)
+        if 'ALERT_MANAGER_REQUESTS_PER_MINUTE' in os.environ:
+            self.REQUESTS_PER_MINUTE = int(os.environ['ALERT_MANAGER_REQUESTS_PER_MINUTE'])
+        self.MAX_RETRIES = int(os.environ.get('ALERT_MANAGER_MAX_RETRIES', 5))
+        self.CONNECT_TIMEOUT = float(os.environ.get('ALERT_MANAGER_CONNECT_TIMEOUT', 10))
+        self.READ_TIMEOUT = float(os.environ.get('ALERT_MANAGER_READ_TIMEOUT', 60))
+        self.HTTP2 = env_flag('ALERT_MANAGER_HTTP2')
+        self.ENGINE = os.environ.get('ALERT_MANAGER_ENGINE', "threads")
+        self.MODEL_CACHE_TTL = int(os.environ.get('ALERT_MANAGER_MODEL_CACHE_TTL', 300))
+        self.API_BASE_URL = os.environ.get('ALERT_MANAGER_API_BASE_URL', None)
+        self.ACCOUNT_JOBS = int(os.environ.get('ALERT_MANAGER_ACCOUNT_JOBS', 4))
+        self.ACCOUNT_POOL = os.environ.get('ALERT_MANAGER_ACCOUNT_POOL', "threads")
+        self.RECORD_PATH = os.environ.get('ALERT_MANAGER_RECORD_PATH', None)
+        self.REPLAY_PATH = os.environ.get('ALERT_MANAGER_REPLAY_PATH', None)
+        self.REPLAY_LATENCY = float(os.environ.get('ALERT_MANAGER_REPLAY_LATENCY', 0.0))
         self.DEBUG = os.environ.get("ALERT_MANAGER_DEBUG_LOG", False)
 
         self.validate()
@@ -65,13 +228,26 @@ class AppConfig(BaseConfig):
 class CLIConfig(BaseConfig):
 
     ALERT_CONF_FILE="./alert_config.yml"
+    TARGET_SERVER = None
+    TRACE_PATH = None
+    PROFILE_PATH = None
+    DAEMON = False
+    INTERVAL = 300
+    MIN_INTERVAL = None
+    MAX_INTERVAL = None
+    JITTER = 0.1
 
     def load_cli_config(self):
         argv = sys.argv[1:]
 
-        usage_string = "newrelic_alerting -k <newrelic_key> [-c <conf_file_path>] [-i <max_server_inactivity_in_hours] [-d]"
+        usage_string = "newrelic_alerting -k <newrelic_key> [-c <conf_file_path>] [-i <max_server_inactivity_in_hours] [-j <jobs>] [--prefetch <pages>] [--plan-only] [--cache <cache_db_path>] [--cache-ttl <seconds>] [--snapshot <snapshot_path>] [--requests-per-minute <rpm>] [--max-retries <retries>] [--connect-timeout <seconds>] [--read-timeout <seconds>] [--http2] [--engine <threads|asyncio>] [--api-base-url <url>] [--trace <trace_json_path>] [--profile <profiles_dir>] [--account-jobs <accounts>] [--account-pool <threads|processes>] [--record <cassette_path>] [--replay <cassette_path>] [--replay-latency <factor>] [--daemon [--interval <seconds>] [--min-interval <seconds>] [--max-interval <seconds>] [--jitter <fraction>]] [-d] [sync-server <server_id_or_name>]"
         try:
-            opts, args = getopt.getopt(argv, "hk:c:i:", ["key="])
+            opts, args = getopt.getopt(argv, "hk:c:i:j:", ["key=", "jobs=", "prefetch=", "plan-only", "cache=", "cache-ttl=", "snapshot=",
+                                                           "requests-per-minute=", "max-retries=",
+                                                           "connect-timeout=", "read-timeout=", "http2", "engine=", "api-base-url=",
+                                                           "trace=", "profile=", "account-jobs=", "account-pool=",
+                                                           "record=", "replay=", "replay-latency=",
+                                                           "daemon", "interval=", "min-interval=", "max-interval=", "jitter="])
         except getopt.GetoptError:
             logger.error(usage_string)
             sys.exit(2)
@@ -83,16 +259,73 @@ class CLIConfig(BaseConfig):
                 self.API_KEY = arg
             elif opt in ("-i", "--max-server-inactivity"):
                 self.MAX_INACTIVITY = int(arg)
+            elif opt in ("-j", "--jobs"):
+                self.JOBS = int(arg)
+            elif opt == "--prefetch":
+                self.PREFETCH_PAGES = int(arg)
+            elif opt == "--plan-only":
+                self.PLAN_ONLY = True
+            elif opt == "--cache":
+                self.CACHE_PATH = arg
+            elif opt == "--cache-ttl":
+                self.CACHE_TTL = int(arg)
+            elif opt == "--snapshot":
+                self.SNAPSHOT_PATH = arg
+            elif opt == "--requests-per-minute":
+                self.REQUESTS_PER_MINUTE = int(arg)
+            elif opt == "--max-retries":
+                self.MAX_RETRIES = int(arg)
+            elif opt == "--connect-timeout":
+                self.CONNECT_TIMEOUT = float(arg)
+            elif opt == "--read-timeout":
+                self.READ_TIMEOUT = float(arg)
+            elif opt == "--http2":
+                self.HTTP2 = True
+            elif opt == "--engine":
+                self.ENGINE = arg
+            elif opt == "--api-base-url":
+                self.API_BASE_URL = arg
+            elif opt == "--trace":
+                self.TRACE_PATH = arg
+            elif opt == "--profile":
+                self.PROFILE_PATH = arg
+            elif opt == "--account-jobs":
+                self.ACCOUNT_JOBS = int(arg)
+            elif opt == "--account-pool":
+                self.ACCOUNT_POOL = arg
+            elif opt == "--record":
+                self.RECORD_PATH = arg
+            elif opt == "--replay":
+                self.REPLAY_PATH = arg
+            elif opt == "--replay-latency":
+                self.REPLAY_LATENCY = float(arg)
+            elif opt == "--daemon":
+                self.DAEMON = True
+            elif opt == "--interval":
+                self.INTERVAL = float(arg)
+            elif opt == "--min-interval":
+                self.MIN_INTERVAL = float(arg)
+            elif opt == "--max-interval":
+                self.MAX_INTERVAL = float(arg)
+            elif opt == "--jitter":
+                self.JITTER = float(arg)
             elif opt in ("-c", "--configuration-path"):
                 self.ALERT_CONF_FILE = arg
             elif opt in ("-d", "--debug"):
                 self.DEBUG = True
 
+        if args:
+            if args[0] != "sync-server" or len(args) != 2:
+                logger.error(usage_string)
+                sys.exit(2)
+            self.TARGET_SERVER = args[1]
+
         with opened_w_error(self.ALERT_CONF_FILE) as (alert_config_file, err):
             if err:
                 logger.error("The alerts configuration file was not found under the {} path".format(self.ALERT_CONF_FILE))
             else:
-                self.ALERT_CONFIG = yaml.load(alert_config_file)
+                self.ALERT_CONFIG = load_alert_config(alert_config_file)
+                self.ALERT_CONFIG_PATH = self.ALERT_CONF_FILE
 
         self.validate()
 
@@ -0,0 +1,107 @@
+"""
+Reloading of the alert configuration while the app runs, either from a
+watched file or on demand. In single account mode the cached policies model
+is updated incrementally: only the added and changed policies are initialised
+again, the others keep their conditions
+"""
+import hashlib
+import os
+import threading
+
+from . import helper
+from .accounts import is_multi_account
+from .config import load_alert_config, validate_alert_config
+from .exceptions import InvalidConfiguration
+
+logger = helper.getLogger(__name__)
+
+
+def reload_alert_config(config, model_cache, alert_config):
+    """
+    switch a running app to a new alert configuration
+    :param config: the app configuration, updated in place
+    :param model_cache: the ModelCache of the app, if any
+    :param alert_config: the parsed alert configuration
+    :return: the PolicyDiff, None when there is no policies model to update
+    :raise InvalidConfiguration: when the new configuration is invalid, the
+                                 current one is then kept
+    """
+    validate_alert_config(alert_config)
+    multi_account = is_multi_account({"ALERT_CONFIG": alert_config})
+    if multi_account != is_multi_account(config):
+        raise InvalidConfiguration("Switching between single and multiple accounts requires a restart")
+
+    if model_cache is None:
+        config["ALERT_CONFIG"] = alert_config
+        logger.info("Alert configuration reloaded")
+        return None
+
+    # a running synchronisation completes with the policies it started with
+    with model_cache.lock:
+        diff = None if multi_account else model_cache.reconfigure(alert_config["alert_policies"])
+        config["ALERT_CONFIG"] = alert_config
+    logger.info("Alert configuration reloaded")
+    return diff
+
+
+class ConfigWatcher(object):
+    """
+    Polls an alert configuration file every `interval` seconds and calls
+    `on_change` with the parsed configuration whenever its content changes.
+    A configuration which cannot be parsed or applied is logged and skipped
+    """
+
+    def __init__(self, path, on_change, interval=10):
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self.signature = self.stat()
+        self.digest = self.read()[0] if self.signature else None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def read(self):
+        with open(self.path, "rb") as alert_config_file:
+            content = alert_config_file.read()
+        return hashlib.sha256(content).hexdigest(), content
+
+    def check(self):
+        """
+        :return: True when a changed configuration was applied
+        """
+        signature = self.stat()
+        if signature is None or signature == self.signature:
+            return False
+        self.signature = signature
+        try:
+            digest, content = self.read()
+            if digest == self.digest:
+                return False
+            self.on_change(load_alert_config(content))
+        except Exception as e:
+            logger.error("Failed reloading the alert configuration from {}: {}".format(self.path, str(e)))
+            return False
+        self.digest = digest
+        return True
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.check()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="alert-config-watcher", daemon=True)
+        self.thread.start()
+        logger.info("Watching {} for alert configuration changes every {}s".format(self.path, self.interval))
+        return self.thread
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
@@ -0,0 +1,143 @@
+"""
+Daemon mode of the CLI: synchronisations are repeated in the same process,
+which keeps the policies model and the pooled session warm between the
+cycles. The pause between two cycles adapts to the changes observed and is
+jittered, so that daemons started together, ie. one per account, spread
+their load on the API
+"""
+import os
+import random
+import signal
+import threading
+import time
+import traceback
+
+from contextlib import contextmanager
+
+from . import helper
+from .accounts import AccountsReport, account_path
+from .exceptions import InvalidConfiguration
+
+logger = helper.getLogger(__name__)
+
+
+class IntervalSchedule(object):
+    """
+    The pause between two cycles: it starts at `interval`, halves after a
+    cycle which changed anything, down to `min_interval`, and grows by half
+    after a quiet one, up to `max_interval`. Every pause is jittered by up to
+    `jitter` times its length
+    """
+
+    def __init__(self, interval, min_interval=None, max_interval=None, jitter=0.1, uniform=random.uniform):
+        if interval <= 0:
+            raise InvalidConfiguration("The daemon interval must be positive")
+        self.interval = interval
+        self.min_interval = min_interval if min_interval is not None else interval / 4.0
+        self.max_interval = max_interval if max_interval is not None else interval * 4.0
+        if not 0 < self.min_interval <= interval <= self.max_interval:
+            raise InvalidConfiguration("The daemon intervals must satisfy 0 < min_interval <= interval <= max_interval")
+        self.jitter = jitter
+        self.uniform = uniform
+        self.current = interval
+
+    def first_delay(self):
+        """
+        :return: a random delay before the first cycle, spreading the daemons started at the same time
+        """
+        return self.uniform(0, self.current * self.jitter)
+
+    def observe(self, changes):
+        """
+        :param changes: the number of changes of the last cycle, None when it failed
+        """
+        if changes is None:
+            return
+        if changes:
+            self.current = max(self.min_interval, self.current / 2.0)
+        else:
+            self.current = min(self.max_interval, self.current * 1.5)
+
+    def next_delay(self):
+        return self.current * (1 + self.uniform(-self.jitter, self.jitter))
+
+
+def observed_changes(result):
+    """
+    :param result: the MutationReport, ReconciliationPlan or AccountsReport of a cycle
+    :return: the number of condition changes planned or applied
+    """
+    if isinstance(result, AccountsReport):
+        return sum(account.result.get("total", account.result.get("operations", 0))
+                   for account in result.results if account.result)
+    return len(result)
+
+
+def cycle_paths(trace_path, profile_path, cycle):
+    """
+    :return: the trace file and the profiles directory of a cycle, ie.
+             `trace.0003.json` and `profiles/0003` for the third one
+    """
+    name = "{:04d}".format(cycle)
+    return (account_path(trace_path, name) if trace_path else None,
+            os.path.join(profile_path, name) if profile_path else None)
+
+
+class Daemon(object):
+    """
+    Runs `cycle` on an IntervalSchedule until `stop` is called or the process
+    receives SIGTERM or SIGINT, letting the running cycle complete
+    """
+
+    def __init__(self, cycle, schedule, clock=time.monotonic):
+        """
+        :param cycle: a callable running one synchronisation and returning its number of changes
+        """
+        self.cycle = cycle
+        self.schedule = schedule
+        self.clock = clock
+        self.stopping = threading.Event()
+        self.cycles = 0
+
+    def stop(self, signum=None, frame=None):
+        if not self.stopping.is_set():
+            logger.info("Stopping the daemon{}".format(
+                " on signal {}".format(signal.Signals(signum).name) if signum else ""))
+        self.stopping.set()
+
+    @contextmanager
+    def signals(self):
+        # handlers can only be installed from the main thread
+        if threading.current_thread() is not threading.main_thread():
+            yield
+            return
+        previous = {signum: signal.signal(signum, self.stop) for signum in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            yield
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+
+    def run_cycle(self):
+        self.cycles += 1
+        started_at = self.clock()
+        try:
+            changes = self.cycle()
+        except Exception as e:
+            logger.error("Daemon cycle {} failed: {}".format(self.cycles, str(e)))
+            logger.error(traceback.format_exc())
+            changes = None
+        self.schedule.observe(changes)
+        return changes, self.clock() - started_at
+
+    def run(self):
+        with self.signals():
+            delay = self.schedule.first_delay()
+            while not self.stopping.wait(delay):
+                changes, duration = self.run_cycle()
+                # the interval runs from the start of a cycle to the start of the next one
+                delay = max(0.0, self.schedule.next_delay() - duration)
+                outcome = "failed" if changes is None else "{} changes".format(changes)
+                logger.info("Daemon cycle {}: {} in {:.1f}s, next cycle in {:.1f}s".format(
+                    self.cycles, outcome, duration, delay))
+        logger.info("Daemon stopped after {} cycles".format(self.cycles))
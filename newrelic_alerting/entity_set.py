@@ -0,0 +1,94 @@
+from array import array
+from bisect import bisect_left
+from itertools import filterfalse
+
+
+def entity_id(value):
+    """
+    newrelic returns the condition entities as strings and the server ids as
+    integers, every id is normalised to an integer
+    """
+    return value if type(value) is int else int(value)
+
+
+def keep_ids(servers):
+    """
+    :return: the ids of the given servers as a set to test the entities against
+    """
+    return frozenset(entity_id(server["id"]) for server in servers)
+
+
+class EntitySet(object):
+    """
+    Compact set of integer entity ids backed by a sorted array of 64 bit
+    integers. Lookups accept integers as well as their string form
+    """
+    __slots__ = ("ids",)
+
+    def __init__(self, ids=()):
+        self.ids = array("q", sorted(set(map(entity_id, ids))))
+
+    @classmethod
+    def _sorted(cls, ids):
+        entity_set = cls.__new__(cls)
+        entity_set.ids = ids
+        return entity_set
+
+    def __contains__(self, value):
+        try:
+            value = entity_id(value)
+        except (TypeError, ValueError):
+            return False
+        ids = self.ids
+        index = bisect_left(ids, value)
+        return index < len(ids) and ids[index] == value
+
+    def add(self, value):
+        value = entity_id(value)
+        ids = self.ids
+        index = bisect_left(ids, value)
+        if index == len(ids) or ids[index] != value:
+            ids.insert(index, value)
+
+    def discard(self, value):
+        value = entity_id(value)
+        ids = self.ids
+        index = bisect_left(ids, value)
+        if index < len(ids) and ids[index] == value:
+            del ids[index]
+
+    def difference(self, keep):
+        """
+        :param keep: a set of integer ids, ie. built once with `keep_ids`
+        :return: the EntitySet of the ids not in `keep`
+        """
+        return self._sorted(array("q", filterfalse(keep.__contains__, self.ids)))
+
+    def __sub__(self, other):
+        if not isinstance(other, (set, frozenset)) or not all(type(value) is int for value in other):
+            other = frozenset(map(entity_id, other))
+        return self.difference(other)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __bool__(self):
+        return len(self.ids) > 0
+
+    def __eq__(self, other):
+        if isinstance(other, EntitySet):
+            return self.ids == other.ids
+        try:
+            return self.ids == array("q", sorted(set(map(entity_id, other))))
+        except (TypeError, ValueError):
+            return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "EntitySet({})".format(list(self.ids))
+
+    __str__ = __repr__
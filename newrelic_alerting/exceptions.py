@@ -8,3 +8,27 @@ class NewRelicAlertingMissingConfVariable(Exception):
 
     def __init__(self, message):
         super(Exception, self).__init__(message)
+
+
+class PolicyNotFound(Exception):
+
+    def __init__(self, message):
+        super(Exception, self).__init__(message)
+
+
+class PaginationError(Exception):
+
+    def __init__(self, message):
+        super(Exception, self).__init__(message)
+
+
+class ServerNotFound(Exception):
+
+    def __init__(self, message):
+        super(Exception, self).__init__(message)
+
+
+class InvalidConfiguration(Exception):
+
+    def __init__(self, message):
+        super(Exception, self).__init__(message)
@@ -0,0 +1,163 @@
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from . import helper
+from . import metrics
+
+logger = helper.getLogger(__name__)
+
+
+class Mutation(object):
+    """
+    A single entity/condition change: either adding a server to a
+    condition or removing it from it
+    """
+    ADD = "add"
+    REMOVE = "remove"
+
+    def __init__(self, action, condition, server_id, server_name=None):
+        self.action = action
+        self.condition = condition
+        self.server_id = server_id
+        self.server_name = server_name if server_name is not None else str(server_id)
+
+    @classmethod
+    def add(cls, condition, server):
+        return cls(cls.ADD, condition, server["id"], server["name"])
+
+    @classmethod
+    def remove(cls, condition, server_id):
+        return cls(cls.REMOVE, condition, server_id)
+
+    def execute(self, pdm):
+        if self.action == self.ADD:
+            server = {"id": self.server_id, "name": self.server_name}
+            return pdm.register_server(server, self.condition.id)
+        return pdm.deregister_server(self.server_id, self.condition.id)
+
+    def apply(self):
+        """
+        Reflect a successfully executed mutation on the in-memory condition
+        """
+        if self.action == self.ADD:
+            self.condition.entities.add(self.server_id)
+        else:
+            self.condition.entities.discard(self.server_id)
+
+    def __str__(self):
+        return "{ action: " + self.action + " }," \
+               "{ server: " + self.server_name + " }," \
+               "{ condition: " + str(self.condition.id) + " }"
+
+
+class MutationResult(object):
+    def __init__(self, mutation, ok, error=None):
+        self.mutation = mutation
+        self.ok = ok
+        self.error = error
+
+    def to_dict(self):
+        return {
+            "action": self.mutation.action,
+            "server_id": self.mutation.server_id,
+            "server_name": self.mutation.server_name,
+            "condition_id": self.mutation.condition.id,
+            "ok": self.ok,
+            "error": self.error
+        }
+
+
+class MutationReport(object):
+    """
+    The results of the mutations of a synchronisation and, once the stale
+    servers were cleaned up, the CleanupReport of their deletions. A report
+    is falsy when any mutation or deletion failed
+    """
+
+    def __init__(self, results=None, cleanup=None):
+        self.results = results or []
+        self.cleanup = cleanup
+
+    @property
+    def succeeded(self):
+        return [result for result in self.results if result.ok]
+
+    @property
+    def failed(self):
+        return [result for result in self.results if not result.ok]
+
+    def __len__(self):
+        return len(self.results)
+
+    def __bool__(self):
+        return not self.failed and (self.cleanup is None or bool(self.cleanup))
+
+    def log_failures(self):
+        for result in self.failed:
+            logger.error("Failed to {} server {} on condition {}: {}".format(
+                result.mutation.action, result.mutation.server_name, result.mutation.condition.id, result.error))
+        if self.cleanup is not None:
+            for result in self.cleanup.failed:
+                logger.error("Failed to delete the stale server {}: {}".format(result.server["name"], result.error))
+        logger.info("{} mutations succeeded, {} failed{}".format(
+            len(self.succeeded), len(self.failed),
+            "" if self.cleanup is None else ", {} stale servers deleted, {} failed".format(
+                len(self.cleanup.deleted), len(self.cleanup.failed))))
+
+    def to_dict(self):
+        return {
+            "total": len(self.results),
+            "succeeded": len(self.succeeded),
+            "failed": len(self.failed),
+            "results": [result.to_dict() for result in self.results],
+            "cleanup": self.cleanup.to_dict() if self.cleanup is not None else None
+        }
+
+
+class MutationExecutor(object):
+    """
+    Sends condition mutations to the API using a bounded pool of `jobs`
+    workers sharing the same session. The in-memory condition entities are
+    only updated from the calling thread, once each request has completed,
+    and one mutation at a time across the synchronisations sharing the model
+    """
+
+    def __init__(self, pdm, jobs=1):
+        self.pdm = pdm
+        self.jobs = max(1, int(jobs))
+        self.lock = threading.Lock()
+
+    def _execute(self, mutation):
+        try:
+            ok = mutation.execute(self.pdm)
+        except Exception as e:
+            logger.error("Mutation failed {}: {}".format(str(mutation), str(e)))
+            return MutationResult(mutation, False, str(e))
+        if not ok:
+            return MutationResult(mutation, False, "unexpected API response")
+        return MutationResult(mutation, True)
+
+    def _collect(self, result):
+        if result.ok:
+            with self.lock:
+                result.mutation.apply()
+        metrics.observe_mutation(result)
+        return result
+
+    def execute(self, mutations):
+        mutations = list(mutations)
+        report = MutationReport()
+        if not mutations:
+            return report
+
+        if self.jobs == 1:
+            for mutation in mutations:
+                report.results.append(self._collect(self._execute(mutation)))
+            return report
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            futures = [pool.submit(self._execute, mutation) for mutation in mutations]
+            for future in as_completed(futures):
+                report.results.append(self._collect(future.result()))
+        return report
@@ -0,0 +1,50 @@
+from . import helper
+from .label_selector import LabelBitsets
+
+logger = helper.getLogger(__name__)
+
+
+class ServerInventory(object):
+    """
+    In-memory snapshot of the account servers together with an inverted
+    index mapping every label key (ie. `Deployment:live-web`) to the ids
+    of the servers carrying it
+    """
+
+    def __init__(self, servers, labels):
+        self.servers = {}
+        for server in servers:
+            self.servers[server["id"]] = server
+
+        self.label_index = {}
+        for label in labels:
+            server_ids = label.get("links", {}).get("servers", [])
+            self.label_index[label["key"]] = set(
+                server_id for server_id in server_ids if server_id in self.servers)
+        self._bitsets = None
+
+    @property
+    def bitsets(self):
+        """
+        the LabelBitsets index of the servers, built on first use
+        """
+        if self._bitsets is None:
+            self._bitsets = LabelBitsets(self.servers, self.label_index)
+        return self._bitsets
+
+    def server_ids_for_selector(self, selector):
+        """
+        :param selector: a compiled label Selector, None matching no server
+        :return: the ids of the servers matching the selector
+        """
+        if selector is None:
+            return []
+        bitsets = self.bitsets
+        return bitsets.server_ids_for(selector.evaluate(bitsets))
+
+    def __len__(self):
+        return len(self.servers)
+
+    def __str__(self):
+        return ("{ servers: " + str(len(self.servers)) + " },"
+                "{ labels: " + str(len(self.label_index)) + " }")
@@ -0,0 +1,109 @@
+import threading
+import time
+import traceback
+import uuid
+
+from collections import OrderedDict
+
+from . import helper
+
+logger = helper.getLogger(__name__)
+
+
+class Job(object):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = self.QUEUED
+        self.triggers = 1
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+
+    def run(self, target):
+        self.status = self.RUNNING
+        self.started_at = time.time()
+        try:
+            result = target()
+            self.result = result.to_dict() if hasattr(result, "to_dict") else result
+            # a report fails with any of its mutations or deletions, a plan never does
+            if hasattr(result, "failed") and not result:
+                self.error = "Some mutations or stale server deletions failed"
+                self.status = self.FAILED
+            else:
+                self.status = self.SUCCEEDED
+        except Exception as e:
+            logger.error(e)
+            logger.error(traceback.format_exc())
+            self.error = str(e)
+            self.status = self.FAILED
+        self.finished_at = time.time()
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "triggers": self.triggers,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error
+        }
+
+
+class JobQueue(object):
+    """
+    Runs `target` on a background worker thread, one job at a time.
+    Submissions are coalesced: while a job is waiting to start every new
+    trigger is merged into it, so at most one job runs and one waits
+    """
+
+    def __init__(self, target, max_history=100):
+        self.target = target
+        self.max_history = max_history
+        self.jobs = OrderedDict()
+        self.pending = None
+        self.running = None
+        self.worker = None
+        self.lock = threading.Lock()
+
+    def submit(self):
+        with self.lock:
+            if self.pending is not None:
+                self.pending.triggers += 1
+                return self.pending
+
+            job = Job()
+            self.pending = job
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.max_history:
+                self.jobs.popitem(last=False)
+
+            if self.worker is None:
+                self.worker = threading.Thread(target=self._work, name="sync-jobs", daemon=True)
+                self.worker.start()
+            return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def _work(self):
+        while True:
+            with self.lock:
+                job = self.pending
+                self.pending = None
+                self.running = job
+                if job is None:
+                    self.worker = None
+                    return
+            job.run(self.target)
+            with self.lock:
+                self.running = None
@@ -0,0 +1,268 @@
+"""
+Label selectors: boolean expressions over the `Category:name` server labels,
+ie. `Deployment:live-web AND (Role:web OR Role:api) AND NOT Team:legacy`.
+
+Terms are label keys, quoted when they contain spaces or parentheses
+(`"Team:Platform Engineering"`), or `Category:*` matching any label of a
+category. `NOT` binds tighter than `AND`, which binds tighter than `OR`.
+
+Selectors are compiled once and evaluated either over the label bitsets of a
+LabelBitsets index, matching the whole fleet with a few big integer
+operations, or against the labels of a single server
+"""
+import re
+
+from .exceptions import InvalidConfiguration
+
+TOKEN = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"|([^\s()"]+))')
+OPERATORS = {"AND", "OR", "NOT"}
+
+# the positions of the bits set in every byte value
+BYTE_BITS = tuple(tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256))
+
+
+class LabelBitsets(object):
+    """
+    Bitset index over a fleet of servers: each server gets a bit position
+    and every label key and category the integer with the bits of the
+    servers carrying it
+    """
+
+    def __init__(self, server_ids, label_index):
+        """
+        :param server_ids: the ids of all the servers
+        :param label_index: a dictionary mapping label keys to sets of server ids
+        """
+        self.server_ids = list(server_ids)
+        positions = {server_id: position for position, server_id in enumerate(self.server_ids)}
+        self.size = (len(self.server_ids) + 7) // 8
+        self.all = (1 << len(self.server_ids)) - 1
+
+        self.labels = {}
+        categories = {}
+        for key, server_ids in label_index.items():
+            bits = self.bitset(positions[server_id] for server_id in server_ids if server_id in positions)
+            self.labels[key] = bits
+            category = key.split(":", 1)[0]
+            categories[category] = categories.get(category, 0) | bits
+        self.categories = categories
+
+    def bitset(self, positions):
+        data = bytearray(self.size)
+        for position in positions:
+            data[position >> 3] |= 1 << (position & 7)
+        return int.from_bytes(data, "little")
+
+    def label(self, key):
+        return self.labels.get(key, 0)
+
+    def category(self, category):
+        return self.categories.get(category, 0)
+
+    def server_ids_for(self, bits):
+        """
+        :return: the ids of the servers whose bits are set
+        """
+        server_ids = self.server_ids
+        matching = []
+        for index, value in enumerate(bits.to_bytes(self.size, "little")):
+            if value:
+                offset = index << 3
+                matching.extend(server_ids[offset + bit] for bit in BYTE_BITS[value])
+        return matching
+
+
+class Selector(object):
+    """
+    A compiled label selector
+    """
+
+    def __init__(self, expression, tree):
+        self.expression = expression
+        self.tree = tree
+        self._bitsets, self._labels = compile_tree(tree)
+
+    def evaluate(self, bitsets):
+        """
+        :param bitsets: a LabelBitsets index
+        :return: the bitset of the matching servers
+        """
+        return self._bitsets(bitsets)
+
+    def matches(self, label_keys):
+        """
+        :param label_keys: the label keys of a single server
+        """
+        return self._labels(frozenset(label_keys))
+
+    def __str__(self):
+        return self.expression
+
+    def __repr__(self):
+        return "Selector({!r})".format(self.expression)
+
+
+def tokenize(expression):
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = TOKEN.match(expression, position)
+        if match is None:
+            raise InvalidConfiguration("Invalid label selector {!r} at position {}".format(expression, position))
+        opening, closing, quoted, word = match.groups()
+        if opening or closing:
+            tokens.append((opening or closing, None))
+        elif quoted is not None:
+            tokens.append(("TERM", quoted))
+        elif word.upper() in OPERATORS:
+            tokens.append((word.upper(), None))
+        else:
+            tokens.append(("TERM", word))
+        position = match.end()
+    return tokens
+
+
+class Parser(object):
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.tokens = tokenize(expression)
+        self.position = 0
+
+    def error(self, message):
+        return InvalidConfiguration("Invalid label selector {!r}: {}".format(self.expression, message))
+
+    def peek(self):
+        return self.tokens[self.position][0] if self.position < len(self.tokens) else None
+
+    def take(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise self.error("empty expression")
+        tree = self.parse_or()
+        if self.peek() is not None:
+            raise self.error("unexpected {}".format(self.tokens[self.position][1] or self.peek()))
+        return tree
+
+    def parse_or(self):
+        operands = [self.parse_and()]
+        while self.peek() == "OR":
+            self.take()
+            operands.append(self.parse_and())
+        return operands[0] if len(operands) == 1 else ("or",) + tuple(operands)
+
+    def parse_and(self):
+        operands = [self.parse_not()]
+        while self.peek() == "AND":
+            self.take()
+            operands.append(self.parse_not())
+        return operands[0] if len(operands) == 1 else ("and",) + tuple(operands)
+
+    def parse_not(self):
+        if self.peek() == "NOT":
+            self.take()
+            return ("not", self.parse_not())
+        return self.parse_term()
+
+    def parse_term(self):
+        kind = self.peek()
+        if kind == "(":
+            self.take()
+            tree = self.parse_or()
+            if self.peek() != ")":
+                raise self.error("missing closing parenthesis")
+            self.take()
+            return tree
+        if kind != "TERM":
+            raise self.error("expected a label, got {}".format(kind or "the end of the expression"))
+        term = self.take()[1]
+        category, separator, name = term.partition(":")
+        if not separator or not category or not name:
+            raise self.error("{!r} is not a Category:name label".format(term))
+        if name == "*":
+            return ("category", category)
+        return ("label", term)
+
+
+def compile_tree(tree):
+    """
+    :return: a tuple of functions evaluating the tree over a LabelBitsets
+             index and over the label keys of a single server
+    """
+    kind = tree[0]
+    if kind == "label":
+        key = tree[1]
+        return (lambda bitsets: bitsets.label(key)), (lambda labels: key in labels)
+    if kind == "category":
+        prefix = tree[1] + ":"
+        category = tree[1]
+        return ((lambda bitsets: bitsets.category(category)),
+                (lambda labels: any(label.startswith(prefix) for label in labels)))
+    if kind == "not":
+        bitsets_operand, labels_operand = compile_tree(tree[1])
+        return ((lambda bitsets: bitsets.all & ~bitsets_operand(bitsets)),
+                (lambda labels: not labels_operand(labels)))
+
+    operands = [compile_tree(operand) for operand in tree[1:]]
+    bitsets_operands = [operand[0] for operand in operands]
+    labels_operands = [operand[1] for operand in operands]
+    if kind == "and":
+        def and_bitsets(bitsets):
+            bits = bitsets.all
+            for operand in bitsets_operands:
+                bits &= operand(bitsets)
+                if not bits:
+                    break
+            return bits
+        return and_bitsets, (lambda labels: all(operand(labels) for operand in labels_operands))
+
+    def or_bitsets(bitsets):
+        bits = 0
+        for operand in bitsets_operands:
+            bits |= operand(bitsets)
+        return bits
+    return or_bitsets, (lambda labels: any(operand(labels) for operand in labels_operands))
+
+
+def compile_selector(expression):
+    """
+    :return: the compiled Selector
+    :raise InvalidConfiguration: when the expression is not a valid selector
+    """
+    return Selector(expression, Parser(expression).parse())
+
+
+def quote(label_key):
+    """
+    :raise InvalidConfiguration: when the label key contains a double quote,
+                                 which a selector term cannot express
+    """
+    if '"' in label_key:
+        raise InvalidConfiguration("Label keys with double quotes cannot be selected: {}".format(label_key))
+    if re.search(r'[\s()]', label_key):
+        return '"{}"'.format(label_key)
+    return label_key
+
+
+def policy_selector(tags=(), selector=None):
+    """
+    compile the selector of an alert policy configuration: its `tags` match
+    the servers labelled with any of the `Deployment:<tag>` labels, and are
+    combined with its `selector` expression, if any, by an OR
+    """
+    keys = ["Deployment:" + tag for tag in sorted(tags)]
+    terms = [quote(key) for key in keys]
+    trees = [("label", key) for key in keys]
+    if selector:
+        # the selector is parsed on its own so that it cannot escape the OR
+        trees.append(Parser(selector).parse())
+        terms.append("(" + selector + ")" if keys else selector)
+    if not trees:
+        return None
+    tree = trees[0] if len(trees) == 1 else ("or",) + tuple(trees)
+    return Selector(" OR ".join(terms), tree)
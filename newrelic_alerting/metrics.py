@@ -0,0 +1,240 @@
+"""
+Minimal, dependency free metrics registry rendered in the Prometheus text
+exposition format. The metrics are process-wide and updated by the request
+schedulers, the pagination helpers, the mutation executors and the
+synchronisation entry points
+"""
+import functools
+import re
+import threading
+import time
+
+from bisect import bisect_left
+from urllib.parse import urlparse
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PAGES_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+SYNC_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+ID_SEGMENT = re.compile(r"/\d+(?=\.json$|/)")
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(name, escape(value)) for name, value in pairs) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric(object):
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = ["# HELP {} {}".format(self.name, self.documentation),
+                 "# TYPE {} {}".format(self.name, self.type)]
+        with self.lock:
+            for suffix, labelvalues, extra, value in self.samples():
+                lines.append("{}{}{} {}".format(self.name, suffix, format_labels(self.labelnames, labelvalues, extra),
+                                                format_value(value)))
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labelvalues, amount=1):
+        with self.lock:
+            self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def get(self, *labelvalues):
+        return self.values.get(labelvalues, 0)
+
+    def samples(self):
+        return [("", labelvalues, None, value) for labelvalues, value in sorted(self.values.items())]
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, *labelvalues, value):
+        with self.lock:
+            self.values[labelvalues] = value
+
+    def get(self, *labelvalues):
+        return self.values.get(labelvalues)
+
+    def samples(self):
+        return [("", labelvalues, None, value) for labelvalues, value in sorted(self.values.items())]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *labelvalues, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(labelvalues)
+            if series is None:
+                # one counter per bucket plus +Inf, then the sum
+                series = self.values[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *labelvalues):
+        series = self.values.get(labelvalues)
+        return sum(series[:-1]) if series else 0
+
+    def samples(self):
+        samples = []
+        for labelvalues, series in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                samples.append(("_bucket", labelvalues, ("le", format_value(bound)), cumulative))
+            samples.append(("_sum", labelvalues, None, series[-1]))
+            samples.append(("_count", labelvalues, None, cumulative))
+        return samples
+
+
+class Registry(object):
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+API_REQUEST_DURATION = REGISTRY.histogram(
+    "newrelic_alerting_api_request_duration_seconds",
+    "Duration of the newrelic API requests, each retry counting as a request",
+    ("method", "endpoint"))
+API_RESPONSES = REGISTRY.counter(
+    "newrelic_alerting_api_responses_total",
+    "newrelic API responses by status code, `error` when no response was received",
+    ("method", "endpoint", "status"))
+SWEEP_PAGES = REGISTRY.histogram(
+    "newrelic_alerting_pagination_sweep_pages",
+    "Pages fetched by each sweep of a paginated endpoint",
+    ("endpoint",), buckets=PAGES_BUCKETS)
+MUTATIONS = REGISTRY.counter(
+    "newrelic_alerting_mutations_total",
+    "Condition entity mutations sent to newrelic",
+    ("policy", "condition", "action", "result"))
+SYNC_DURATION = REGISTRY.histogram(
+    "newrelic_alerting_sync_duration_seconds",
+    "Duration of the synchronisations",
+    ("scope",), buckets=SYNC_BUCKETS)
+SYNCS = REGISTRY.counter(
+    "newrelic_alerting_syncs_total",
+    "Synchronisations by outcome",
+    ("scope", "outcome"))
+SYNC_LAST_SUCCESS = REGISTRY.gauge(
+    "newrelic_alerting_sync_last_success_timestamp_seconds",
+    "Unix time of the last synchronisation completed without failures",
+    ("scope",))
+
+
+def endpoint_name(url):
+    """
+    :return: the API endpoint of a url with the entity ids replaced, ie. `alerts_entity_conditions/{id}`
+    """
+    path = urlparse(url).path
+    if path.startswith("/v2/"):
+        path = path[4:]
+    path = ID_SEGMENT.sub("/{id}", path)
+    return path[:-5] if path.endswith(".json") else path
+
+
+def observe_request(method, url, response, duration):
+    """
+    record an API call
+    :param response: the response received or None if the request failed
+    """
+    endpoint = endpoint_name(url) if url else "unknown"
+    status = str(response.status_code) if response is not None else "error"
+    API_REQUEST_DURATION.observe(method, endpoint, value=duration)
+    API_RESPONSES.inc(method, endpoint, status)
+
+
+def observe_sweep(url, pages):
+    SWEEP_PAGES.observe(endpoint_name(url), value=pages)
+
+
+def observe_mutation(result):
+    mutation = result.mutation
+    condition = mutation.condition
+    MUTATIONS.inc(getattr(condition, "policy_name", None) or "", str(condition.id), mutation.action,
+                  "ok" if result.ok else "failed")
+
+
+def observe_sync(scope, started_at, failed):
+    SYNC_DURATION.observe(scope, value=time.monotonic() - started_at)
+    SYNCS.inc(scope, "failed" if failed else "succeeded")
+    if not failed:
+        SYNC_LAST_SUCCESS.set(scope, value=time.time())
+
+
+def timed_sync(scope):
+    """
+    decorator recording the duration and the outcome of a synchronisation,
+    which fails when it raises or returns a report with failed mutations
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            started_at = time.monotonic()
+            failed = True
+            try:
+                result = f(*args, **kwargs)
+                failed = bool(getattr(result, "failed", None))
+                return result
+            finally:
+                observe_sync(scope, started_at, failed)
+        return wrapper
+    return decorator
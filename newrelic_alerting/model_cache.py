@@ -0,0 +1,88 @@
+import threading
+import time
+
+from contextlib import contextmanager
+
+from . import helper
+
+logger = helper.getLogger(__name__)
+
+
+class ModelCache(object):
+    """
+    Process-wide cache of the initialised policies and conditions model,
+    built around a long-lived pooled session. The model is re-initialised
+    once older than `ttl` seconds or after an explicit invalidation.
+
+    The lock is only held to refresh or reconfigure the model, not for the
+    whole synchronisation: a single server synchronisation or a reload does
+    not wait for a full synchronisation to complete. The full
+    synchronisations are serialised by their job queue, and the updates of
+    the condition entities by the MutationExecutor
+    """
+
+    def __init__(self, build, ttl=300, clock=time.monotonic):
+        """
+        :param build: a callable returning a tuple (alert_manager, servers_manager)
+        :param ttl: the maximum age in seconds of the model
+        """
+        self.build = build
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = threading.RLock()
+        self.managers = None
+        self.loaded_at = None
+
+    @property
+    def expired(self):
+        return self.loaded_at is None or self.clock() - self.loaded_at > self.ttl
+
+    def invalidate(self):
+        with self.lock:
+            self.loaded_at = None
+        logger.info("Policies model invalidated")
+
+    def reconfigure(self, alert_policies):
+        """
+        switch the model to a new list of alert policy configurations,
+        initialising only the added and changed policies
+        :return: a PolicyDiff, or None when the model was not built yet
+        """
+        with self.lock:
+            if self.managers is None:
+                return None
+            alert_manager, _ = self.managers
+            return alert_manager.reconfigure(alert_policies)
+
+    def refresh(self):
+        with self.lock:
+            if self.managers is None:
+                self.managers = self.build()
+            alert_manager, _ = self.managers
+            alert_manager.initialise()
+            self.loaded_at = self.clock()
+            logger.info("Policies model loaded: {} policies".format(len(alert_manager.pm.alert_policies)))
+            return self.managers
+
+    @contextmanager
+    def model(self):
+        """
+        get the model for a synchronisation, refreshing it first when expired
+        :return: a tuple (alert_manager, servers_manager)
+        """
+        with self.lock:
+            if self.expired:
+                self.refresh()
+            managers = self.managers
+        yield managers
+
+    def warm(self):
+        def load():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error("Failed warming the policies model: {}".format(str(e)))
+
+        thread = threading.Thread(target=load, name="model-cache-warmup", daemon=True)
+        thread.start()
+        return thread
@@ -1,10 +1,19 @@
 import requests
 import json
+
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, urlunparse, parse_qs, urlencode
+
 from . import helper
-from .exceptions import UnexpectedStatusCode
+from . import metrics
+from .exceptions import UnexpectedStatusCode, PaginationError
 
 logger = helper.getLogger(__name__)
 
+API_BASE_URL = "https://api.newrelic.com/v2"
+
 def handle_response_status(response, expected_status):
     if response.status_code != expected_status:
         text = response.json()
@@ -32,37 +41,102 @@ class handle_response(object):
         from functools import partial
         return partial(self.__call__, instance)
 
-def pages(url, session, params=None):
+def get_page(session, url, params=None):
     try:
         response = session.get(url, params=params)
         handle_response_status(response, 200)
     except (requests.exceptions.RequestException, UnexpectedStatusCode) as re:
         logger.error("error while getting the paginated response {}".format(str(re)))
-        raise StopIteration(re)
+        raise PaginationError(re)
+    return response
+
+def remaining_page_urls(response):
+    """
+    build the urls of all the pages following the given one, using the page
+    number advertised by the `last` link
+    :return: a list of urls or None if the response has no numbered `last` link
+    """
+    try:
+        next_url = response.links['next']['url']
+        last_url = response.links['last']['url']
+    except KeyError:
+        return None
+
+    last = urlparse(last_url)
+    query = parse_qs(last.query)
+    try:
+        next_page = int(parse_qs(urlparse(next_url).query)['page'][0])
+        last_page = int(query['page'][0])
+    except (KeyError, ValueError):
+        return None
+
+    urls = []
+    for page in range(next_page, last_page + 1):
+        query['page'] = [str(page)]
+        urls.append(urlunparse(last._replace(query=urlencode(query, doseq=True))))
+    return urls
+
+def prefetched_pages(urls, session, prefetch):
+    """
+    fetch the given page urls keeping up to `prefetch` requests in flight,
+    yielding the responses in the same order as the urls
+    """
+    urls = iter(urls)
+    with ThreadPoolExecutor(max_workers=prefetch) as pool:
+        in_flight = deque(pool.submit(get_page, session, url) for url in islice(urls, prefetch))
+        while in_flight:
+            response = in_flight.popleft().result()
+            next_url = next(urls, None)
+            if next_url is not None:
+                in_flight.append(pool.submit(get_page, session, next_url))
+            yield response
+
+def pages(url, session, params=None, prefetch=0):
+    """
+    iterate over the pages of a paginated newrelic endpoint following the
+    `next` links. When `prefetch` is greater than 0 and the first page
+    advertises the `last` page number, the remaining pages are fetched
+    concurrently with up to `prefetch` requests in flight
+    """
+    count = 0
+    for response in _pages(url, session, params=params, prefetch=prefetch):
+        count += 1
+        yield response
+    metrics.observe_sweep(url, count)
 
+def _pages(url, session, params=None, prefetch=0):
+    response = get_page(session, url, params=params)
     yield response
+
+    if prefetch > 0:
+        urls = remaining_page_urls(response)
+        if urls is not None:
+            for response in prefetched_pages(urls, session, prefetch):
+                yield response
+            return
+
     while True:
         try:
             next_url = response.links['next']['url']
-            response = session.get(next_url)
-            handle_response_status(response, 200)
-            yield response
         except KeyError:
             break
-        except (requests.exceptions.RequestException, UnexpectedStatusCode) as re:
-            logger.error(str(re))
-            raise StopIteration(re)
+        response = get_page(session, next_url)
+        yield response
 
-def entities(url, session, entity_name, params=None):
-    entities = []
-    for response in pages(url, session, params=params):
+def iter_entities(url, session, entity_name, params=None, prefetch=0, record=None):
+    """
+    stream the entities of a paginated endpoint page by page
+    :param record: an optional Record class the entities are projected into
+    :return: a generator of entities
+    """
+    for response in pages(url, session, params=params, prefetch=prefetch):
         try:
             json_response = response.json()
-            if entity_name in json_response:
-                entities[0:0] = json_response[entity_name]
         except json.decoder.JSONDecodeError as je:
             logger.error(str(je))
             break
-    return entities
-
+        for entity in json_response.get(entity_name, []):
+            yield record(entity) if record else entity
 
+def entities(url, session, entity_name, params=None, prefetch=0):
+    return list(iter_entities(url, session, entity_name, params=params, prefetch=prefetch))
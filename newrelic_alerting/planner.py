@@ -0,0 +1,113 @@
+import json
+
+from collections import OrderedDict
+
+from .entity_set import entity_id
+from .executor import Mutation
+from . import helper
+
+logger = helper.getLogger(__name__)
+
+
+class ConditionPlan(object):
+    def __init__(self, condition):
+        self.condition = condition
+        self.add = OrderedDict()
+        self.remove = OrderedDict()
+
+    def __len__(self):
+        return len(self.add) + len(self.remove)
+
+    def mutations(self):
+        for mutation in self.add.values():
+            yield mutation
+        for mutation in self.remove.values():
+            yield mutation
+
+    def to_dict(self):
+        return {
+            "condition_id": self.condition.id,
+            "condition_name": self.condition.name,
+            "add": [{"id": mutation.server_id, "name": mutation.server_name}
+                    for mutation in self.add.values()],
+            "remove": [mutation.server_id for mutation in self.remove.values()]
+        }
+
+
+class ReconciliationPlan(object):
+    """
+    The deduplicated set of add/remove operations needed to bring the
+    conditions entities to the desired state, grouped by condition
+    """
+
+    def __init__(self):
+        self.conditions = OrderedDict()
+
+    def add(self, mutation):
+        condition_plan = self.conditions.get(mutation.condition.id)
+        if condition_plan is None:
+            condition_plan = ConditionPlan(mutation.condition)
+            self.conditions[mutation.condition.id] = condition_plan
+
+        key = str(mutation.server_id)
+        if mutation.action == Mutation.ADD:
+            condition_plan.remove.pop(key, None)
+            condition_plan.add.setdefault(key, mutation)
+        elif key not in condition_plan.add:
+            condition_plan.remove.setdefault(key, mutation)
+
+    def mutations(self):
+        mutations = []
+        for condition_plan in self.conditions.values():
+            mutations.extend(condition_plan.mutations())
+        return mutations
+
+    def __len__(self):
+        return sum(len(condition_plan) for condition_plan in self.conditions.values())
+
+    def to_dict(self):
+        conditions = [condition_plan.to_dict() for condition_plan in self.conditions.values()
+                      if len(condition_plan)]
+        return {
+            "operations": len(self),
+            "conditions": conditions
+        }
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), indent=indent)
+
+
+def plan_reconciliation(policies, inventory, server_ids=None):
+    """
+    Compute the operations needed to reconcile the given policies with the
+    servers in the inventory. A condition shared by several policies (ie. the
+    same newrelic policy configured twice) keeps the union of their servers
+    :param policies: a list of initialised Policy objects
+    :param inventory: a ServerInventory
+    :param server_ids: if given, only operations on these server ids (as
+    strings) are planned
+    :return: a ReconciliationPlan
+    """
+    desired = OrderedDict()
+    for policy in policies:
+        # the ids to keep are built once per policy and shared by its conditions
+        policy_keep = frozenset(map(entity_id, inventory.server_ids_for_selector(policy.selector)))
+        for condition in policy.cm.conditions:
+            if condition.id not in desired:
+                desired[condition.id] = (condition, policy_keep)
+            else:
+                condition, keep = desired[condition.id]
+                if not policy_keep <= keep:
+                    desired[condition.id] = (condition, keep | policy_keep)
+
+    plan = ReconciliationPlan()
+    for condition, keep in desired.values():
+        servers = [inventory.servers[server_id] for server_id in keep]
+        mutations = [condition.register_mutation(server) for server in servers]
+        mutations.extend(condition.deregister_mutations(servers, keep))
+        for mutation in mutations:
+            if mutation and (server_ids is None or str(mutation.server_id) in server_ids):
+                plan.add(mutation)
+
+    logger.info("Planned {} operations over {} conditions".format(len(plan), len(plan.conditions)))
+    return plan
@@ -1,27 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor
+
 from . import pagination
 from . import helper
+from .entity_set import EntitySet, entity_id, keep_ids
+from .executor import Mutation
+from .exceptions import PolicyNotFound, InvalidConfiguration
+from .label_selector import policy_selector
+from .records import ConditionRecord
 
 logger = helper.getLogger(__name__)
 
 class PolicyDataManager(object):
 
-    alert_policies_url = "https://api.newrelic.com/v2/alerts_policies.json"
-    alert_conditions_url = "https://api.newrelic.com/v2/alerts_conditions.json"
-    alerts_entity_conditions_url = "https://api.newrelic.com/v2/alerts_entity_conditions/{entity_id}.json"
-
-    def __init__(self, session):
+    def __init__(self, session, prefetch=0, base_url=None):
+        """
+        :param base_url: the root of the newrelic v2 API, ie. a local stand-in of the API
+        """
+        base_url = (base_url or pagination.API_BASE_URL).rstrip("/")
         self.session = session
+        self.prefetch = prefetch
+        self.alert_policies_url = base_url + "/alerts_policies.json"
+        self.alert_conditions_url = base_url + "/alerts_conditions.json"
+        self.alerts_entity_conditions_url = base_url + "/alerts_entity_conditions/{entity_id}.json"
 
     def all_policies(self, params=None):
 
-        policies = pagination.entities(self.alert_policies_url, self.session, "policies", params=params)
+        policies = pagination.entities(self.alert_policies_url, self.session, "policies", params=params,
+                                       prefetch=self.prefetch)
         return policies
 
     def all_conditions(self, params=None):
 
-        conditions = pagination.entities(self.alert_conditions_url, self.session, "conditions", params=params)
+        conditions = pagination.entities(self.alert_conditions_url, self.session, "conditions", params=params,
+                                         prefetch=self.prefetch)
         return conditions
 
+    def iter_conditions(self, params=None, record=ConditionRecord):
+        return pagination.iter_entities(self.alert_conditions_url, self.session, "conditions", params=params,
+                                        prefetch=self.prefetch, record=record)
+
     @pagination.handle_response
     def deregister_server(self, server_id, condition_id):
 
@@ -61,11 +78,68 @@ class PoliciesManager(object):
         new_policy.initialise()
         self.alert_policies.append(new_policy)
 
+    def add_alert_policies(self, policies, jobs=1):
+        """
+        Initialise several policies at once: all the account policies are
+        fetched in a single sweep and indexed by name, then the conditions of
+        every configured policy are fetched concurrently
+        :param policies: a list of alert policy configurations
+        :param jobs: the number of concurrent condition fetches
+        """
+        policies_by_name = {}
+        for policy in self.pdm.all_policies(None):
+            policies_by_name.setdefault(policy["name"], policy)
+
+        missing = [policy["name"] for policy in policies if policy["name"] not in policies_by_name]
+        if missing:
+            raise PolicyNotFound("No newrelic alert policy named: {}".format(", ".join(missing)))
+
+        new_policies = [Policy(self.pdm, policy) for policy in policies]
+
+        def load(policy):
+            policy.bind(policies_by_name[policy.name])
+            return policy
+
+        with ThreadPoolExecutor(max_workers=max(1, int(jobs))) as pool:
+            self.alert_policies.extend(pool.map(load, new_policies))
+
+    def reconfigure(self, old_policies, new_policies, jobs=1):
+        """
+        Switch the initialised policies from one configuration to another:
+        the unchanged policies keep their conditions, the added and changed
+        ones are initialised and the removed ones dropped
+        :param old_policies: the configuration the current policies were initialised from
+        :param new_policies: the new list of alert policy configurations
+        :return: a PolicyDiff
+        """
+        diff = diff_policies(old_policies, new_policies)
+        unchanged = set(diff.unchanged)
+        current = dict(zip(policy_keys(old_policies), self.alert_policies))
+        new_keys = policy_keys(new_policies)
+        reinitialised = [(key, policy) for key, policy in zip(new_keys, new_policies) if key not in unchanged]
+
+        loaded = PoliciesManager(self.pdm)
+        if reinitialised:
+            loaded.add_alert_policies([policy for _, policy in reinitialised], jobs=jobs)
+        loaded_by_key = dict(zip([key for key, _ in reinitialised], loaded.alert_policies))
+
+        self.alert_policies = [current[key] if key in unchanged else loaded_by_key[key] for key in new_keys]
+        return diff
+
     def policies_by_tags(self, tags):
         tags = set(tags)
 
         return [policy for policy in self.alert_policies if not tags.isdisjoint(policy.tags)]
 
+    def policies_matching(self, label_keys):
+        """
+        :param label_keys: the `Category:name` keys of the labels of a server
+        :return: the policies whose selector matches the labels
+        """
+        label_keys = frozenset(label_keys)
+        return [policy for policy in self.alert_policies
+                if policy.selector is not None and policy.selector.matches(label_keys)]
+
     def __str__(self):
         toText = ""
         for policy in self.alert_policies:
@@ -73,52 +147,111 @@ class PoliciesManager(object):
         return toText
 
 
+class PolicyDiff(object):
+    """
+    The changes between two alert policies configurations, each policy being
+    identified by its name and, when configured several times, its occurrence
+    """
+
+    def __init__(self, added=(), removed=(), changed=(), unchanged=()):
+        self.added = list(added)
+        self.removed = list(removed)
+        self.changed = list(changed)
+        self.unchanged = list(unchanged)
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def to_dict(self):
+        return {
+            "added": [name for name, _ in self.added],
+            "removed": [name for name, _ in self.removed],
+            "changed": [name for name, _ in self.changed],
+            "unchanged": len(self.unchanged)
+        }
+
+
+def policy_keys(policies):
+    """
+    :return: the (name, occurrence) key of every alert policy configuration
+    """
+    occurrences = {}
+    keys = []
+    for policy in policies:
+        occurrence = occurrences.get(policy["name"], 0)
+        occurrences[policy["name"]] = occurrence + 1
+        keys.append((policy["name"], occurrence))
+    return keys
+
+
+def policy_definition(policy):
+    """
+    :return: what decides the servers of a configured policy: its tags and selector
+    """
+    return frozenset(policy.get("tags") or []), policy.get("selector")
+
+
+def diff_policies(old_policies, new_policies):
+    """
+    :return: the PolicyDiff between two lists of alert policy configurations
+    """
+    old = dict(zip(policy_keys(old_policies), map(policy_definition, old_policies)))
+    new = dict(zip(policy_keys(new_policies), map(policy_definition, new_policies)))
+    diff = PolicyDiff(removed=[key for key in old if key not in new])
+    for key, definition in new.items():
+        if key not in old:
+            diff.added.append(key)
+        elif old[key] != definition:
+            diff.changed.append(key)
+        else:
+            diff.unchanged.append(key)
+    return diff
+
+
 class Policy(object):
     def __init__(self, pdm, policy):
         self.pdm = pdm
-        self.tags = set(policy["tags"])
         self.name = policy["name"]
+        self.tags = set(policy.get("tags") or [])
+        if "tags" not in policy and "selector" not in policy:
+            raise InvalidConfiguration("The alert policy {} needs tags or a selector".format(self.name))
+        self.selector = policy_selector(self.tags, policy.get("selector"))
         self.id = ""
-        self.cm = ConditionManager(pdm)
+        self.cm = ConditionManager(pdm, self.name)
 
     def initialise(self):
         params = {"filter[name]": self.name}
         policies = self.pdm.all_policies(params)
-        this_policy = policies[0]
-        self.id = this_policy["id"]
-        self.cm.add_conditions(self.id)
+        if not policies:
+            raise PolicyNotFound("No newrelic alert policy named: {}".format(self.name))
+        self.bind(policies[0])
 
-    def register_server(self, server):
-        self.cm.register_server(server)
-
-    def deregister_servers(self, servers_to_keep):
-        self.cm.deregister_servers(servers_to_keep)
+    def bind(self, policy):
+        self.id = policy["id"]
+        self.cm.add_conditions(self.id)
 
     def __str__(self):
         return ("{ Name: " + self.name + " },"
                 "{ id: " + str(self.id) + " },"
                 "{ tags: " + str(self.tags) + " }"
+                "{ selector: " + str(self.selector) + " }"
                 "{ conditions: " + str(self.cm) + "}")
 
 
 class ConditionManager(object):
-    def __init__(self, pdm):
+    def __init__(self, pdm, policy_name=None):
         self.pdm = pdm
+        self.policy_name = policy_name
         self.conditions = []
 
     def add_conditions(self, policy_id):
         params = {"policy_id": policy_id}
-        conditions = self.pdm.all_conditions(params=params)
-        for condition in conditions:
-            self.conditions.append(Condition(self.pdm, condition))
+        conditions = self.pdm.iter_conditions(params=params)
+        self.load_conditions(conditions)
 
-    def deregister_servers(self, servers_to_keep):
-        for condition in self.conditions:
-            condition.deregister_servers(servers_to_keep)
-
-    def register_server(self, server):
-        for condition in self.conditions:
-            condition.register_server(server)
+    def load_conditions(self, conditions):
+        for condition in conditions:
+            self.conditions.append(Condition(self.pdm, condition, self.policy_name))
 
     def __str__(self):
         toText = ""
@@ -128,9 +261,10 @@ class ConditionManager(object):
 
 
 class Condition(object):
-    def __init__(self, pdm, condition):
+    def __init__(self, pdm, condition, policy_name=None):
         self.pdm = pdm
-        self.entities = set(condition["entities"])
+        self.policy_name = policy_name
+        self.entities = EntitySet(condition["entities"])
         self.name = condition["name"]
         self.id = condition["id"]
 
@@ -138,28 +272,32 @@ class Condition(object):
         return (
             "{ Name: " + self.name + " },"
             "{ id: " + str(self.id) + " },"
-            "{ entities: " + str(self.entities) + " }")
+            "{ entities: " + str(list(self.entities)) + " }")
 
     def __iter__(self):
         return iter(self.entities)
 
-    def deregister_servers(self, servers_to_keep):
-        server_to_keep_ids = set([str(server["id"]) for server in servers_to_keep])
-
-        redundant_ids = self.entities - server_to_keep_ids
-
-        for server_id in redundant_ids:
-            self.deregister_server(server_id)
-
-    def deregister_server(self, server_id):
-        if str(server_id) in self.entities:
-            ok = self.pdm.deregister_server(server_id, self.id)
-            if ok:
-                self.entities.discard(str(server_id))
-
-    def register_server(self, server):
-        server_id = server["id"]
-        if str(server_id) not in self.entities:
-            ok = self.pdm.register_server(server, self.id)
-            if ok:
-                self.entities.add(str(server_id))
+    def __contains__(self, server_id):
+        return server_id in self.entities
+
+    def redundant_ids(self, servers_to_keep, keep=None):
+        """
+        :param keep: the integer ids of `servers_to_keep`, when already computed
+        :return: the ids of the entities not in `servers_to_keep`
+        """
+        if keep is None:
+            keep = keep_ids(servers_to_keep)
+        return self.entities.difference(keep)
+
+    def deregister_mutations(self, servers_to_keep, keep=None):
+        return [Mutation.remove(self, server_id) for server_id in self.redundant_ids(servers_to_keep, keep)]
+
+    def register_mutation(self, server):
+        if server["id"] not in self.entities:
+            return Mutation.add(self, server)
+        return None
+
+    def deregister_mutation(self, server_id):
+        if server_id in self.entities:
+            return Mutation.remove(self, entity_id(server_id))
+        return None
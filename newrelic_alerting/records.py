@@ -0,0 +1,36 @@
+class Record(object):
+    """
+    Compact, read-only projection of a newrelic API entity keeping only the
+    fields listed in `__slots__`. Records can be accessed like the original
+    dictionaries, ie. `server["id"]`
+    """
+    __slots__ = ()
+
+    def __init__(self, entity):
+        for field in self.__slots__:
+            setattr(self, field, entity.get(field))
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, self.to_dict())
+
+
+class ServerRecord(Record):
+    __slots__ = ("id", "name", "reporting", "last_reported_at")
+
+
+class ConditionRecord(Record):
+    __slots__ = ("id", "name", "entities")
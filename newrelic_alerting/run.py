@@ -1,75 +1,256 @@
-import requests
+import functools
 import sys
-from os import environ
+from contextlib import closing
 
-from flask import Flask, url_for, render_template
-
-from newrelic_alerting.api import api
-from newrelic_alerting.config import AppConfig
-
-from .config import CLIConfig
+from .config import BaseConfig, CLIConfig
 from .server import ServersManager, ServersDataManager
 from .policy import PolicyDataManager, PoliciesManager
 from .alert_manager import NewRelicAlertManager
+from .executor import MutationReport
+from .planner import ReconciliationPlan
+from .snapshot import reconciliation_scope, drift_scope
+from .scheduler import RequestScheduler
+from .exceptions import ServerNotFound
+from . import accounts
+from . import cassette
+from . import transport
+from . import metrics
+from . import tracing
 from . import helper
 
 logger = helper.getLogger(__name__)
 
-def run_synch(config):
+def build_managers(config):
+    """
+    build the session, data managers and alert manager for a synchronisation
+    :return: a tuple (alert_manager, servers_manager)
+    """
+    # size the connection pool to the number of concurrent workers
+    workers = max(1, config["JOBS"], config["PREFETCH_PAGES"])
+    wrappers = []
+    if config["CACHE_PATH"] and not config["REPLAY_PATH"]:
+        from .cache import ResponseCache, CachingHTTPAdapter
+        cache = ResponseCache(config["CACHE_PATH"], config["CACHE_TTL"])
+        wrappers.append(lambda adapter: CachingHTTPAdapter(cache, adapter))
+    # the recording wraps the cache, so that a cassette replays without it
+    recording = cassette.wrap_adapter(config)
+    if recording:
+        wrappers.append(recording)
+    wrap_adapter = None
+    if wrappers:
+        wrap_adapter = lambda adapter: functools.reduce(lambda wrapped, wrap: wrap(wrapped), wrappers, adapter)
+    session = transport.create_session(config["API_KEY"],
+                                       pool_size=max(10, workers),
+                                       connect_timeout=config["CONNECT_TIMEOUT"],
+                                       read_timeout=config["READ_TIMEOUT"],
+                                       http2=config["HTTP2"] and not config["REPLAY_PATH"],
+                                       wrap_adapter=wrap_adapter)
+    scheduler = RequestScheduler(session,
+                                 requests_per_minute=config["REQUESTS_PER_MINUTE"],
+                                 max_concurrency=workers,
+                                 max_retries=config["MAX_RETRIES"])
+
+    sdm = ServersDataManager(scheduler, prefetch=config["PREFETCH_PAGES"], base_url=config["API_BASE_URL"])
+    sm = ServersManager(sdm)
+
+    pdm = PolicyDataManager(scheduler, prefetch=config["PREFETCH_PAGES"], base_url=config["API_BASE_URL"])
+    pm = PoliciesManager(pdm)
+    alert_manager = NewRelicAlertManager(session, config["ALERT_CONFIG"]["alert_policies"], pm, sm,
+                                         jobs=config["JOBS"])
+    return alert_manager, sm
+
+@metrics.timed_sync("account")
+def run_synch(config, model_cache=None):
 
-    session = requests.Session()
     if config["API_KEY"] == "":
         raise Exception("New Relic API key cannot be empty")
-    session.headers.update({'X-Api-Key': config["API_KEY"]})
 
-    sdm = ServersDataManager(session)
-    sm = ServersManager(sdm)
-    sm.max_inactivity = config["MAX_INACTIVITY"]
+    if config["ENGINE"] == "asyncio":
+        # imported lazily as it depends on the optional aiohttp package
+        from .async_engine import run_synch_async
+        return run_synch_async(config)
 
-    pdm = PolicyDataManager(session)
-    pm = PoliciesManager(pdm)
-    alert_manager = NewRelicAlertManager(session, config["ALERT_CONFIG"]["alert_policies"], pm, sm)
-    alert_manager.initialise()
-    alert_manager.assign_servers_to_policies()
+    if model_cache is None:
+        alert_manager, sm = build_managers(config)
+        with closing(alert_manager.session):
+            return synchronise(config, alert_manager, sm)
+    with model_cache.model() as (alert_manager, sm):
+        return synchronise(config, alert_manager, sm)
 
-    sm.cleanup_not_reporting_servers()
+def synchronise(config, alert_manager, sm):
+    with tracing.span("synchronise", tracing.SYNC):
+        result = reconcile(config, alert_manager, sm.get_inventory())
+        if config["PLAN_ONLY"]:
+            return result
 
-def main():
+        result.cleanup = sm.cleanup_not_reporting_servers(config["MAX_INACTIVITY"], jobs=config["JOBS"])
+        return result
 
-    config = CLIConfig()
-    config.load_cli_config()
-    logger.info(config)
+def run_daemon(config, schedule, trace_path=None, profile_path=None):
+    """
+    Synchronise on the given IntervalSchedule until SIGTERM. The policies
+    model and the session are kept warm between the cycles of a single
+    account, and the alert configuration file is reloaded when it changes
+    :param schedule: an IntervalSchedule
+    :param trace_path: if given, every cycle is traced into its own file, ie. `trace.0001.json`
+    :param profile_path: if given, every cycle is profiled into its own subdirectory, ie. `profiles/0001`
+    :return: the Daemon, once stopped
+    """
+    # only the daemon mode needs these
+    from .config_reload import ConfigWatcher, reload_alert_config
+    from .daemon import Daemon, observed_changes, cycle_paths
+    from .model_cache import ModelCache
 
-    run_synch(dict(config))
+    model_cache = None
+    if not accounts.is_multi_account(config):
+        # the model must outlive the longest pause, else every cycle initialises it again
+        ttl = max(config["MODEL_CACHE_TTL"], schedule.max_interval * (1 + schedule.jitter))
+        model_cache = ModelCache(lambda: build_managers(config), ttl=ttl)
+    watcher = None
+    if config["ALERT_CONFIG_PATH"]:
+        watcher = ConfigWatcher(config["ALERT_CONFIG_PATH"],
+                                lambda alert_config: reload_alert_config(config, model_cache, alert_config))
 
-def create_app(config):
-    app = Flask(__name__)
+    def cycle():
+        if watcher is not None:
+            watcher.check()
+        # a trace per cycle, so that the spans do not pile up in a long running process
+        with tracing.instrumented(*cycle_paths(trace_path, profile_path, daemon.cycles)):
+            if model_cache is None:
+                result = run_synch_accounts(config)
+            else:
+                try:
+                    result = run_synch(config, model_cache)
+                except Exception:
+                    # the model may not reflect the mutations of the failed cycle
+                    model_cache.invalidate()
+                    raise
+        if config["PLAN_ONLY"]:
+            print(result.to_json())
+        return observed_changes(result)
+
+    daemon = Daemon(cycle, schedule)
+    try:
+        daemon.run()
+    finally:
+        if model_cache is not None and model_cache.managers is not None:
+            model_cache.managers[0].session.close()
+    return daemon
+
+def run_synch_accounts(config):
+    """
+    Synchronise all the accounts of a multi-account alert configuration,
+    `ACCOUNT_JOBS` at a time, each with its own session and rate limit budget
+    :return: an AccountsReport
+    """
+    settings = set(dict(BaseConfig())) - {"API_KEY", "ALERT_CONFIG", "ACCOUNT_JOBS", "ACCOUNT_POOL"}
+    configs = accounts.account_configs(config, settings)
+    return accounts.synchronise_accounts(configs, run_synch, jobs=config["ACCOUNT_JOBS"],
+                                         pool=config["ACCOUNT_POOL"])
 
-    app.config.from_object(config)
-    app.register_blueprint(api, url_prefix="/api")
+@metrics.timed_sync("server")
+def run_synch_server(config, server_identifier, model_cache=None):
+    """
+    Attach a single server to the policies matching its labels and detach it
+    from all the others, without sweeping the whole account
+    :param server_identifier: the server id or name
+    :return: the ReconciliationPlan in plan-only mode, the MutationReport otherwise
+    """
+    if config["API_KEY"] == "":
+        raise Exception("New Relic API key cannot be empty")
 
-    @app.route("/")
-    def index():
-        index_css_url =  url_for('static', filename='styles/index.css')
-        return render_template("index.html.j2", index_css_url=index_css_url)
+    if model_cache is None:
+        alert_manager, sm = build_managers(config)
+        with closing(alert_manager.session):
+            return synchronise_server(config, server_identifier, alert_manager, sm)
+    with model_cache.model() as (alert_manager, sm):
+        return synchronise_server(config, server_identifier, alert_manager, sm)
 
-    return app
+def synchronise_server(config, server_identifier, alert_manager, sm):
+    with tracing.span("synchronise_server", tracing.SYNC, server=str(server_identifier)):
+        with tracing.span("find_server"):
+            server = sm.find_server(server_identifier)
+            if server is None:
+                raise ServerNotFound("No newrelic server with id or name: {}".format(server_identifier))
+            labels = sm.get_server_labels(server["id"])
 
+        alert_manager.ensure_initialised()
+        plan = alert_manager.plan_server(server, labels)
+        if config["PLAN_ONLY"]:
+            return plan
+        return alert_manager.apply(plan)
 
-def main_app():
+def reconcile(config, alert_manager, inventory):
+    """
+    Reconcile the policies with the given inventory. When a snapshot path is
+    configured only the servers whose labels changed since the last successful
+    run are reconciled, and nothing at all if no label changed. Once the
+    conditions are loaded, all the servers are reconciled if any condition
+    changed since the snapshot
+    :return: the ReconciliationPlan in plan-only mode, the MutationReport otherwise
+    """
+    snapshot_path = config["SNAPSHOT_PATH"]
+    with tracing.span("snapshot"):
+        snapshot, previous, unchanged, server_ids = reconciliation_scope(
+            config["ALERT_CONFIG"]["alert_policies"], inventory, snapshot_path)
+    # the conditions are not fetched only to check their drift
+    if unchanged and not alert_manager.initialised:
+        return ReconciliationPlan() if config["PLAN_ONLY"] else MutationReport()
 
-    config = AppConfig()
-    try:
-        config.load_app_config()
-    except Exception as e:
-        logger.error(e)
-        sys.exit(1)
+    alert_manager.ensure_initialised()
+    server_ids = drift_scope(previous, alert_manager.pm.alert_policies, server_ids)
+    if unchanged and server_ids is not None:
+        return ReconciliationPlan() if config["PLAN_ONLY"] else MutationReport()
+    plan = alert_manager.plan(inventory, server_ids)
+    if config["PLAN_ONLY"]:
+        return plan
 
+    report = alert_manager.apply(plan)
+    if snapshot_path and report:
+        snapshot.record_conditions(alert_manager.pm.alert_policies)
+        snapshot.save(snapshot_path)
+    return report
+
+def main():
+
+    config = CLIConfig()
+    config.load_cli_config()
     logger.info(config)
-    app = create_app(config)
 
-    if "PORT" in environ:
-        app.run("0.0.0.0", int(environ["PORT"]))
+    multi_account = accounts.is_multi_account(dict(config))
+    if multi_account and config.TARGET_SERVER is not None:
+        logger.error("sync-server is not supported with multiple accounts")
+        sys.exit(2)
+
+    if config.DAEMON:
+        if config.TARGET_SERVER is not None:
+            logger.error("sync-server is not supported in daemon mode")
+            sys.exit(2)
+        # imported here to keep the startup of single runs minimal
+        from .daemon import IntervalSchedule
+        schedule = IntervalSchedule(config.INTERVAL, config.MIN_INTERVAL, config.MAX_INTERVAL, config.JITTER)
+        run_daemon(dict(config), schedule, config.TRACE_PATH, config.PROFILE_PATH)
+        return
+
+    with tracing.instrumented(config.TRACE_PATH, config.PROFILE_PATH):
+        if multi_account:
+            result = run_synch_accounts(dict(config))
+        elif config.TARGET_SERVER is not None:
+            result = run_synch_server(dict(config), config.TARGET_SERVER)
+        else:
+            result = run_synch(dict(config))
+    if config.PLAN_ONLY or multi_account:
+        print(result.to_json())
     else:
-        app.debug = config.DEBUG
-        app.run()
\ No newline at end of file
+        result.log_failures()
+    if (multi_account or not config.PLAN_ONLY) and not result:
+        sys.exit(1)
+
+def create_app(config):
+    # the web app lives in its own module so that the CLI never imports Flask
+    from .app import create_app
+    return create_app(config)
+
+def main_app():
+    from .app import main_app
+    main_app()
@@ -0,0 +1,203 @@
+import random
+import threading
+import time
+
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+from . import helper
+from . import metrics
+from . import tracing
+
+logger = helper.getLogger(__name__)
+
+THROTTLING_STATUS_CODES = (429, 502, 503, 504)
+
+
+class TokenBucket(object):
+    """
+    Token bucket allowing `requests_per_minute` requests per minute, with
+    bursts of up to `capacity` requests
+    """
+
+    def __init__(self, requests_per_minute, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = capacity or max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated_at = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self):
+        """
+        take a token if one is available
+        :return: 0 on success, otherwise the seconds to wait before retrying
+        """
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        wait = self.try_acquire()
+        while wait:
+            self.sleep(wait)
+            wait = self.try_acquire()
+
+
+class AIMDLimit(object):
+    """
+    Concurrency limit adjusted AIMD style: it grows by roughly one slot per
+    window of successful requests and is halved every time the API throttles
+    us. Shared by the threaded and the asyncio schedulers, which add the
+    waiting for a free slot
+    """
+
+    def __init__(self, maximum, minimum=1):
+        self.maximum = max(minimum, maximum)
+        self.minimum = minimum
+        self.limit = float(self.maximum)
+        self.in_flight = 0
+
+    @property
+    def available(self):
+        return self.in_flight < int(self.limit)
+
+    def increase(self):
+        self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def decrease(self):
+        self.limit = max(self.minimum, self.limit / 2)
+
+
+class AdaptiveConcurrencyLimit(AIMDLimit):
+    """
+    Bound on the number of requests in flight across threads, following an
+    AIMDLimit
+    """
+
+    def __init__(self, maximum, minimum=1):
+        super(AdaptiveConcurrencyLimit, self).__init__(maximum, minimum)
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while not self.available:
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def on_success(self):
+        with self.condition:
+            self.increase()
+            self.condition.notify_all()
+
+    def on_throttle(self):
+        with self.condition:
+            self.decrease()
+
+
+def retry_after(response):
+    """
+    :return: the delay in seconds requested by a `Retry-After` header, or None
+    """
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class RequestScheduler(object):
+    """
+    Session wrapper every API call goes through. Requests are paced by an
+    optional TokenBucket and bounded by an AdaptiveConcurrencyLimit, and
+    throttled requests are retried honouring `Retry-After` or, when absent,
+    with jittered exponential backoff
+    """
+
+    def __init__(self, session, requests_per_minute=None, max_concurrency=10, max_retries=5,
+                 backoff=1.0, max_backoff=60.0, sleep=time.sleep):
+        self.session = session
+        self.bucket = TokenBucket(requests_per_minute, sleep=sleep) if requests_per_minute else None
+        self.concurrency = AdaptiveConcurrencyLimit(max_concurrency)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.sleep = sleep
+
+    @property
+    def headers(self):
+        return self.session.headers
+
+    def delay(self, attempt, response):
+        requested = retry_after(response)
+        if requested is not None:
+            return requested + random.uniform(0, self.backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def request(self, method, url, **kwargs):
+        attempt = 0
+        while True:
+            if self.bucket:
+                self.bucket.acquire()
+            self.concurrency.acquire()
+            started_at = time.perf_counter()
+            response = None
+            try:
+                response = self.session.request(method, url, **kwargs)
+            finally:
+                self.concurrency.release()
+                finished_at = time.perf_counter()
+                metrics.observe_request(method, url, response, finished_at - started_at)
+                if tracing.active():
+                    tracing.record("{} {}".format(method, metrics.endpoint_name(url)), tracing.API,
+                                   started_at, finished_at, url=url,
+                                   status=response.status_code if response is not None else "error")
+
+            if response.status_code not in THROTTLING_STATUS_CODES:
+                self.concurrency.on_success()
+                return response
+
+            self.concurrency.on_throttle()
+            if attempt >= self.max_retries:
+                logger.error("Giving up on {} {} after {} retries".format(method, url, attempt))
+                return response
+
+            delay = self.delay(attempt, response)
+            logger.info("Throttled with status {} on {} {}, retrying in {:.1f}s".format(
+                response.status_code, method, url, delay))
+            response.close()
+            self.sleep(delay)
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
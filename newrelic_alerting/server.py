@@ -1,20 +1,27 @@
-import pytz
-import requests
-
-from dateutil.parser import parse
-from datetime import timedelta, datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta, datetime, timezone
 
 from . import pagination
 from . import helper
+from . import tracing
+from .inventory import ServerInventory
+from .records import ServerRecord
 
 logger = helper.getLogger(__name__)
 
 class ServersDataManager(object):
-    servers_url = "https://api.newrelic.com/v2/servers.json"
-    server_delete_url = "https://api.newrelic.com/v2/servers/{server_id}.json"
 
-    def __init__(self, session):
+    def __init__(self, session, prefetch=0, base_url=None):
+        """
+        :param base_url: the root of the newrelic v2 API, ie. a local stand-in of the API
+        """
+        base_url = (base_url or pagination.API_BASE_URL).rstrip("/")
         self.session = session
+        self.prefetch = prefetch
+        self.servers_url = base_url + "/servers.json"
+        self.server_url = base_url + "/servers/{server_id}.json"
+        self.server_delete_url = base_url + "/servers/{server_id}.json"
+        self.labels_url = base_url + "/labels.json"
 
     @pagination.handle_response
     def delete_server(self, server_id, params=None):
@@ -22,8 +29,106 @@ class ServersDataManager(object):
             server_id=server_id, params=params))
         return response
 
+    def show_server(self, server_id):
+        """
+        :return: the response, whatever its status, so that a missing server can be told from a failure
+        """
+        response = self.session.get(self.server_url.format(server_id=server_id))
+        return response
+
     def get_servers(self, params=None):
-        return pagination.entities(self.servers_url, self.session, "servers", params=params)
+        return pagination.entities(self.servers_url, self.session, "servers", params=params,
+                                   prefetch=self.prefetch)
+
+    def iter_servers(self, params=None, record=ServerRecord):
+        return pagination.iter_entities(self.servers_url, self.session, "servers", params=params,
+                                        prefetch=self.prefetch, record=record)
+
+    def get_labels(self, params=None):
+        return pagination.entities(self.labels_url, self.session, "labels", params=params,
+                                   prefetch=self.prefetch)
+
+UTC_TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S+00:00"
+UTC_TIMESTAMP_LENGTH = len("2017-10-20T10:00:00+00:00")
+
+def parse_timestamp(timestamp):
+    try:
+        parsed = datetime.fromisoformat(timestamp)
+    except ValueError:
+        # dateutil is only needed for the timestamps fromisoformat rejects
+        from dateutil.parser import parse
+        parsed = parse(timestamp)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+def filter_not_reporting(servers, hours, now=None):
+    """
+    :param hours: the amount of hours since the servers have been reporting
+    :param now: the reference time, defaults to the current time
+    :return: the servers not reporting for longer than `hours` hours
+    """
+    now = (now or datetime.now(timezone.utc)).replace(microsecond=0)
+    cutoff = now - timedelta(hours=hours)
+    # newrelic reports fixed-format UTC timestamps, which sort like the
+    # instants they represent and can be compared without being parsed
+    utc_cutoff = cutoff.astimezone(timezone.utc).strftime(UTC_TIMESTAMP_FORMAT)
+
+    not_reporting = []
+    for server in servers:
+        if server["reporting"]:
+            continue
+        last_reported_at = server["last_reported_at"]
+        if not last_reported_at:
+            continue
+        if len(last_reported_at) == UTC_TIMESTAMP_LENGTH and last_reported_at.endswith("+00:00"):
+            stale = last_reported_at < utc_cutoff
+        else:
+            stale = parse_timestamp(last_reported_at) < cutoff
+        if stale:
+            not_reporting.append(server)
+    return not_reporting
+
+class CleanupResult(object):
+    def __init__(self, server, ok, error=None):
+        self.server = server
+        self.ok = ok
+        self.error = error
+
+    def to_dict(self):
+        return {
+            "server_id": self.server["id"],
+            "server_name": self.server["name"],
+            "last_reported_at": self.server["last_reported_at"],
+            "ok": self.ok,
+            "error": self.error
+        }
+
+
+class CleanupReport(object):
+    def __init__(self, results=None):
+        self.results = results or []
+
+    @property
+    def deleted(self):
+        return [result for result in self.results if result.ok]
+
+    @property
+    def failed(self):
+        return [result for result in self.results if not result.ok]
+
+    def __len__(self):
+        return len(self.results)
+
+    def __bool__(self):
+        return not self.failed
+
+    def to_dict(self):
+        return {
+            "deleted": len(self.deleted),
+            "failed": len(self.failed),
+            "results": [result.to_dict() for result in self.results]
+        }
 
 class ServersManager(object):
     def __init__(self, sdm):
@@ -32,6 +137,47 @@ class ServersManager(object):
     def get_servers(self, params=None):
         return self.sdm.get_servers(params)
 
+    def get_inventory(self):
+        """
+        fetch all the servers and labels of the account in a single sweep
+        :return: a ServerInventory indexing the servers by label
+        """
+        with tracing.span("inventory"):
+            servers = self.sdm.iter_servers(None)
+            labels = self.sdm.get_labels(None)
+            inventory = ServerInventory(servers, labels)
+            logger.info("Fetched server inventory: {}".format(str(inventory)))
+            return inventory
+
+    def find_server(self, identifier):
+        """
+        look a server up by id or, if the identifier is not numeric, by name
+        :return: the server or None if it does not exist
+        :raise UnexpectedStatusCode: when the API answers with any other error
+        """
+        identifier = str(identifier)
+        if identifier.isdigit():
+            response = self.sdm.show_server(identifier)
+            if response.status_code == 404:
+                return None
+            pagination.handle_response_status(response, 200)
+            return ServerRecord(response.json()["server"])
+
+        for server in self.sdm.iter_servers({"filter[name]": identifier}):
+            if server["name"] == identifier:
+                return server
+        return None
+
+    def get_server_labels(self, server_id):
+        """
+        :return: the label keys of a server. The labels endpoint cannot be
+                 filtered by server, so all the labels are listed: the index
+                 of a cached inventory would miss the labels of a host
+                 relabelled since
+        """
+        return set(label["key"] for label in self.sdm.get_labels(None)
+                   if server_id in label.get("links", {}).get("servers", []))
+
     def get_not_reporting_servers(self, hours):
         """
         get a list of not reporting servers
@@ -39,26 +185,40 @@ class ServersManager(object):
         :return: a list servers not reporting for longer than `hours` hours
         """
         params = {"filter[reported]": "false"}
-        all_servers = self.get_servers(params)
+        all_servers = self.sdm.iter_servers(params)
+        return filter_not_reporting(all_servers, hours)
 
-        delete_since = timedelta(hours=hours)
-        now = datetime.utcnow().replace(tzinfo=pytz.utc)
 
-        not_reporting_servers = [
-            server for server in all_servers
-            if not server["reporting"]
-            if now - parse(server["last_reported_at"]) > delete_since
-        ]
-        return not_reporting_servers
+    def delete_server(self, server):
+        logger.info("Permanently deleting server: {}".format(server["name"]))
+        try:
+            ok = self.sdm.delete_server(server["id"])
+        except Exception as e:
+            logger.error("Failed deleting server {}: {}".format(server["name"], str(e)))
+            return CleanupResult(server, False, str(e))
+        if not ok:
+            logger.info("Failed deleting server: {}".format(server["name"]))
+            return CleanupResult(server, False, "unexpected API response")
+        return CleanupResult(server, True)
 
+    def cleanup_not_reporting_servers(self, hours=24, jobs=1):
+        """
+        delete the servers not reporting for longer than `hours` hours,
+        carrying on past the deletions that fail
+        :param jobs: the maximum number of concurrent deletions
+        :return: a CleanupReport, falsy when any deletion failed
+        """
+        with tracing.span("cleanup"):
+            not_reporting_servers = self.get_not_reporting_servers(hours)
 
-    def cleanup_not_reporting_servers(self, hours=24):
-        not_reporting_servers = self.get_not_reporting_servers(hours)
+            if jobs <= 1 or len(not_reporting_servers) <= 1:
+                results = [self.delete_server(server) for server in not_reporting_servers]
+            else:
+                with ThreadPoolExecutor(max_workers=jobs) as pool:
+                    futures = [pool.submit(self.delete_server, server) for server in not_reporting_servers]
+                    results = [future.result() for future in as_completed(futures)]
 
-        for server in not_reporting_servers:
-            logger.info("Permanently deleting server: {}".format(server["name"]))
-            ok = self.sdm.delete_server(server["id"])
-            if not ok:
-                logger.info("Failed deleting server: {}".format(server["name"]))
-                return ok
-        return True
+            report = CleanupReport(results)
+            logger.info("Cleaned up not reporting servers: {} deleted, {} failed".format(
+                len(report.deleted), len(report.failed)))
+            return report
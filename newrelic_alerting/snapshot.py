@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+
+from . import helper
+
+logger = helper.getLogger(__name__)
+
+
+def fingerprint(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class SyncSnapshot(object):
+    """
+    Compact record of the state reached by a successful synchronisation:
+    fingerprints of the alert configuration and of the label->server mapping,
+    the labels of every labelled server and the entities of every condition
+    """
+
+    def __init__(self, config_fingerprint, labels_fingerprint, server_labels, conditions=None):
+        self.config_fingerprint = config_fingerprint
+        self.labels_fingerprint = labels_fingerprint
+        self.server_labels = server_labels
+        self.conditions = conditions or {}
+
+    @classmethod
+    def from_inventory(cls, alert_policies, inventory):
+        server_labels = {}
+        for key, server_ids in inventory.label_index.items():
+            for server_id in server_ids:
+                server_labels.setdefault(str(server_id), []).append(key)
+        for labels in server_labels.values():
+            labels.sort()
+
+        return cls(fingerprint(alert_policies), fingerprint(server_labels), server_labels)
+
+    def matches(self, other):
+        return (other is not None and
+                self.config_fingerprint == other.config_fingerprint and
+                self.labels_fingerprint == other.labels_fingerprint)
+
+    def changed_servers(self, previous):
+        """
+        get the servers whose labels appeared, disappeared or changed since
+        the previous snapshot
+        :return: a set of server ids, as strings
+        """
+        server_ids = set(self.server_labels) | set(previous.server_labels)
+        return set(server_id for server_id in server_ids
+                   if self.server_labels.get(server_id) != previous.server_labels.get(server_id))
+
+    def record_conditions(self, policies):
+        for policy in policies:
+            for condition in policy.cm.conditions:
+                self.conditions[str(condition.id)] = sorted(str(entity) for entity in condition.entities)
+
+    def drifted_conditions(self, policies):
+        """
+        compare the entities of the loaded conditions with the recorded ones
+        :return: the ids of the conditions changed since the snapshot, ie. by
+                 hand in newrelic, as strings
+        """
+        drifted = set()
+        for policy in policies:
+            for condition in policy.cm.conditions:
+                condition_id = str(condition.id)
+                if self.conditions.get(condition_id) != sorted(str(entity) for entity in condition.entities):
+                    drifted.add(condition_id)
+        return drifted
+
+    def to_dict(self):
+        return {
+            "config_fingerprint": self.config_fingerprint,
+            "labels_fingerprint": self.labels_fingerprint,
+            "server_labels": self.server_labels,
+            "conditions": self.conditions
+        }
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as snapshot_file:
+            json.dump(self.to_dict(), snapshot_file, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path) as snapshot_file:
+                data = json.load(snapshot_file)
+        except (IOError, ValueError) as e:
+            logger.info("No usable synchronisation snapshot at {}: {}".format(path, str(e)))
+            return None
+        return cls(data["config_fingerprint"], data["labels_fingerprint"],
+                   data["server_labels"], data.get("conditions"))
+
+
+def reconciliation_scope(alert_policies, inventory, snapshot_path=None):
+    """
+    Decide what a synchronisation needs to reconcile by comparing the fetched
+    inventory with the snapshot of the last successful run
+    :return: a tuple (snapshot, previous, unchanged, server_ids) where
+    `previous` is the loaded snapshot, if any, `unchanged` is True when there
+    is nothing to reconcile and `server_ids` restricts the reconciliation to
+    some servers, None meaning all of them
+    """
+    snapshot = SyncSnapshot.from_inventory(alert_policies, inventory)
+    previous = SyncSnapshot.load(snapshot_path) if snapshot_path else None
+
+    if snapshot.matches(previous):
+        logger.info("No label changes since the last synchronisation, nothing to reconcile")
+        return snapshot, previous, True, set()
+
+    server_ids = None
+    if previous is not None and previous.config_fingerprint == snapshot.config_fingerprint:
+        server_ids = snapshot.changed_servers(previous)
+        logger.info("Reconciling {} servers with changed labels".format(len(server_ids)))
+    return snapshot, previous, False, server_ids
+
+
+def drift_scope(previous, policies, server_ids):
+    """
+    Widen a partial reconciliation to all the servers when the loaded
+    conditions differ from the ones recorded by the previous snapshot
+    :param server_ids: the scope given by `reconciliation_scope`
+    :return: the server ids to reconcile, None meaning all of them
+    """
+    if previous is None or server_ids is None:
+        return server_ids
+    drifted = previous.drifted_conditions(policies)
+    if drifted:
+        logger.info("{} conditions changed since the last synchronisation, reconciling all the servers".format(
+            len(drifted)))
+        return None
+    return server_ids
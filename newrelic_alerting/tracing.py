@@ -0,0 +1,191 @@
+"""
+Span based tracing and per phase profiling of the synchronisations.
+
+Spans are recorded as complete events of the Trace Event format, so the trace
+files open in chrome://tracing, Perfetto or speedscope. When neither tracing
+nor profiling is active `span` returns a shared no-op context manager
+"""
+import json
+import os
+import re
+import threading
+import time
+import tracemalloc
+
+from contextlib import contextmanager, nullcontext
+
+from . import helper
+
+logger = helper.getLogger(__name__)
+
+SYNC = "sync"
+PHASE = "phase"
+API = "api"
+
+NO_SPAN = nullcontext()
+
+_tracer = None
+_profiler = None
+
+
+class Tracer(object):
+    """
+    Collects the spans of all the threads as Trace Event format events
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.origin = clock()
+        self.pid = os.getpid()
+        self.events = []
+        self.threads = {}
+        self.lock = threading.Lock()
+
+    def record(self, name, category, started_at, finished_at, tid=None, args=None):
+        thread = threading.current_thread()
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (started_at - self.origin) * 1e6,
+            "dur": (finished_at - started_at) * 1e6,
+            "pid": self.pid,
+            "tid": tid if tid is not None else thread.ident
+        }
+        if args:
+            event["args"] = args
+        with self.lock:
+            self.events.append(event)
+            if tid is None:
+                self.threads.setdefault(thread.ident, thread.name)
+
+    def to_dict(self):
+        with self.lock:
+            names = [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}}
+                     for tid, name in self.threads.items()]
+            return {"traceEvents": names + sorted(self.events, key=lambda event: event["ts"]),
+                    "displayTimeUnit": "ms"}
+
+    def save(self, path):
+        with open(path, "w") as trace_file:
+            json.dump(self.to_dict(), trace_file)
+        logger.info("Trace with {} spans written to {}".format(len(self.events), path))
+
+
+class Profiler(object):
+    """
+    Writes a cProfile and a tracemalloc snapshot for every phase into
+    `directory`. Nested phases are accounted to the outermost one, and only
+    the thread running the phase is profiled by cProfile
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.phases = 0
+        self.current = None
+        self.profile = None
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def enter(self, name):
+        with self.lock:
+            if self.current is not None:
+                return False
+            self.current = name
+            self.phases += 1
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self.started_at = time.perf_counter()
+        import cProfile
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        return True
+
+    def exit(self, name):
+        self.profile.disable()
+        elapsed = time.perf_counter() - self.started_at
+        current, peak = tracemalloc.get_traced_memory()
+        prefix = os.path.join(self.directory, "{:02d}-{}".format(self.phases, re.sub(r"\W+", "_", name)))
+        self.profile.dump_stats(prefix + ".prof")
+        tracemalloc.take_snapshot().dump(prefix + ".tracemalloc")
+        logger.info("Profiled phase {}: {:.3f}s, {:.1f} MiB allocated, {:.1f} MiB peak, written to {}.*".format(
+            name, elapsed, current / 2 ** 20, peak / 2 ** 20, prefix))
+        with self.lock:
+            self.profile = None
+            self.current = None
+
+    def close(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+class Span(object):
+    __slots__ = ("name", "category", "tid", "args", "started_at", "profiled")
+
+    def __init__(self, name, category, tid, args):
+        self.name = name
+        self.category = category
+        self.tid = tid
+        self.args = args
+        self.profiled = None
+
+    def __enter__(self):
+        if _profiler is not None and self.category == PHASE and _profiler.enter(self.name):
+            self.profiled = _profiler
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        finished_at = time.perf_counter()
+        if _tracer is not None:
+            if exc_info[0] is not None:
+                self.args["error"] = repr(exc_info[1])
+            _tracer.record(self.name, self.category, self.started_at, finished_at, self.tid, self.args)
+        if self.profiled is not None:
+            self.profiled.exit(self.name)
+
+
+def span(name, category=PHASE, tid=None, **args):
+    """
+    time a block of code as a span of the active trace
+    :param category: `phase` spans are also profiled when profiling is active
+    :param tid: the track the span is drawn on, the current thread by default
+    :param args: details attached to the span, ie. the status of an API call
+    """
+    if _tracer is None and (_profiler is None or category != PHASE):
+        return NO_SPAN
+    return Span(name, category, tid, args)
+
+
+def active():
+    return _tracer is not None
+
+
+def record(name, category, started_at, finished_at, tid=None, **args):
+    """
+    add a span timed by the caller, ie. an API call already timed for the metrics
+    """
+    if _tracer is not None:
+        _tracer.record(name, category, started_at, finished_at, tid, args)
+
+
+@contextmanager
+def instrumented(trace_path=None, profile_path=None):
+    """
+    trace and/or profile the enclosed synchronisation
+    :param trace_path: where to write the JSON trace
+    :param profile_path: the directory where to write the per phase profiles
+    """
+    global _tracer, _profiler
+    _tracer = Tracer() if trace_path else None
+    _profiler = Profiler(profile_path) if profile_path else None
+    try:
+        yield
+    finally:
+        tracer, profiler = _tracer, _profiler
+        _tracer = _profiler = None
+        if tracer is not None:
+            tracer.save(trace_path)
+        if profiler is not None:
+            profiler.close()
@@ -0,0 +1,115 @@
+import requests
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import helper
+
+logger = helper.getLogger(__name__)
+
+DEFAULT_HEADERS = {
+    "Accept": "application/json",
+    "Accept-Encoding": "gzip",
+    "Connection": "keep-alive"
+}
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter applying a default (connect, read) timeout to every request
+    which does not specify its own
+    """
+
+    def __init__(self, timeout=None, **kwargs):
+        self.timeout = timeout
+        super(TimeoutHTTPAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super(TimeoutHTTPAdapter, self).send(request, **kwargs)
+
+
+class HTTP2Session(object):
+    """
+    Minimal requests-like session backed by an HTTP/2 capable httpx client,
+    multiplexing all the requests to the API over a single connection.
+    Requires the optional `httpx[http2]` dependency
+    """
+
+    def __init__(self, pool_size=10, timeout=None):
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError("The HTTP/2 transport requires httpx: pip install 'httpx[http2]'")
+        self.httpx = httpx
+        connect_timeout, read_timeout = timeout or (None, None)
+        self.client = httpx.Client(
+            http2=True,
+            headers=DEFAULT_HEADERS,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size))
+
+    @property
+    def headers(self):
+        return self.client.headers
+
+    def request(self, method, url, **kwargs):
+        try:
+            return self.client.request(method, url, **kwargs)
+        except self.httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(str(e))
+        except self.httpx.HTTPError as e:
+            raise requests.exceptions.ConnectionError(str(e))
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def close(self):
+        self.client.close()
+
+
+def create_adapter(pool_size=10, connect_timeout=None, read_timeout=None):
+    # connection failures happen before anything reaches the API and are
+    # always safe to retry, throttling is handled by the RequestScheduler
+    retries = Retry(total=None, connect=2, read=0, status=0, redirect=0)
+    return TimeoutHTTPAdapter(timeout=(connect_timeout, read_timeout),
+                              pool_connections=1,
+                              pool_maxsize=pool_size,
+                              max_retries=retries)
+
+
+def create_session(api_key, pool_size=10, connect_timeout=None, read_timeout=None, http2=False, wrap_adapter=None):
+    """
+    build the session used to talk to the newrelic API
+    :param pool_size: the number of pooled connections, it should match the number of workers
+    :param connect_timeout: connection timeout in seconds
+    :param read_timeout: read timeout in seconds
+    :param http2: use the HTTP/2 multiplexed backend instead of requests
+    :param wrap_adapter: optional callable wrapping the transport adapter, ie. to add caching
+    :return: a session
+    """
+    if http2:
+        session = HTTP2Session(pool_size=pool_size, timeout=(connect_timeout, read_timeout))
+        if wrap_adapter:
+            logger.info("Transport adapters are not supported by the HTTP/2 backend, ignoring them")
+    else:
+        session = requests.Session()
+        session.headers.update(DEFAULT_HEADERS)
+        adapter = create_adapter(pool_size, connect_timeout, read_timeout)
+        if wrap_adapter:
+            adapter = wrap_adapter(adapter)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+    session.headers.update({'X-Api-Key': api_key})
+    return session
@@ -63,7 +63,7 @@ setup(
     author="Claudio Benfatto",
     author_email="claudio.benfatto@springer.com",
     license='MIT',
-    packages=find_packages(exclude=['docs', 'test']),
+    packages=find_packages(exclude=['docs', 'test', 'tests', 'benchmarks']),
     download_url="https://github.com/SpringerPE/newrelic-alerts-manager/releases/tag/v" + find_version('newrelic_alerting/__init__.py'),
 
     # Include additional files into the package
@@ -99,4 +99,10 @@ setup(
 
     # Dependent packages (distributions)
     install_requires=find_requirements(),
+
+    # Optional dependencies
+    extras_require={
+        'http2': ['httpx[http2]'],
+        'asyncio': ['aiohttp'],
+    },
 )
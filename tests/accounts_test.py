@@ -0,0 +1,87 @@
+import os
+import unittest
+from unittest import mock
+from newrelic_alerting import accounts, run
+from newrelic_alerting.config import BaseConfig
+from newrelic_alerting.exceptions import NewRelicAlertingMissingConfVariable, InvalidConfiguration
+from benchmarks.stub_server import start_stub_account
+
+class Report(object):
+
+	def __init__(self, api_key):
+		self.api_key = api_key
+		self.failed = []
+
+	def to_dict(self):
+		return {"api_key": self.api_key}
+
+def synchronise(config):
+	if config["API_KEY"] == "broken":
+		raise Exception("invalid api key")
+	return Report(config["API_KEY"])
+
+def multi_account_config(*accounts_config):
+	config = dict(BaseConfig())
+	config["ALERT_CONFIG"] = {"accounts": list(accounts_config)}
+	return config
+
+class TestAccounts(unittest.TestCase):
+
+	@mock.patch.dict(os.environ, {"STAGING_NEWRELIC_KEY": "staging-key"})
+	def test_account_configs(self):
+		config = multi_account_config(
+			{"name": "production", "api_key": "prod-key", "alert_policies": [{"name": "LIVE", "tags": ["live"]}],
+			 "requests_per_minute": 600},
+			{"name": "staging", "api_key_env": "STAGING_NEWRELIC_KEY", "alert_policies": []})
+		config["SNAPSHOT_PATH"] = "/tmp/snapshot.json"
+
+		configs = dict(accounts.account_configs(config, {"REQUESTS_PER_MINUTE"}))
+
+		self.assertEqual(configs["production"]["API_KEY"], "prod-key")
+		self.assertEqual(configs["production"]["ALERT_CONFIG"], {"alert_policies": [{"name": "LIVE", "tags": ["live"]}]})
+		self.assertEqual(configs["production"]["REQUESTS_PER_MINUTE"], 600)
+		self.assertEqual(configs["production"]["SNAPSHOT_PATH"], "/tmp/snapshot.production.json")
+		self.assertEqual(configs["staging"]["API_KEY"], "staging-key")
+		self.assertIsNone(configs["staging"]["REQUESTS_PER_MINUTE"])
+
+	def test_invalid_account_configs(self):
+		with self.assertRaises(NewRelicAlertingMissingConfVariable):
+			accounts.account_configs(multi_account_config({"name": "a", "alert_policies": []}), set())
+		with self.assertRaises(InvalidConfiguration):
+			accounts.account_configs(multi_account_config(
+				{"name": "a", "api_key": "k", "alert_policies": [], "jobs": 2}), set())
+		with self.assertRaises(InvalidConfiguration):
+			accounts.account_configs(multi_account_config(
+				{"name": "a", "api_key": "k", "alert_policies": []},
+				{"name": "a", "api_key": "k", "alert_policies": []}), set())
+
+	def test_failures_are_isolated(self):
+		configs = [("a", {"API_KEY": "a-key"}), ("b", {"API_KEY": "broken"}), ("c", {"API_KEY": "c-key"})]
+
+		for pool in (accounts.THREADS, accounts.PROCESSES):
+			report = accounts.synchronise_accounts(configs, synchronise, jobs=2, pool=pool)
+
+			self.assertFalse(report)
+			self.assertEqual([result.name for result in report.succeeded], ["a", "c"])
+			self.assertEqual(report.failed[0].error, "invalid api key")
+			self.assertEqual(report.to_dict()["accounts"][2]["result"], {"api_key": "c-key"})
+
+	def test_redacted(self):
+		alert_config = {"accounts": [{"name": "a", "api_key": "secret", "alert_policies": []}]}
+		self.assertNotIn("secret", str(accounts.redacted(alert_config)))
+		self.assertEqual(alert_config["accounts"][0]["api_key"], "secret")
+
+	def test_run_synch_accounts(self):
+		account_settings = []
+		for seed in range(2):
+			_, account_config = start_stub_account(self, servers=30, policies=2, conditions=4, seed=seed)
+			alert_policies = account_config["ALERT_CONFIG"]["alert_policies"]
+			account_settings.append({"name": "account-{}".format(seed), "api_key": "key-{}".format(seed),
+									 "api_base_url": account_config["API_BASE_URL"], "alert_policies": alert_policies})
+		account_settings.append({"name": "unreachable", "api_key": "key", "api_base_url": "http://127.0.0.1:9/v2",
+								 "max_retries": 0, "alert_policies": alert_policies})
+		report = run.run_synch_accounts(multi_account_config(*account_settings))
+
+		self.assertEqual([result.name for result in report.succeeded], ["account-0", "account-1"])
+		self.assertEqual([result.name for result in report.failed], ["unreachable"])
+		self.assertGreater(report.results[0].result["total"], 0)
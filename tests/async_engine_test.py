@@ -0,0 +1,127 @@
+import asyncio
+import json
+import unittest
+
+try:
+	from newrelic_alerting import async_engine
+except ImportError:
+	async_engine = None
+
+policies_url = "https://api.newrelic.com/v2/alerts_policies.json"
+conditions_url = "https://api.newrelic.com/v2/alerts_conditions.json"
+servers_url = "https://api.newrelic.com/v2/servers.json"
+labels_url = "https://api.newrelic.com/v2/labels.json"
+
+listings = {
+	policies_url: {"policies": [{"id": 10, "name": "LIVE"}]},
+	conditions_url: {"conditions": [{"id": 100, "name": "CPU", "entities": ["3"]}]},
+	servers_url: {"servers": [
+		{"id": 1, "name": "web-1", "reporting": True, "last_reported_at": "2017-10-20T10:00:00+00:00"},
+		{"id": 3, "name": "old", "reporting": False, "last_reported_at": "2017-10-20T10:00:00+00:00"}
+	]},
+	labels_url: {"labels": [{"key": "Deployment:live-web", "links": {"servers": [1]}}]}
+}
+
+class FakeSession(object):
+
+	def __init__(self):
+		self.calls = []
+
+	async def request(self, method, url, params=None):
+		self.calls.append((method, url))
+		await asyncio.sleep(0)
+		body = listings.get(url, {}) if method == "GET" else {}
+		if url == servers_url and params == {"page": "2"}:
+			body = {"servers": []}
+		return async_engine.AsyncResponse(200, {}, json.dumps(body).encode("utf-8"))
+
+	async def get(self, url, params=None):
+		return await self.request("GET", url, params)
+
+	async def put(self, url, params=None):
+		return await self.request("PUT", url, params)
+
+	async def delete(self, url, params=None):
+		return await self.request("DELETE", url, params)
+
+class RawResponse(object):
+
+	def __init__(self, status, headers=None):
+		self.status = status
+		self.headers = headers or {}
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, *args):
+		pass
+
+	async def read(self):
+		return b"{}"
+
+class ThrottlingSession(object):
+
+	def __init__(self, statuses):
+		self.statuses = list(statuses)
+
+	def request(self, method, url, params=None):
+		return RawResponse(self.statuses.pop(0), {"Retry-After": "0"})
+
+@unittest.skipIf(async_engine is None, "aiohttp is not installed")
+class TestAsyncRequestScheduler(unittest.TestCase):
+
+	def test_throttling_halves_the_concurrency(self):
+		scheduler = async_engine.AsyncRequestScheduler(ThrottlingSession([429, 429, 200]), max_concurrency=8,
+													   backoff=0)
+
+		response = asyncio.run(scheduler.get(servers_url))
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(scheduler.concurrency.limit, 2.5)
+		self.assertEqual(scheduler.concurrency.in_flight, 0)
+
+	def test_gives_up_after_max_retries(self):
+		scheduler = async_engine.AsyncRequestScheduler(ThrottlingSession([503, 503]), max_retries=1, backoff=0)
+
+		self.assertEqual(asyncio.run(scheduler.get(servers_url)).status_code, 503)
+
+@unittest.skipIf(async_engine is None, "aiohttp is not installed")
+class TestAsyncEngine(unittest.TestCase):
+
+	def setUp(self):
+		self.session = FakeSession()
+		self.config = {
+			"ALERT_CONFIG": {"alert_policies": [{"name": "LIVE", "tags": ["live-web"]}]},
+			"SNAPSHOT_PATH": None,
+			"PLAN_ONLY": False
+		}
+		self.pdm = async_engine.AsyncPolicyDataManager(self.session)
+		self.sdm = async_engine.AsyncServersDataManager(self.session)
+		self.alert_manager = async_engine.AsyncNewRelicAlertManager(
+			self.config["ALERT_CONFIG"]["alert_policies"], self.pdm, self.sdm, jobs=4)
+
+	def test_reconcile(self):
+
+		async def synchronise():
+			inventory = await self.sdm.get_inventory()
+			return await async_engine.reconcile(self.config, self.alert_manager, inventory)
+
+		report = asyncio.run(synchronise())
+
+		self.assertEqual(len(report), 2)
+		self.assertTrue(report)
+		condition = self.alert_manager.alert_policies[0].cm.conditions[0]
+		self.assertEqual(condition.entities, {"1"})
+		self.assertIn(("PUT", "https://api.newrelic.com/v2/alerts_entity_conditions/1.json"), self.session.calls)
+		self.assertIn(("DELETE", "https://api.newrelic.com/v2/alerts_entity_conditions/3.json"), self.session.calls)
+
+	def test_cleanup_not_reporting_servers(self):
+		report = asyncio.run(self.alert_manager.cleanup_not_reporting_servers(1))
+
+		self.assertTrue(report)
+		self.assertEqual(len(report.deleted), 1)
+		self.assertIn(("DELETE", "https://api.newrelic.com/v2/servers/3.json"), self.session.calls)
+
+	def test_response_links(self):
+		response = async_engine.AsyncResponse(200, {"Link": '<https://x/s.json?page=2>; rel="next"'}, b"{}")
+		self.assertEqual(response.links["next"]["url"], "https://x/s.json?page=2")
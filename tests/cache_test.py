@@ -0,0 +1,64 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import requests
+import requests_mock
+from newrelic_alerting.cache import ResponseCache, CachingHTTPAdapter
+
+policies_url = "https://api.newrelic.com/v2/alerts_policies.json"
+
+class TestCachingHTTPAdapter(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.cache = ResponseCache(os.path.join(self.directory, "cache.db"), ttl=3600)
+		self.mock = requests_mock.Adapter()
+		self.session = requests.Session()
+		self.session.headers.update({"X-Api-Key": "key"})
+		self.session.mount("https://", CachingHTTPAdapter(self.cache, self.mock))
+
+	def tearDown(self):
+		self.cache.close()
+		shutil.rmtree(self.directory)
+
+	def revalidating(self, request, context):
+		if request.headers.get("If-None-Match") == '"v1"':
+			context.status_code = 304
+			return None
+		context.headers["ETag"] = '"v1"'
+		return {"policies": [{"id": 1}]}
+
+	def test_not_modified_served_from_cache(self):
+		self.mock.register_uri("GET", policies_url, json=self.revalidating)
+
+		first = self.session.get(policies_url, params={"page": 1})
+		second = self.session.get(policies_url, params={"page": 1})
+
+		self.assertEqual(self.mock.call_count, 2)
+		self.assertNotIn("If-None-Match", self.mock.request_history[0].headers)
+		self.assertEqual(self.mock.request_history[1].headers["If-None-Match"], '"v1"')
+		self.assertEqual(second.status_code, 200)
+		self.assertTrue(second.from_cache)
+		self.assertEqual(second.json(), first.json())
+
+	def test_expired_entries_are_evicted(self):
+		self.mock.register_uri("GET", policies_url, json=self.revalidating)
+		self.session.get(policies_url)
+		self.cache.ttl = -1
+
+		self.session.get(policies_url)
+
+		self.assertNotIn("If-None-Match", self.mock.request_history[1].headers)
+
+	def test_closing_the_session_closes_the_cache(self):
+		self.session.close()
+		with self.assertRaises(sqlite3.ProgrammingError):
+			self.cache.get("key")
+
+	def test_mutations_are_not_cached(self):
+		self.mock.register_uri("PUT", policies_url, json={}, headers={"ETag": '"v1"'})
+		self.session.put(policies_url)
+		self.session.put(policies_url)
+		self.assertNotIn("If-None-Match", self.mock.request_history[1].headers)
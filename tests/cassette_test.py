@@ -0,0 +1,116 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import requests
+import requests_mock
+
+from newrelic_alerting import run
+from newrelic_alerting.cassette import (Cassette, CassetteMiss, CassetteWriter, RecordingHTTPAdapter,
+										ReplayHTTPAdapter, wrap_adapter)
+from newrelic_alerting.config import BaseConfig
+from benchmarks.stub_server import start_stub_account
+
+servers_url = "https://api.newrelic.com/v2/servers.json"
+
+class TestCassette(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, "cassette.jsonl.gz")
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def record(self, *requests_sent):
+		mock = requests_mock.Adapter()
+		mock.register_uri("GET", servers_url, [{"json": {"servers": [{"id": 1}]}},
+											  {"json": {"servers": [{"id": 2}]}}])
+		mock.register_uri("DELETE", "https://api.newrelic.com/v2/servers/1.json", status_code=204)
+		session = requests.Session()
+		session.headers.update({"X-Api-Key": "secret"})
+		session.mount("https://", RecordingHTTPAdapter(CassetteWriter(self.path), mock))
+		for method, url, params in requests_sent:
+			session.request(method, url, params=params)
+		session.close()
+
+	def replay_session(self, latency=0.0, sleep=None):
+		session = requests.Session()
+		session.mount("https://", ReplayHTTPAdapter(Cassette.load(self.path), latency, sleep=sleep))
+		return session
+
+	def test_record(self):
+		self.record(("GET", servers_url, {"page": 1}))
+
+		with gzip.open(self.path, "rt") as cassette_file:
+			header, interaction = [json.loads(line) for line in cassette_file]
+		self.assertEqual(header["version"], 1)
+		self.assertEqual(interaction["url"], servers_url + "?page=1")
+		self.assertEqual(json.loads(interaction["body"]), {"servers": [{"id": 1}]})
+		self.assertGreaterEqual(interaction["duration"], 0)
+		self.assertNotIn("secret", json.dumps(interaction))
+
+	def test_cassette_opened_once_mounted(self):
+		config = dict(BaseConfig())
+		config.update(RECORD_PATH=self.path)
+		wrap = wrap_adapter(config)
+		self.assertFalse(os.path.exists(self.path))
+
+		adapter = wrap(requests_mock.Adapter())
+		self.assertTrue(os.path.exists(self.path))
+		adapter.close()
+
+	def test_replay_in_recorded_order(self):
+		self.record(("GET", servers_url, [("page", 1), ("filter[reported]", "true")]),
+					("GET", servers_url, [("page", 1), ("filter[reported]", "true")]),
+					("DELETE", "https://api.newrelic.com/v2/servers/1.json", None))
+		session = self.replay_session()
+
+		# the query parameters may come in any order
+		params = [("filter[reported]", "true"), ("page", 1)]
+		self.assertEqual(session.get(servers_url, params=params).json(), {"servers": [{"id": 1}]})
+		self.assertEqual(session.get(servers_url, params=params).json(), {"servers": [{"id": 2}]})
+		# exhausted interactions keep answering with the last response
+		self.assertEqual(session.get(servers_url, params=params).json(), {"servers": [{"id": 2}]})
+		self.assertEqual(session.delete("https://api.newrelic.com/v2/servers/1.json").status_code, 204)
+		with self.assertRaises(CassetteMiss):
+			session.get(servers_url, params={"page": 2})
+
+	def test_scaled_latency(self):
+		self.record(("GET", servers_url, None))
+		delays = []
+		self.replay_session(latency=2.0, sleep=delays.append).get(servers_url)
+		duration = Cassette.load(self.path).next("GET", servers_url)["duration"]
+		self.assertEqual(delays, [duration * 2.0])
+
+class TestRecordReplaySynchronisation(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.api, self.config = start_stub_account(self, page_size=10, servers=40, policies=2, conditions=4,
+												   stale=0.1, drift=0.2)
+		self.config.update(JOBS=4)
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_replay_offline(self):
+		cassette_path = os.path.join(self.directory, "sync.jsonl")
+		recorded = run.run_synch(dict(self.config, RECORD_PATH=cassette_path))
+		requests_served = self.api.requests
+
+		replayed = run.run_synch(dict(self.config, REPLAY_PATH=cassette_path))
+
+		self.assertEqual(self.api.requests, requests_served)
+
+		self.assertGreater(len(recorded), 0)
+		self.assertTrue(replayed)
+		self.assertEqual(sorted((result["action"], result["condition_id"], result["server_id"])
+								for result in replayed.to_dict()["results"]),
+						 sorted((result["action"], result["condition_id"], result["server_id"])
+								for result in recorded.to_dict()["results"]))
+
+if __name__ == '__main__':
+	unittest.main()
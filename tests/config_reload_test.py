@@ -0,0 +1,164 @@
+import os
+import shutil
+import tempfile
+import unittest
+import yaml
+from newrelic_alerting import run
+from newrelic_alerting.alert_manager import NewRelicAlertManager
+from newrelic_alerting.config import BaseConfig, load_alert_config
+from newrelic_alerting.config_reload import ConfigWatcher, reload_alert_config
+from newrelic_alerting.exceptions import InvalidConfiguration
+from newrelic_alerting.model_cache import ModelCache
+from newrelic_alerting.policy import PoliciesManager, diff_policies
+
+policies = [
+	{"name": "LIVE", "tags": ["live-web"]},
+	{"name": "WEB", "tags": ["dev-web"]},
+	{"name": "API", "selector": "Role:api"}
+]
+
+class MockPolicyDataManager(object):
+
+	def __init__(self):
+		self.fetched = []
+
+	def all_policies(self, params):
+		return [{"id": 10, "name": "LIVE"}, {"id": 20, "name": "WEB"}, {"id": 30, "name": "API"},
+				{"id": 40, "name": "DB"}]
+
+	def iter_conditions(self, params, record=None):
+		self.fetched.append(params["policy_id"])
+		return [{"id": params["policy_id"] * 10, "name": "CPU", "entities": []}]
+
+class TestPolicyDiff(unittest.TestCase):
+
+	def test_diff(self):
+		new_policies = [
+			{"name": "LIVE", "tags": ["live-web"]},
+			{"name": "API", "selector": "Role:api OR Role:web"},
+			{"name": "DB", "tags": ["db"]}
+		]
+		diff = diff_policies(policies, new_policies)
+		self.assertEqual(diff.to_dict(), {"added": ["DB"], "removed": ["WEB"], "changed": ["API"], "unchanged": 1})
+		self.assertTrue(diff)
+		self.assertFalse(diff_policies(policies, [dict(policy) for policy in policies]))
+
+	def test_reconfigure_only_initialises_added_and_changed_policies(self):
+		pdm = MockPolicyDataManager()
+		alert_manager = NewRelicAlertManager(None, policies, PoliciesManager(pdm), None)
+		alert_manager.initialise()
+		live = alert_manager.pm.alert_policies[0]
+		pdm.fetched = []
+
+		new_policies = [{"name": "DB", "tags": ["db"]}, policies[0], {"name": "WEB", "tags": ["dev-web", "qa-web"]}]
+		alert_manager.reconfigure(new_policies)
+
+		self.assertEqual(sorted(pdm.fetched), [20, 40])
+		self.assertEqual([policy.name for policy in alert_manager.pm.alert_policies], ["DB", "LIVE", "WEB"])
+		self.assertIs(alert_manager.pm.alert_policies[1], live)
+		self.assertEqual(alert_manager.pm.alert_policies[2].tags, {"dev-web", "qa-web"})
+		self.assertEqual(alert_manager.config, new_policies)
+
+	def test_invalid_policy_keeps_the_current_ones(self):
+		alert_manager = NewRelicAlertManager(None, policies, PoliciesManager(MockPolicyDataManager()), None)
+		alert_manager.initialise()
+		current = list(alert_manager.pm.alert_policies)
+
+		with self.assertRaises(InvalidConfiguration):
+			alert_manager.reconfigure([{"name": "LIVE"}])
+		self.assertEqual(alert_manager.pm.alert_policies, current)
+		self.assertEqual(alert_manager.config, policies)
+
+class TestReload(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, "alert_config.yml")
+		self.write({"alert_policies": policies})
+		self.config = dict(BaseConfig())
+		self.config.update(ALERT_CONFIG={"alert_policies": policies}, ALERT_CONFIG_PATH=self.path)
+		self.pdm = MockPolicyDataManager()
+		self.model_cache = ModelCache(lambda: (NewRelicAlertManager(
+			None, self.config["ALERT_CONFIG"]["alert_policies"], PoliciesManager(self.pdm), None), None))
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def write(self, alert_config):
+		with open(self.path, "w") as alert_config_file:
+			yaml.safe_dump(alert_config, alert_config_file)
+		# make sure the modification is visible even on coarse mtime filesystems
+		stat = os.stat(self.path)
+		os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+	def test_safe_loader(self):
+		self.assertEqual(load_alert_config("alert_policies: []"), {"alert_policies": []})
+		with self.assertRaises(yaml.YAMLError):
+			load_alert_config("!!python/object/apply:os.system ['true']")
+
+	def test_reload_updates_the_cached_model(self):
+		with self.model_cache.model():
+			pass
+		new_policies = policies[:2]
+
+		diff = reload_alert_config(self.config, self.model_cache, {"alert_policies": new_policies})
+
+		self.assertEqual(diff.to_dict()["removed"], ["API"])
+		self.assertEqual(self.config["ALERT_CONFIG"]["alert_policies"], new_policies)
+		with self.model_cache.model() as (alert_manager, _):
+			self.assertEqual([policy.name for policy in alert_manager.pm.alert_policies], ["LIVE", "WEB"])
+
+	def test_reload_rejects_invalid_configurations(self):
+		invalid_selector = {"alert_policies": [{"name": "WEB", "selector": "Role:web AND"}]}
+		for alert_config in [None, {"alert_policies": [{"tags": ["web"]}]}, {"accounts": []}, invalid_selector]:
+			with self.assertRaises(InvalidConfiguration):
+				reload_alert_config(self.config, self.model_cache, alert_config)
+		self.assertEqual(self.config["ALERT_CONFIG"]["alert_policies"], policies)
+
+	def test_watcher(self):
+		changes = []
+		watcher = ConfigWatcher(self.path, changes.append)
+		self.assertFalse(watcher.check())
+
+		self.write({"alert_policies": policies[:1]})
+		self.assertTrue(watcher.check())
+		self.assertFalse(watcher.check())
+		self.assertEqual(changes, [{"alert_policies": policies[:1]}])
+
+		with open(self.path, "w") as alert_config_file:
+			alert_config_file.write("alert_policies: [")
+		os.utime(self.path, ns=(0, os.stat(self.path).st_mtime_ns + 2 * 10 ** 9))
+		self.assertFalse(watcher.check())
+		self.assertEqual(len(changes), 1)
+
+	def test_reload_endpoint(self):
+		config = BaseConfig()
+		config.ALERT_CONFIG = {"alert_policies": policies}
+		config.ALERT_CONFIG_PATH = self.path
+		config.ALERT_CONFIG_POLL_INTERVAL = 0
+		app = run.create_app(config)
+		client = app.test_client()
+
+		self.write({"alert_policies": policies[:1]})
+		response = client.post("/api/config/reload")
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(app.config["ALERT_CONFIG"], {"alert_policies": policies[:1]})
+
+		with open(self.path, "w") as alert_config_file:
+			alert_config_file.write("alert_policies: [")
+		self.assertEqual(client.post("/api/config/reload").status_code, 400)
+		self.assertEqual(app.config["ALERT_CONFIG"], {"alert_policies": policies[:1]})
+
+	def test_reload_endpoint_ignores_the_request_body(self):
+		config = BaseConfig()
+		config.ALERT_CONFIG = {"alert_policies": policies}
+		app = run.create_app(config)
+		client = app.test_client()
+
+		body = "accounts:\n  - name: x\n    api_key_env: SECRET\n    api_base_url: http://attacker\n"
+		self.assertEqual(client.post("/api/config/reload", data=body).status_code, 400)
+		self.assertEqual(client.post("/api/config/reload").status_code, 400)
+		self.assertEqual(app.config["ALERT_CONFIG"], {"alert_policies": policies})
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,55 @@
+import os
+import unittest
+from unittest import mock
+from newrelic_alerting.config import AppConfig, env_flag, validate_alert_config
+from newrelic_alerting.exceptions import InvalidConfiguration
+
+class TestEnvFlag(unittest.TestCase):
+
+	def test_true_values(self):
+		for value in ("1", "true", "True", "yes", " YES "):
+			with mock.patch.dict(os.environ, {"ALERT_MANAGER_PLAN_ONLY": value}):
+				self.assertTrue(env_flag("ALERT_MANAGER_PLAN_ONLY"))
+
+	def test_false_values(self):
+		for value in ("", "0", "false", "False", "no"):
+			with mock.patch.dict(os.environ, {"ALERT_MANAGER_PLAN_ONLY": value}):
+				self.assertFalse(env_flag("ALERT_MANAGER_PLAN_ONLY"))
+
+	def test_default(self):
+		with mock.patch.dict(os.environ, clear=True):
+			self.assertFalse(env_flag("ALERT_MANAGER_PLAN_ONLY"))
+			self.assertTrue(env_flag("ALERT_MANAGER_PLAN_ONLY", default=True))
+
+class TestAppConfig(unittest.TestCase):
+
+	def test_false_flags_stay_disabled(self):
+		environ = {"NEWRELIC_API_KEY": "key", "ALERT_CONFIG": "alert_policies: []",
+				   "ALERT_MANAGER_PLAN_ONLY": "false", "ALERT_MANAGER_HTTP2": "0"}
+		with mock.patch.dict(os.environ, environ, clear=True):
+			config = AppConfig()
+			config.load_app_config()
+		self.assertFalse(config.PLAN_ONLY)
+		self.assertFalse(config.HTTP2)
+
+	def test_recording_requires_http1(self):
+		environ = {"NEWRELIC_API_KEY": "key", "ALERT_CONFIG": "alert_policies: []",
+				   "ALERT_MANAGER_RECORD_PATH": "cassette.jsonl", "ALERT_MANAGER_HTTP2": "true"}
+		with mock.patch.dict(os.environ, environ, clear=True):
+			with self.assertRaises(InvalidConfiguration):
+				AppConfig().load_app_config()
+
+class TestValidateAlertConfig(unittest.TestCase):
+
+	def test_selectors_are_compiled(self):
+		validate_alert_config({"alert_policies": [{"name": "WEB", "tags": ["live-web"], "selector": "Role:web"}]})
+		with self.assertRaises(InvalidConfiguration):
+			validate_alert_config({"alert_policies": [{"name": "WEB", "selector": "Role:web) OR (Role:api"}]})
+
+	def test_account_selectors_are_compiled(self):
+		alert_config = {"accounts": [{"name": "production", "alert_policies": [{"name": "WEB", "selector": "Role:"}]}]}
+		with self.assertRaises(InvalidConfiguration):
+			validate_alert_config(alert_config)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,155 @@
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+import unittest
+
+from newrelic_alerting import run, metrics
+from newrelic_alerting.accounts import AccountsReport, AccountResult
+from newrelic_alerting.daemon import Daemon, IntervalSchedule, observed_changes, cycle_paths
+from newrelic_alerting.exceptions import InvalidConfiguration
+from benchmarks.stub_server import start_stub_account
+
+class TestIntervalSchedule(unittest.TestCase):
+
+	def test_adapts_to_the_changes(self):
+		schedule = IntervalSchedule(60, jitter=0.1, uniform=lambda low, high: high)
+		self.assertAlmostEqual(schedule.first_delay(), 6)
+		self.assertAlmostEqual(schedule.next_delay(), 66)
+
+		schedule.observe(12)
+		self.assertEqual(schedule.current, 30)
+		for _ in range(5):
+			schedule.observe(1)
+		self.assertEqual(schedule.current, 15)
+
+		schedule.observe(None)
+		self.assertEqual(schedule.current, 15)
+		for _ in range(10):
+			schedule.observe(0)
+		self.assertEqual(schedule.current, 240)
+
+	def test_invalid_intervals(self):
+		with self.assertRaises(InvalidConfiguration):
+			IntervalSchedule(0)
+		with self.assertRaises(InvalidConfiguration):
+			IntervalSchedule(60, min_interval=120)
+
+	def test_cycle_paths(self):
+		self.assertEqual(cycle_paths("trace.json", "profiles", 3), ("trace.0003.json", os.path.join("profiles", "0003")))
+		self.assertEqual(cycle_paths(None, None, 3), (None, None))
+
+	def test_observed_changes(self):
+		report = AccountsReport([AccountResult("a", {"total": 3}, True), AccountResult("b", {"operations": 2}, True),
+								 AccountResult("c", error="failed")])
+		self.assertEqual(observed_changes(report), 5)
+		self.assertEqual(observed_changes([1, 2]), 2)
+
+class TestDaemon(unittest.TestCase):
+
+	def schedule(self):
+		return IntervalSchedule(0.01, jitter=0)
+
+	def test_runs_until_stopped(self):
+		changes = [4, ValueError("API down"), 0]
+
+		def cycle():
+			change = changes.pop(0)
+			if not changes:
+				daemon.stop()
+			if isinstance(change, Exception):
+				raise change
+			return change
+
+		daemon = Daemon(cycle, self.schedule())
+		daemon.run()
+
+		self.assertEqual(daemon.cycles, 3)
+		self.assertAlmostEqual(daemon.schedule.current, 0.0075)
+
+	def test_sigterm_completes_the_running_cycle(self):
+		completed = []
+
+		def cycle():
+			os.kill(os.getpid(), signal.SIGTERM)
+			completed.append(True)
+			return 0
+
+		previous = signal.getsignal(signal.SIGTERM)
+		daemon = Daemon(cycle, self.schedule())
+		daemon.run()
+
+		self.assertEqual(completed, [True])
+		self.assertIs(signal.getsignal(signal.SIGTERM), previous)
+
+class TestRunDaemon(unittest.TestCase):
+
+	def setUp(self):
+		self.api, self.config = start_stub_account(self, page_size=10, servers=30, policies=2, conditions=4,
+												   stale=0.1, drift=0.2)
+		self.config.update(JOBS=2)
+
+	def test_model_stays_warm_between_cycles(self):
+		syncs = metrics.SYNCS.get("account", "succeeded")
+
+		def stop_after_three_cycles():
+			while metrics.SYNCS.get("account", "succeeded") < syncs + 3:
+				time.sleep(0.01)
+			os.kill(os.getpid(), signal.SIGTERM)
+
+		stopper = threading.Thread(target=stop_after_three_cycles, daemon=True)
+		stopper.start()
+		daemon = run.run_daemon(self.config, IntervalSchedule(0.05, jitter=0))
+		stopper.join()
+
+		self.assertGreaterEqual(daemon.cycles, 3)
+		# the policies and their conditions were only fetched by the first cycle
+		calls = self.api.stats()["calls"]
+		self.assertEqual(calls["GET alerts_policies"], 1)
+		self.assertEqual(calls["GET alerts_conditions"], 2)
+		self.assertGreaterEqual(calls["GET labels"], daemon.cycles)
+
+	def test_model_outlives_the_default_interval(self):
+		# converge first, so that the pause grows after the first daemon cycle
+		run.run_synch(self.config)
+		policies_fetched = self.api.stats()["calls"]["GET alerts_policies"]
+		# the default interval and model TTL, scaled down
+		self.config.update(MODEL_CACHE_TTL=0.5)
+		syncs = metrics.SYNCS.get("account", "succeeded")
+
+		def stop_after_two_cycles():
+			while metrics.SYNCS.get("account", "succeeded") < syncs + 2:
+				time.sleep(0.005)
+			os.kill(os.getpid(), signal.SIGTERM)
+
+		stopper = threading.Thread(target=stop_after_two_cycles, daemon=True)
+		stopper.start()
+		daemon = run.run_daemon(self.config, IntervalSchedule(0.5))
+		stopper.join()
+
+		self.assertEqual(daemon.cycles, 2)
+		self.assertEqual(self.api.stats()["calls"]["GET alerts_policies"], policies_fetched + 1)
+
+	def test_every_cycle_is_traced_on_its_own(self):
+		directory = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, directory)
+		trace_path = os.path.join(directory, "trace.json")
+		syncs = metrics.SYNCS.get("account", "succeeded")
+
+		def stop_after_two_cycles():
+			while metrics.SYNCS.get("account", "succeeded") < syncs + 2:
+				time.sleep(0.01)
+			os.kill(os.getpid(), signal.SIGTERM)
+
+		stopper = threading.Thread(target=stop_after_two_cycles, daemon=True)
+		stopper.start()
+		daemon = run.run_daemon(self.config, IntervalSchedule(0.05, jitter=0), trace_path=trace_path)
+		stopper.join()
+
+		traces = sorted(name for name in os.listdir(directory))
+		self.assertEqual(traces, ["trace.{:04d}.json".format(cycle) for cycle in range(1, daemon.cycles + 1)])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,35 @@
+import random
+import unittest
+from newrelic_alerting.entity_set import EntitySet, keep_ids
+
+class TestEntitySet(unittest.TestCase):
+
+	def test_integer_ids(self):
+		entities = EntitySet(["3", "1", "2", "3"])
+		self.assertEqual(list(entities), [1, 2, 3])
+		self.assertIn(1, entities)
+		self.assertIn("2", entities)
+		self.assertNotIn(4, entities)
+		self.assertNotIn("web", entities)
+		self.assertEqual(entities, {"1", "2", "3"})
+		self.assertEqual(entities, {1, 2, 3})
+		self.assertNotEqual(entities, {1, 2})
+
+	def test_add_discard(self):
+		entities = EntitySet()
+		for server_id in [5, "2", 9, 2]:
+			entities.add(server_id)
+		entities.discard("9")
+		entities.discard(7)
+		self.assertEqual(list(entities), [2, 5])
+		self.assertEqual(len(entities), 2)
+
+	def test_difference(self):
+		ids = random.Random(0).sample(range(10 ** 9), 1000)
+		entities = EntitySet(map(str, ids))
+		keep = keep_ids({"id": server_id} for server_id in ids[::3])
+		self.assertEqual(entities.difference(keep), set(ids) - keep)
+		self.assertEqual(entities - {str(server_id) for server_id in ids[::2]}, set(ids) - set(ids[::2]))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import threading
+from newrelic_alerting.policy import Condition
+from newrelic_alerting.executor import Mutation, MutationExecutor, MutationReport
+from newrelic_alerting.server import CleanupReport, CleanupResult
+
+servers = [{"id": server_id, "name": "server-{}".format(server_id)} for server_id in range(1, 51)]
+
+class MockPolicyDataManager(object):
+
+	def __init__(self, failing=None):
+		self.failing = failing or set()
+		self.lock = threading.Lock()
+		self.calls = []
+
+	def register_server(self, server, condition_id):
+		with self.lock:
+			self.calls.append(("add", server["id"], condition_id))
+		return server["id"] not in self.failing
+
+	def deregister_server(self, server_id, condition_id):
+		with self.lock:
+			self.calls.append(("remove", server_id, condition_id))
+		if int(server_id) in self.failing:
+			raise ValueError("boom")
+		return True
+
+class TestMutationExecutor(unittest.TestCase):
+
+	def setUp(self):
+		self.pdm = MockPolicyDataManager(failing={7, 42})
+		self.condition = Condition(self.pdm, {"id": 1, "name": "CPU", "entities": ["100", "42"]})
+
+	def test_parallel_register_and_deregister(self):
+		mutations = [self.condition.register_mutation(server) for server in servers]
+		mutations = [mutation for mutation in mutations if mutation]
+		mutations.extend(self.condition.deregister_mutations(servers))
+
+		report = MutationExecutor(self.pdm, jobs=8).execute(mutations)
+
+		self.assertEqual(len(report), 50)
+		self.assertEqual(len(self.pdm.calls), 50)
+		self.assertEqual(len(report.failed), 1)
+		self.assertFalse(report)
+		self.assertNotIn("100", self.condition.entities)
+		self.assertIn("1", self.condition.entities)
+		self.assertNotIn("7", self.condition.entities)
+		self.assertIn("42", self.condition.entities)
+
+	def test_already_registered_server_yields_no_mutation(self):
+		self.assertIsNone(self.condition.register_mutation({"id": 100, "name": "server-100"}))
+
+	def test_report_to_dict(self):
+		report = MutationExecutor(self.pdm).execute([Mutation.add(self.condition, servers[6])])
+		report_dict = report.to_dict()
+		self.assertEqual(report_dict["failed"], 1)
+		self.assertEqual(report_dict["results"][0]["server_id"], 7)
+
+	def test_failed_deletions_fail_the_report(self):
+		server = {"id": 3, "name": "server-3", "last_reported_at": "2020-01-01T00:00:00+00:00"}
+		report = MutationReport(cleanup=CleanupReport([CleanupResult(server, True)]))
+		self.assertTrue(report)
+		report.cleanup.results.append(CleanupResult(server, False, "403 Forbidden"))
+		self.assertFalse(report)
+
+		with self.assertLogs("newrelic_alerting.helper", "ERROR") as logs:
+			report.log_failures()
+		self.assertIn("Failed to delete the stale server server-3: 403 Forbidden", logs.output[0])
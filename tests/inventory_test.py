@@ -0,0 +1,96 @@
+import unittest
+from newrelic_alerting.inventory import ServerInventory
+from newrelic_alerting.label_selector import compile_selector
+from newrelic_alerting.server import ServersManager
+from newrelic_alerting.policy import PoliciesManager
+from newrelic_alerting.alert_manager import NewRelicAlertManager
+
+all_servers = [
+	{"id": 1, "name": "live-web-1"},
+	{"id": 2, "name": "live-backend-1"},
+	{"id": 3, "name": "dev-web-1"},
+	{"id": 4, "name": "unlabelled"}
+]
+
+all_labels = [
+	{"key": "Deployment:live-web", "category": "Deployment", "name": "live-web", "links": {"servers": [1]}},
+	{"key": "Deployment:live-backend", "category": "Deployment", "name": "live-backend", "links": {"servers": [2, 99]}},
+	{"key": "Deployment:dev-web", "category": "Deployment", "name": "dev-web", "links": {"servers": [3]}},
+	{"key": "Role:web", "category": "Role", "name": "web", "links": {"servers": [1, 3]}}
+]
+
+class MockServersDataManager(object):
+
+	def __init__(self):
+		self.calls = 0
+
+	def iter_servers(self, params, record=None):
+		self.calls += 1
+		return iter(all_servers)
+
+	def get_labels(self, params):
+		self.calls += 1
+		return all_labels
+
+class MockPolicyDataManager(object):
+
+	def all_policies(self, params):
+		return [{"id": 10, "name": "LIVE"}, {"id": 20, "name": "WEB"}]
+
+	def iter_conditions(self, params, record=None):
+		return [{"id": params["policy_id"] * 10, "name": "CPU", "entities": ["3"]}]
+
+	def register_server(self, server, condition_id):
+		return True
+
+	def deregister_server(self, server_id, condition_id):
+		return True
+
+class TestServerInventory(unittest.TestCase):
+
+	def setUp(self):
+		self.inventory = ServerInventory(all_servers, all_labels)
+
+	def test_server_ids_for_selector(self):
+		selector = compile_selector("Deployment:live-web OR Deployment:live-backend")
+		self.assertEqual(sorted(self.inventory.server_ids_for_selector(selector)), [1, 2])
+
+	def test_unknown_servers_and_labels_are_ignored(self):
+		self.assertEqual(self.inventory.label_index["Deployment:live-backend"], {2})
+		self.assertEqual(list(self.inventory.server_ids_for_selector(compile_selector("Deployment:missing"))), [])
+
+class TestAssignServersToPolicies(unittest.TestCase):
+
+	def test_inventory_fetched_once(self):
+		sdm = MockServersDataManager()
+		pm = PoliciesManager(MockPolicyDataManager())
+		config = [
+			{"name": "LIVE", "tags": ["live-web", "live-backend"]},
+			{"name": "WEB", "tags": ["live-web", "dev-web"]}
+		]
+		alert_manager = NewRelicAlertManager(None, config, pm, ServersManager(sdm))
+		alert_manager.initialise()
+
+		report = alert_manager.assign_servers_to_policies()
+
+		self.assertEqual(sdm.calls, 2)
+		self.assertTrue(report)
+		self.assertEqual(pm.alert_policies[0].cm.conditions[0].entities, {"1", "2"})
+		self.assertEqual(pm.alert_policies[1].cm.conditions[0].entities, {"1", "3"})
+
+	def test_plan_server(self):
+		pm = PoliciesManager(MockPolicyDataManager())
+		config = [
+			{"name": "LIVE", "tags": ["live-web", "live-backend"]},
+			{"name": "WEB", "tags": ["dev-web"]}
+		]
+		alert_manager = NewRelicAlertManager(None, config, pm, ServersManager(MockServersDataManager()))
+		alert_manager.initialise()
+
+		plan = alert_manager.plan_server({"id": 3, "name": "dev-web-1"}, {"Deployment:live-web", "Role:web"})
+
+		# already attached to the LIVE condition, only detached from the WEB one
+		self.assertEqual(len(plan), 1)
+		web = plan.to_dict()["conditions"][0]
+		self.assertEqual(web["condition_id"], 200)
+		self.assertEqual(web["remove"], [3])
@@ -0,0 +1,98 @@
+import threading
+import unittest
+from newrelic_alerting.config import BaseConfig
+from newrelic_alerting.jobs import Job, JobQueue
+from newrelic_alerting.executor import MutationReport
+from newrelic_alerting.planner import ReconciliationPlan
+from newrelic_alerting.server import CleanupReport, CleanupResult
+from newrelic_alerting import run
+
+class BlockingTarget(object):
+
+	def __init__(self):
+		self.started = threading.Event()
+		self.release = threading.Event()
+		self.calls = 0
+
+	def __call__(self):
+		self.calls += 1
+		self.started.set()
+		self.release.wait(5)
+		return {"calls": self.calls}
+
+def wait_for(job):
+	for _ in range(500):
+		if job.status in (Job.SUCCEEDED, Job.FAILED):
+			return
+		threading.Event().wait(0.01)
+
+class TestJobQueue(unittest.TestCase):
+
+	def test_triggers_are_coalesced(self):
+		target = BlockingTarget()
+		queue = JobQueue(target)
+
+		running = queue.submit()
+		target.started.wait(5)
+		next_job = queue.submit()
+		merged = queue.submit()
+		target.release.set()
+		wait_for(next_job)
+
+		self.assertIsNot(running, next_job)
+		self.assertIs(next_job, merged)
+		self.assertEqual(next_job.triggers, 2)
+		self.assertEqual(target.calls, 2)
+		self.assertEqual(next_job.status, Job.SUCCEEDED)
+		self.assertEqual(next_job.result, {"calls": 2})
+
+	def test_failed_job(self):
+		def fail():
+			raise Exception("New Relic API key cannot be empty")
+
+		job = JobQueue(fail).submit()
+		wait_for(job)
+
+		self.assertEqual(job.status, Job.FAILED)
+		self.assertEqual(job.error, "New Relic API key cannot be empty")
+
+	def test_failed_deletions_fail_the_job(self):
+		server = {"id": 3, "name": "server-3", "last_reported_at": "2020-01-01T00:00:00+00:00"}
+		report = MutationReport(cleanup=CleanupReport([CleanupResult(server, False, "403 Forbidden")]))
+
+		job = JobQueue(lambda: report).submit()
+		wait_for(job)
+
+		self.assertEqual(job.status, Job.FAILED)
+		self.assertEqual(job.result["cleanup"]["failed"], 1)
+
+	def test_empty_plan_succeeds(self):
+		job = JobQueue(ReconciliationPlan).submit()
+		wait_for(job)
+
+		self.assertEqual(job.status, Job.SUCCEEDED)
+		self.assertEqual(job.result["operations"], 0)
+
+class TestSynchroniseEndpoint(unittest.TestCase):
+
+	def setUp(self):
+		self.app = run.create_app(BaseConfig())
+		self.target = BlockingTarget()
+		self.target.release.set()
+		self.app.extensions["sync_jobs"] = JobQueue(self.target)
+		self.client = self.app.test_client()
+
+	def test_synchronise_returns_a_job(self):
+		response = self.client.post("/api/synchronise")
+
+		self.assertEqual(response.status_code, 202)
+		job_id = response.get_json()["job_id"]
+		self.assertTrue(response.headers["Location"].endswith("/api/jobs/" + job_id))
+		wait_for(self.app.extensions["sync_jobs"].get(job_id))
+
+		status = self.client.get("/api/jobs/" + job_id)
+		self.assertEqual(status.status_code, 200)
+		self.assertEqual(status.get_json()["status"], Job.SUCCEEDED)
+
+	def test_unknown_job(self):
+		self.assertEqual(self.client.get("/api/jobs/missing").status_code, 404)
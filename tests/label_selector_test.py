@@ -0,0 +1,76 @@
+import random
+import unittest
+from newrelic_alerting.exceptions import InvalidConfiguration
+from newrelic_alerting.inventory import ServerInventory
+from newrelic_alerting.label_selector import compile_selector, policy_selector, LabelBitsets
+
+labels = [
+	{"key": "Deployment:live-web", "links": {"servers": [1, 2]}},
+	{"key": "Deployment:dev-web", "links": {"servers": [3]}},
+	{"key": "Role:web", "links": {"servers": [1, 3]}},
+	{"key": "Role:api", "links": {"servers": [2]}},
+	{"key": "Team:Platform Engineering", "links": {"servers": [2, 4]}}
+]
+
+servers = [{"id": server_id, "name": "server-{}".format(server_id)} for server_id in range(1, 6)]
+
+class TestLabelSelector(unittest.TestCase):
+
+	def setUp(self):
+		self.inventory = ServerInventory(servers, labels)
+
+	def select(self, expression):
+		return sorted(self.inventory.server_ids_for_selector(compile_selector(expression)))
+
+	def test_operators(self):
+		self.assertEqual(self.select("Deployment:live-web"), [1, 2])
+		self.assertEqual(self.select("Deployment:live-web AND Role:web"), [1])
+		self.assertEqual(self.select("Deployment:dev-web or Role:api"), [2, 3])
+		self.assertEqual(self.select("NOT Role:web"), [2, 4, 5])
+		self.assertEqual(self.select("Role:* AND NOT Deployment:*"), [])
+		self.assertEqual(self.select('"Team:Platform Engineering" AND NOT Role:*'), [4])
+		self.assertEqual(self.select("Deployment:missing"), [])
+
+	def test_precedence(self):
+		self.assertEqual(self.select("Role:api OR Deployment:live-web AND Role:web"), [1, 2])
+		self.assertEqual(self.select("(Role:api OR Deployment:live-web) AND Role:web"), [1])
+		self.assertEqual(self.select("NOT NOT Role:api"), [2])
+
+	def test_invalid_selectors(self):
+		for expression in ("", "Role:web AND", "(Role:web", "Role:web)", "web", "Role:web Role:api", "AND Role:web"):
+			with self.assertRaises(InvalidConfiguration, msg=expression):
+				compile_selector(expression)
+
+	def test_matches(self):
+		selector = compile_selector("Deployment:live-web AND NOT (Role:web OR Team:*)")
+
+		self.assertFalse(selector.matches({"Deployment:live-web", "Role:web"}))
+		self.assertTrue(selector.matches({"Deployment:live-web", "Role:api"}))
+		self.assertFalse(selector.matches({"Deployment:live-web", "Team:Platform Engineering"}))
+
+	def test_bitsets_agree_with_matches(self):
+		rng = random.Random(7)
+		keys = ["Deployment:d{}".format(index) for index in range(5)] + ["Role:r{}".format(index) for index in range(3)]
+		server_labels = {server_id: set(rng.sample(keys, rng.randint(0, 3))) for server_id in range(1000, 1300)}
+		label_index = {key: set(server_id for server_id, keys in server_labels.items() if key in keys) for key in keys}
+		bitsets = LabelBitsets(server_labels, label_index)
+		selector = compile_selector("(Deployment:d1 OR Deployment:d2) AND NOT Role:r0 OR Role:* AND NOT Deployment:*")
+
+		self.assertEqual(sorted(bitsets.server_ids_for(selector.evaluate(bitsets))),
+						 sorted(server_id for server_id, keys in server_labels.items() if selector.matches(keys)))
+
+	def test_policy_selector(self):
+		self.assertIsNone(policy_selector([]))
+		self.assertEqual(str(policy_selector(["live-web", "dev web"], "Role:api")),
+						 '"Deployment:dev web" OR Deployment:live-web OR (Role:api)')
+		self.assertEqual(str(policy_selector([], "Role:api")), "Role:api")
+		with self.assertRaises(InvalidConfiguration):
+			policy_selector(['live "web"'])
+
+	def test_policy_selector_is_parsed_on_its_own(self):
+		with self.assertRaises(InvalidConfiguration) as context:
+			policy_selector((), "A:x) OR (B:y")
+		self.assertIn("'A:x) OR (B:y'", str(context.exception))
+		with self.assertRaises(InvalidConfiguration) as context:
+			policy_selector(["live-web"], "A:x OR")
+		self.assertIn("'A:x OR'", str(context.exception))
@@ -0,0 +1,69 @@
+import unittest
+from newrelic_alerting import metrics
+from newrelic_alerting.config import BaseConfig
+from newrelic_alerting.run import create_app
+
+class Report(object):
+
+	def __init__(self, failed):
+		self.failed = failed
+
+class TestMetrics(unittest.TestCase):
+
+	def setUp(self):
+		self.registry = metrics.Registry()
+
+	def test_render(self):
+		counter = self.registry.counter("calls_total", "API calls", ("endpoint", "status"))
+		histogram = self.registry.histogram("latency_seconds", "API latency", ("endpoint",), buckets=(0.1, 1))
+		counter.inc("servers", "200")
+		counter.inc("servers", "200")
+		histogram.observe("servers", value=0.05)
+		histogram.observe("servers", value=0.5)
+		histogram.observe("servers", value=5)
+
+		self.assertEqual(self.registry.render().splitlines(), [
+			'# HELP calls_total API calls',
+			'# TYPE calls_total counter',
+			'calls_total{endpoint="servers",status="200"} 2',
+			'# HELP latency_seconds API latency',
+			'# TYPE latency_seconds histogram',
+			'latency_seconds_bucket{endpoint="servers",le="0.1"} 1',
+			'latency_seconds_bucket{endpoint="servers",le="1"} 2',
+			'latency_seconds_bucket{endpoint="servers",le="+Inf"} 3',
+			'latency_seconds_sum{endpoint="servers"} 5.55',
+			'latency_seconds_count{endpoint="servers"} 3'
+		])
+
+	def test_label_values_are_escaped(self):
+		gauge = self.registry.gauge("policy", "Policy", ("name",))
+		gauge.set('Alert "LIVE"\\web', value=1)
+
+		self.assertIn('policy{name="Alert \\"LIVE\\"\\\\web"} 1', self.registry.render())
+
+	def test_endpoint_name(self):
+		self.assertEqual(metrics.endpoint_name("https://api.newrelic.com/v2/servers.json?page=2"), "servers")
+		self.assertEqual(metrics.endpoint_name("https://api.newrelic.com/v2/alerts_entity_conditions/42.json"),
+						 "alerts_entity_conditions/{id}")
+
+	def test_timed_sync(self):
+		synchronise = metrics.timed_sync("test")(lambda failed: Report(failed))
+		succeeded = metrics.SYNCS.get("test", "succeeded")
+
+		synchronise([])
+		synchronise(["failure"])
+
+		self.assertEqual(metrics.SYNCS.get("test", "succeeded"), succeeded + 1)
+		self.assertEqual(metrics.SYNCS.get("test", "failed"), 1)
+		self.assertIsNotNone(metrics.SYNC_LAST_SUCCESS.get("test"))
+		self.assertEqual(metrics.SYNC_DURATION.count("test"), 2)
+
+	def test_metrics_endpoint(self):
+		metrics.observe_request("GET", "https://api.newrelic.com/v2/labels.json", None, 0.2)
+
+		response = create_app(BaseConfig()).test_client().get("/metrics")
+
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(response.content_type.startswith("text/plain; version=0.0.4"))
+		self.assertIn(b'newrelic_alerting_api_responses_total{method="GET",endpoint="labels",status="error"}',
+					  response.data)
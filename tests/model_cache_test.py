@@ -0,0 +1,77 @@
+import threading
+import unittest
+from newrelic_alerting.model_cache import ModelCache
+
+class FakeClock(object):
+
+	def __init__(self):
+		self.now = 0.0
+
+	def __call__(self):
+		return self.now
+
+class FakePoliciesManager(object):
+
+	def __init__(self):
+		self.alert_policies = []
+
+class FakeAlertManager(object):
+
+	def __init__(self):
+		self.pm = FakePoliciesManager()
+		self.initialisations = 0
+
+	def initialise(self):
+		self.initialisations += 1
+
+class TestModelCache(unittest.TestCase):
+
+	def setUp(self):
+		self.builds = 0
+		self.clock = FakeClock()
+		self.cache = ModelCache(self.build, ttl=60, clock=self.clock)
+
+	def build(self):
+		self.builds += 1
+		return FakeAlertManager(), None
+
+	def test_model_is_reused_until_expired(self):
+		with self.cache.model() as (alert_manager, _):
+			pass
+		self.clock.now = 59
+		with self.cache.model() as (same_alert_manager, _):
+			self.assertIs(same_alert_manager, alert_manager)
+		self.assertEqual(alert_manager.initialisations, 1)
+
+		self.clock.now = 121
+		with self.cache.model():
+			pass
+
+		self.assertEqual(self.builds, 1)
+		self.assertEqual(alert_manager.initialisations, 2)
+
+	def test_invalidate(self):
+		with self.cache.model() as (alert_manager, _):
+			pass
+		self.cache.invalidate()
+		with self.cache.model():
+			pass
+		self.assertEqual(alert_manager.initialisations, 2)
+
+	def test_model_is_not_locked_during_a_synchronisation(self):
+		acquired = []
+
+		def targeted_synchronisation():
+			with self.cache.model() as (alert_manager, _):
+				acquired.append(alert_manager)
+
+		with self.cache.model() as (alert_manager, _):
+			thread = threading.Thread(target=targeted_synchronisation)
+			thread.start()
+			thread.join(5)
+			self.assertEqual(acquired, [alert_manager])
+
+	def test_warm(self):
+		self.cache.warm().join(5)
+		self.assertFalse(self.cache.expired)
+		self.assertEqual(self.builds, 1)
@@ -0,0 +1,75 @@
+import unittest
+import requests
+import requests_mock
+from newrelic_alerting import pagination
+from newrelic_alerting.exceptions import PaginationError
+from newrelic_alerting.records import ServerRecord
+
+servers_url = "https://api.newrelic.com/v2/servers.json"
+
+def page_link(page, rel):
+	return '<{url}?filter%5Breported%5D=false&page={page}>; rel="{rel}"'.format(url=servers_url, page=page, rel=rel)
+
+def register_pages(m, last_page, with_last=True):
+	for page in range(1, last_page + 1):
+		links = []
+		if page < last_page:
+			links.append(page_link(page + 1, "next"))
+			if with_last:
+				links.append(page_link(last_page, "last"))
+		url = servers_url + ("" if page == 1 else "?page={}".format(page))
+		m.get(url, json={"servers": [{"id": page}]}, headers={"Link": ", ".join(links)})
+
+class TestPages(unittest.TestCase):
+
+	def setUp(self):
+		self.session = requests.Session()
+
+	def page_ids(self, prefetch):
+		return [response.json()["servers"][0]["id"] for response in
+			pagination.pages(servers_url, self.session, prefetch=prefetch)]
+
+	def test_remaining_page_urls(self):
+		with requests_mock.Mocker() as m:
+			register_pages(m, 4)
+			response = self.session.get(servers_url)
+			urls = pagination.remaining_page_urls(response)
+		self.assertEqual(len(urls), 3)
+		self.assertIn("page=2", urls[0])
+		self.assertIn("filter%5Breported%5D=false", urls[0])
+		self.assertIn("page=4", urls[2])
+
+	def test_prefetch_keeps_page_order(self):
+		with requests_mock.Mocker() as m:
+			register_pages(m, 12)
+			self.assertEqual(self.page_ids(prefetch=4), list(range(1, 13)))
+			self.assertEqual(m.call_count, 12)
+
+	def test_prefetch_falls_back_to_next_links(self):
+		with requests_mock.Mocker() as m:
+			register_pages(m, 5, with_last=False)
+			self.assertEqual(self.page_ids(prefetch=4), list(range(1, 6)))
+
+	def test_failed_page_raises(self):
+		with requests_mock.Mocker() as m:
+			register_pages(m, 3)
+			m.get(servers_url + "?page=3", status_code=500, json={"error": "boom"})
+			with self.assertRaises(PaginationError):
+				self.page_ids(prefetch=2)
+
+class TestIterEntities(unittest.TestCase):
+
+	def test_streams_slim_records_in_page_order(self):
+		session = requests.Session()
+		with requests_mock.Mocker() as m:
+			register_pages(m, 3)
+			records = pagination.iter_entities(servers_url, session, "servers", record=ServerRecord)
+			first = next(records)
+			self.assertEqual(m.call_count, 1)
+			records = [first] + list(records)
+
+		self.assertEqual([record["id"] for record in records], [1, 2, 3])
+		self.assertIsNone(records[0]["last_reported_at"])
+		self.assertFalse(hasattr(records[0], "__dict__"))
+		with self.assertRaises(KeyError):
+			records[0]["summary"]
@@ -0,0 +1,91 @@
+import unittest
+import json
+from unittest import mock
+from newrelic_alerting.inventory import ServerInventory
+from newrelic_alerting.policy import Policy, Condition
+from newrelic_alerting.planner import plan_reconciliation
+
+all_servers = [
+	{"id": 1, "name": "live-web-1"},
+	{"id": 2, "name": "live-backend-1"},
+	{"id": 3, "name": "dev-web-1"}
+]
+
+all_labels = [
+	{"key": "Deployment:live-web", "links": {"servers": [1]}},
+	{"key": "Deployment:live-backend", "links": {"servers": [2]}},
+	{"key": "Deployment:dev-web", "links": {"servers": [3]}}
+]
+
+def make_policy(config, policy_id, conditions):
+	policy = Policy(None, config)
+	policy.id = policy_id
+	policy.cm.load_conditions(conditions)
+	return policy
+
+class TestPlanReconciliation(unittest.TestCase):
+
+	def setUp(self):
+		self.inventory = ServerInventory(all_servers, all_labels)
+
+	def test_plan_groups_operations_by_condition(self):
+		policy = make_policy({"name": "LIVE", "tags": ["live-web", "live-backend"]}, 10, [
+			{"id": 100, "name": "CPU", "entities": ["1", "3"]},
+			{"id": 101, "name": "MEM", "entities": []}
+		])
+
+		plan = plan_reconciliation([policy], self.inventory)
+
+		self.assertEqual(len(plan), 4)
+		plan_dict = json.loads(plan.to_json())
+		cpu, mem = plan_dict["conditions"]
+		self.assertEqual(cpu["condition_id"], 100)
+		self.assertEqual([server["id"] for server in cpu["add"]], [2])
+		self.assertEqual(cpu["remove"], [3])
+		self.assertEqual(sorted(server["id"] for server in mem["add"]), [1, 2])
+		self.assertEqual(mem["remove"], [])
+
+	def test_duplicate_policies_are_planned_once(self):
+		conditions = [{"id": 100, "name": "CPU", "entities": ["3"]}]
+		live = make_policy({"name": "SHARED", "tags": ["live-web"]}, 10, conditions)
+		dev = make_policy({"name": "SHARED", "tags": ["dev-web"]}, 10, conditions)
+
+		plan = plan_reconciliation([live, dev, live], self.inventory)
+
+		self.assertEqual(len(plan), 1)
+		self.assertEqual(len(plan.mutations()), 1)
+		self.assertEqual(plan.mutations()[0].server_id, 1)
+
+	def test_plan_with_selector(self):
+		inventory = ServerInventory(all_servers, all_labels + [{"key": "Role:web", "links": {"servers": [1, 3]}}])
+		policy = make_policy({"name": "WEB", "tags": ["live-backend"], "selector": "Role:web AND NOT Deployment:dev-web"},
+							 10, [{"id": 100, "name": "CPU", "entities": ["3"]}])
+
+		plan = plan_reconciliation([policy], inventory)
+
+		self.assertEqual(sorted(mutation.server_id for mutation in plan.conditions[100].add.values()), [1, 2])
+		self.assertEqual(list(plan.conditions[100].remove), ["3"])
+
+	def test_keep_set_shared_by_policy_conditions(self):
+		policy = make_policy({"name": "LIVE", "tags": ["live-web"]}, 10, [
+			{"id": 100, "name": "CPU", "entities": ["1", "2", "3"]},
+			{"id": 200, "name": "Disk", "entities": ["3"]}
+		])
+		deregister_mutations = Condition.deregister_mutations
+
+		with mock.patch.object(Condition, "deregister_mutations", autospec=True,
+							   side_effect=deregister_mutations) as deregister:
+			plan = plan_reconciliation([policy], self.inventory)
+
+		cpu_keep, disk_keep = [call[0][2] for call in deregister.call_args_list]
+		self.assertEqual(cpu_keep, {1})
+		self.assertIs(cpu_keep, disk_keep)
+		self.assertEqual([(mutation.condition.id, mutation.server_id) for mutation in plan.mutations()],
+						 [(100, 2), (100, 3), (200, 1), (200, 3)])
+
+	def test_empty_plan(self):
+		policy = make_policy({"name": "DEV", "tags": ["dev-web"]}, 10, [
+			{"id": 100, "name": "CPU", "entities": ["3"]}
+		])
+		plan = plan_reconciliation([policy], self.inventory)
+		self.assertEqual(plan.to_dict(), {"operations": 0, "conditions": []})
@@ -4,7 +4,8 @@ import requests_mock
 import yaml
 import json
 import datetime
-from newrelic_alerting.policy import PoliciesManager, Policy
+from newrelic_alerting.policy import PoliciesManager
+from newrelic_alerting.exceptions import PolicyNotFound
 
 two_hours_ago = (
 	datetime.datetime.utcnow() - datetime.timedelta(hours=2)
@@ -12,7 +13,7 @@ two_hours_ago = (
 
 just_now = (datetime.datetime.utcnow()).strftime('%Y-%m-%dT%H:%M:%S+00:00')
 
-config = yaml.load("""
+config = yaml.safe_load("""
 ---
 alert_policies:
     - name: "Test Policy1"
@@ -143,6 +144,9 @@ class MockPolicyDataManager(object):
 	def all_conditions(self, params):
 		return all_conditions
 
+	def iter_conditions(self, params, record=None):
+		return iter(all_conditions)
+
 	def deregister_server(self, server_id, params):
 		for condition in all_conditions:
 			if server_id in condition["entities"]:
@@ -189,28 +193,20 @@ class TestPolicyManager(unittest.TestCase):
 		test1_and_test2_policies = pm.policies_by_tags(["test1", "test2"])
 		self.assertEqual(len(test1_and_test2_policies), 2)
 
+	def test_add_alert_policies(self):
 
-class TestPolicy(unittest.TestCase):
-
-	def setUp(self):
-		self.pdm = MockPolicyDataManager()
-
-	def test_register_server(self):
+		pm = PoliciesManager(self.pdm)
+		pm.add_alert_policies(config["alert_policies"], jobs=2)
 
-		policy = Policy(self.pdm, config["alert_policies"][0])
-		policy.initialise()
+		self.assertEqual([policy.id for policy in pm.alert_policies], [111111, 222222])
+		for policy in pm.alert_policies:
+			self.assertEqual(len(policy.cm.conditions), 2)
 
-		policy.register_server(all_servers[0])
-		for condition in policy.cm.conditions:
-			self.assertIn(str(all_servers[0]["id"]), condition)
+	def test_add_alert_policies_missing_policy(self):
 
-	def test_deregister_servers(self):
-		policy = Policy(self.pdm, config["alert_policies"][0])
-		policy.initialise()
-	
-		policy.register_server(all_servers[0])
-		policy.register_server(all_servers[1])
+		pm = PoliciesManager(self.pdm)
+		missing = [{"name": "Missing Policy", "tags": ["test"]}]
 
-		result = policy.deregister_servers([all_servers[0]])
-		for condition in policy.cm.conditions:
-			self.assertNotIn(str(all_servers[1]["id"]), condition.entities)
\ No newline at end of file
+		with self.assertRaises(PolicyNotFound):
+			pm.add_alert_policies(config["alert_policies"] + missing)
+		self.assertEqual(len(pm.alert_policies), 0)
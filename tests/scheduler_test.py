@@ -0,0 +1,77 @@
+import unittest
+import requests
+import requests_mock
+from newrelic_alerting.scheduler import RequestScheduler, TokenBucket, AdaptiveConcurrencyLimit
+
+servers_url = "https://api.newrelic.com/v2/servers.json"
+
+class FakeClock(object):
+
+	def __init__(self):
+		self.now = 0.0
+		self.sleeps = []
+
+	def __call__(self):
+		return self.now
+
+	def sleep(self, seconds):
+		self.sleeps.append(seconds)
+		self.now += seconds
+
+class TestRequestScheduler(unittest.TestCase):
+
+	def setUp(self):
+		self.clock = FakeClock()
+		self.scheduler = RequestScheduler(requests.Session(), max_concurrency=4, max_retries=2,
+			sleep=self.clock.sleep)
+
+	def test_retry_after_is_honoured(self):
+		with requests_mock.Mocker() as m:
+			m.get(servers_url, [
+				{"status_code": 429, "headers": {"Retry-After": "7"}, "json": {}},
+				{"status_code": 200, "json": {"servers": []}}
+			])
+			response = self.scheduler.get(servers_url)
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(m.call_count, 2)
+		self.assertEqual(len(self.clock.sleeps), 1)
+		self.assertGreaterEqual(self.clock.sleeps[0], 7)
+		self.assertLess(self.clock.sleeps[0], 8)
+		# halved by the throttling, then grown by the successful retry
+		self.assertEqual(self.scheduler.concurrency.limit, 2.5)
+
+	def test_gives_up_after_max_retries(self):
+		with requests_mock.Mocker() as m:
+			m.delete(servers_url, status_code=503, json={})
+			response = self.scheduler.delete(servers_url)
+
+		self.assertEqual(response.status_code, 503)
+		self.assertEqual(m.call_count, 3)
+		self.assertEqual(len(self.clock.sleeps), 2)
+
+class TestTokenBucket(unittest.TestCase):
+
+	def test_requests_are_paced(self):
+		clock = FakeClock()
+		bucket = TokenBucket(60, capacity=2, clock=clock, sleep=clock.sleep)
+
+		for _ in range(5):
+			bucket.acquire()
+
+		self.assertAlmostEqual(clock.now, 3.0)
+
+class TestAdaptiveConcurrencyLimit(unittest.TestCase):
+
+	def test_additive_increase_multiplicative_decrease(self):
+		limit = AdaptiveConcurrencyLimit(8)
+		limit.on_throttle()
+		limit.on_throttle()
+		self.assertEqual(limit.limit, 2)
+		for _ in range(4):
+			limit.on_success()
+		self.assertGreater(limit.limit, 3)
+		self.assertLess(limit.limit, 4)
+		for _ in range(100):
+			limit.on_success()
+		self.assertEqual(limit.limit, 8)
@@ -4,7 +4,8 @@ import requests_mock
 import yaml
 import json
 import datetime
-from newrelic_alerting.server import ServersManager, ServersDataManager
+from newrelic_alerting.exceptions import UnexpectedStatusCode
+from newrelic_alerting.server import ServersManager, ServersDataManager, filter_not_reporting
 
 two_hours_ago = (
 	datetime.datetime.utcnow() - datetime.timedelta(hours=2)
@@ -54,14 +55,44 @@ all_servers = [
 	'links': {}
 }]
 
+class MockResponse(object):
+
+	def __init__(self, payload, status_code=200):
+		self.payload = payload
+		self.status_code = status_code
+
+	def json(self):
+		return self.payload
+
 class MockServersDataManager(object):
 
-	def delete_server(self, server_id, params):
-		pass
+	def show_server(self, server_id):
+		if server_id == "500":
+			return MockResponse({"error": {"title": "Internal error"}}, 500)
+		for server in all_servers:
+			if str(server["id"]) == server_id:
+				return MockResponse({"server": server})
+		return MockResponse({"error": {"title": "Server not found"}}, 404)
+
+	def get_labels(self, params):
+		return [{"key": "Deployment:live", "links": {"servers": [86867839]}}]
+
+	def __init__(self, failing=()):
+		self.failing = failing
+		self.deleted = []
+
+	def delete_server(self, server_id, params=None):
+		if server_id in self.failing:
+			raise requests.exceptions.ConnectionError("connection reset")
+		self.deleted.append(server_id)
+		return True
 
 	def get_servers(self, params):
 		return all_servers	
 
+	def iter_servers(self, params, record=None):
+		return iter(all_servers)
+
 class TestServerManager(unittest.TestCase):
 	
 	def setUp(self):
@@ -75,3 +106,50 @@ class TestServerManager(unittest.TestCase):
 
 		self.assertEqual(len(not_reporting), 1)
 		self.assertEqual(not_reporting[0]["id"], 86713155)
+
+	def test_cleanup_report(self):
+
+		servers = [dict(all_servers[1], id=server_id) for server_id in range(1, 6)]
+		sdm = MockServersDataManager(failing=(2, 4))
+		sdm.iter_servers = lambda params, record=None: iter(servers)
+
+		report = ServersManager(sdm).cleanup_not_reporting_servers(1, jobs=3)
+
+		self.assertFalse(report)
+		self.assertEqual(sorted(sdm.deleted), [1, 3, 5])
+		self.assertEqual(sorted(result.server["id"] for result in report.failed), [2, 4])
+		self.assertEqual(report.to_dict()["deleted"], 3)
+
+	def test_filter_not_reporting(self):
+
+		now = datetime.datetime(2017, 10, 20, 12, 0, 0, tzinfo=datetime.timezone.utc)
+		servers = [
+			{"id": 1, "reporting": False, "last_reported_at": "2017-10-20T09:59:59+00:00"},
+			{"id": 2, "reporting": False, "last_reported_at": "2017-10-20T10:00:00+00:00"},
+			{"id": 3, "reporting": False, "last_reported_at": "2017-10-20T11:30:00+02:00"},
+			{"id": 4, "reporting": False, "last_reported_at": "2017-10-20T09:00:00Z"},
+			{"id": 5, "reporting": True, "last_reported_at": "2017-10-19T09:00:00+00:00"},
+			{"id": 6, "reporting": False, "last_reported_at": None}
+		]
+
+		not_reporting = filter_not_reporting(servers, 2, now=now)
+
+		self.assertEqual([server["id"] for server in not_reporting], [1, 3, 4])
+
+	def test_find_server(self):
+
+		sm = ServersManager(self.sdm)
+
+		self.assertEqual(sm.find_server(86713155)["name"], 'cell_z2-33-dev-diego')
+		self.assertEqual(sm.find_server('cell_z2-32-live-diego')["id"], 86867839)
+		self.assertIsNone(sm.find_server(1))
+		self.assertIsNone(sm.find_server('missing'))
+		with self.assertRaises(UnexpectedStatusCode):
+			sm.find_server(500)
+
+	def test_get_server_labels(self):
+
+		sm = ServersManager(self.sdm)
+
+		self.assertEqual(sm.get_server_labels(86867839), {"Deployment:live"})
+		self.assertEqual(sm.get_server_labels(86713155), set())
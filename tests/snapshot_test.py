@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import unittest
+from newrelic_alerting.inventory import ServerInventory
+from newrelic_alerting.policy import PoliciesManager
+from newrelic_alerting.alert_manager import NewRelicAlertManager
+from newrelic_alerting.snapshot import SyncSnapshot
+from newrelic_alerting import run
+
+alert_policies = [{"name": "LIVE", "tags": ["live-web"]}]
+
+all_servers = [{"id": 1, "name": "web-1"}, {"id": 2, "name": "web-2"}, {"id": 3, "name": "web-3"}]
+
+class MockPolicyDataManager(object):
+
+	def __init__(self):
+		self.entities = ["1", "3"]
+		self.mutations = []
+		self.initialisations = 0
+
+	def all_policies(self, params):
+		self.initialisations += 1
+		return [{"id": 10, "name": "LIVE"}]
+
+	def iter_conditions(self, params, record=None):
+		return iter([{"id": 100, "name": "CPU", "entities": list(self.entities)}])
+
+	def register_server(self, server, condition_id):
+		self.mutations.append(("add", server["id"]))
+		self.entities.append(str(server["id"]))
+		return True
+
+	def deregister_server(self, server_id, condition_id):
+		self.mutations.append(("remove", server_id))
+		self.entities.remove(str(server_id))
+		return True
+
+def inventory(server_ids):
+	return ServerInventory(all_servers, [{"key": "Deployment:live-web", "links": {"servers": server_ids}}])
+
+class TestIncrementalSync(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.config = {
+			"ALERT_CONFIG": {"alert_policies": alert_policies},
+			"SNAPSHOT_PATH": os.path.join(self.directory, "snapshot.json"),
+			"PLAN_ONLY": False
+		}
+		self.pdm = MockPolicyDataManager()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def reconcile(self, server_ids):
+		alert_manager = NewRelicAlertManager(None, alert_policies, PoliciesManager(self.pdm), None)
+		return run.reconcile(self.config, alert_manager, inventory(server_ids))
+
+	def test_unchanged_labels_are_a_noop(self):
+		self.reconcile([1, 2])
+		self.assertEqual(self.pdm.mutations, [("add", 2), ("remove", 3)])
+		self.assertEqual(self.pdm.initialisations, 1)
+
+		report = self.reconcile([1, 2])
+
+		self.assertEqual(len(report), 0)
+		self.assertEqual(self.pdm.initialisations, 1)
+
+	def test_only_relabelled_servers_are_reconciled(self):
+		self.reconcile([1, 2])
+		self.pdm.mutations = []
+
+		self.reconcile([1, 2, 3])
+
+		self.assertEqual(self.pdm.mutations, [("add", 3)])
+
+	def test_drifted_conditions_are_reconciled_for_all_servers(self):
+		self.reconcile([1, 2])
+		# a server removed from the condition by hand, its labels did not change
+		self.pdm.entities.remove("1")
+		self.pdm.mutations = []
+
+		self.reconcile([1, 2, 3])
+
+		self.assertEqual(sorted(self.pdm.mutations), [("add", 1), ("add", 3)])
+		self.assertEqual(SyncSnapshot.load(self.config["SNAPSHOT_PATH"]).conditions, {"100": ["1", "2", "3"]})
+
+	def test_warm_model_drift_is_reconciled_without_label_changes(self):
+		alert_manager = NewRelicAlertManager(None, alert_policies, PoliciesManager(self.pdm), None)
+		run.reconcile(self.config, alert_manager, inventory([1, 2]))
+		self.pdm.entities.remove("1")
+		# the model is refreshed, ie. once its TTL expired
+		alert_manager.initialise()
+		self.pdm.mutations = []
+
+		run.reconcile(self.config, alert_manager, inventory([1, 2]))
+
+		self.assertEqual(self.pdm.mutations, [("add", 1)])
+
+	def test_snapshot_save_and_load(self):
+		snapshot = SyncSnapshot.from_inventory(alert_policies, inventory([1, 2]))
+		snapshot.save(self.config["SNAPSHOT_PATH"])
+
+		loaded = SyncSnapshot.load(self.config["SNAPSHOT_PATH"])
+
+		self.assertTrue(snapshot.matches(loaded))
+		self.assertEqual(SyncSnapshot.from_inventory(alert_policies, inventory([2, 3])).changed_servers(loaded), {"1", "3"})
+		self.assertIsNone(SyncSnapshot.load(os.path.join(self.directory, "missing.json")))
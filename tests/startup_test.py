@@ -0,0 +1,29 @@
+import unittest
+from benchmarks.startup_benchmark import DEFERRED, ENTRY_POINTS, import_times, regressions
+
+class TestStartup(unittest.TestCase):
+
+	def test_cli_defers_the_web_app_and_optional_imports(self):
+		modules = import_times(ENTRY_POINTS["cli"])
+		self.assertIn("requests", modules)
+		self.assertEqual([name for name in DEFERRED if name in modules], [])
+
+	def test_app_entry_point(self):
+		modules = import_times(ENTRY_POINTS["app"])
+		self.assertIn("flask", modules)
+
+	def test_regressions(self):
+		measurements = {"cli": {"import_ms": 130.0, "deferred": []}, "app": {"import_ms": 200.0, "deferred": []}}
+		baseline = {"cli": {"import_ms": 100.0}, "app": {"import_ms": 190.0}}
+		self.assertEqual(regressions(measurements, baseline, 0.25), ["cli imports in 130.0ms, 100.0ms in the baseline"])
+		measurements["cli"]["deferred"] = ["flask"]
+		self.assertEqual(regressions(measurements, {}, 0.25), ["cli imports flask"])
+
+	def test_run_keeps_the_app_entry_points(self):
+		from newrelic_alerting import run
+		self.assertTrue(callable(run.main))
+		self.assertTrue(callable(run.main_app))
+		self.assertTrue(callable(run.create_app))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,106 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+import yaml
+
+from newrelic_alerting import run, metrics, tracing
+from benchmarks.stub_server import StubAPI, StubError, start_stub_account
+
+class TestStubAPI(unittest.TestCase):
+
+	def setUp(self):
+		self.api, self.config = start_stub_account(self, page_size=25, servers=60, policies=3, conditions=6,
+												   stale=0.1, drift=0.2)
+		self.config.update(JOBS=4, PREFETCH_PAGES=2)
+
+	def test_synchronise(self):
+		sweeps = metrics.SWEEP_PAGES.count("servers")
+		report = run.run_synch(self.config)
+
+		self.assertTrue(report)
+		self.assertGreater(len(report), 0)
+		reporting = set(str(server["id"]) for server in self.api.servers)
+		self.assertLess(len(reporting), 60)
+		for condition in self.api.conditions:
+			policy_index = condition["policy_id"] - 300000
+			deployment = set(str(server_id) for server_id in range(100000 + policy_index, 100060, 3))
+			self.assertEqual(condition["entities"], deployment & reporting)
+
+		self.assertEqual(len(run.run_synch(self.config)), 0)
+		# the inventory and the stale servers listings, twice
+		self.assertEqual(metrics.SWEEP_PAGES.count("servers"), sweeps + 4)
+		self.assertGreaterEqual(metrics.API_RESPONSES.get("PUT", "alerts_entity_conditions/{id}", "200"), 1)
+
+	def fail_a_stale_deletion(self):
+		"""
+		:return: the ids of the stale servers, the deletion of the first one failing
+		"""
+		stale = [server["id"] for server in self.api.servers if not server["reporting"]]
+		delete_server = self.api.delete_server
+
+		def failing_delete(server_id):
+			if server_id == stale[0]:
+				raise StubError(403, "Forbidden")
+			return delete_server(server_id)
+
+		self.api.delete_server = failing_delete
+		return stale
+
+	def test_cleanup_report(self):
+		stale = self.fail_a_stale_deletion()
+		cleanup = run.run_synch(self.config).to_dict()["cleanup"]
+
+		self.assertEqual(cleanup["deleted"], len(stale) - 1)
+		self.assertEqual(cleanup["failed"], 1)
+		failed = [result for result in cleanup["results"] if not result["ok"]]
+		self.assertEqual(failed[0]["server_id"], stale[0])
+
+	def test_cli_fails_with_a_failed_deletion(self):
+		self.fail_a_stale_deletion()
+		with tempfile.TemporaryDirectory() as directory:
+			config_path = os.path.join(directory, "alert_config.yml")
+			with open(config_path, "w") as config_file:
+				yaml.safe_dump(self.config["ALERT_CONFIG"], config_file)
+			argv = ["newrelic_alerting", "-k", "key", "-c", config_path, "--api-base-url", self.config["API_BASE_URL"]]
+			with mock.patch("sys.argv", argv), self.assertRaises(SystemExit) as context:
+				run.main()
+
+		self.assertEqual(context.exception.code, 1)
+
+	def test_trace(self):
+		with tempfile.TemporaryDirectory() as directory:
+			trace_path = os.path.join(directory, "trace.json")
+			with tracing.instrumented(trace_path=trace_path):
+				run.run_synch(self.config)
+			with open(trace_path) as trace_file:
+				names = [event["name"] for event in json.load(trace_file)["traceEvents"]]
+
+		for phase in ("synchronise", "inventory", "snapshot", "initialise", "plan", "apply", "cleanup"):
+			self.assertIn(phase, names)
+		self.assertIn("GET alerts_conditions", names)
+		self.assertIn("PUT alerts_entity_conditions/{id}", names)
+
+	def test_filters_and_pagination(self):
+		response = requests.get(self.config["API_BASE_URL"] + "/servers.json",
+								params={"filter[labels]": "Deployment:deployment-1;Role:web"})
+		indexes = [server["id"] - 100000 for server in response.json()["servers"]]
+
+		self.assertEqual(indexes, list(range(4, 60, 12)))
+		self.assertEqual(self.api.stats()["calls"], {"GET servers": 1})
+
+		response = requests.get(self.config["API_BASE_URL"] + "/servers.json")
+		self.assertEqual(len(response.json()["servers"]), 25)
+		self.assertIn("page=3", response.links["last"]["url"])
+
+	def test_rate_limit(self):
+		now = [0.0]
+		api = StubAPI(rate_limit=2, clock=lambda: now[0])
+
+		self.assertEqual([api.count("GET", "servers") for _ in range(3)], [None, None, 1])
+		now[0] = 1.0
+		self.assertIsNone(api.count("GET", "servers"))
+		self.assertEqual(api.stats()["throttled"], 1)
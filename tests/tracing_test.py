@@ -0,0 +1,58 @@
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+from newrelic_alerting import tracing
+
+class TestTracing(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.trace_path = os.path.join(self.directory, "trace.json")
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_inactive_spans_are_no_ops(self):
+		self.assertIs(tracing.span("plan"), tracing.NO_SPAN)
+		self.assertFalse(tracing.active())
+
+	def test_trace(self):
+		with tracing.instrumented(trace_path=self.trace_path):
+			with tracing.span("synchronise", tracing.SYNC):
+				with tracing.span("plan", servers=3):
+					pass
+				tracing.record("GET servers", tracing.API, 0, 0, status=200)
+			with self.assertRaises(ValueError):
+				with tracing.span("apply"):
+					raise ValueError("boom")
+
+		with open(self.trace_path) as trace_file:
+			events = json.load(trace_file)["traceEvents"]
+		spans = {event["name"]: event for event in events if event["ph"] == "X"}
+
+		self.assertEqual(set(spans), {"synchronise", "plan", "GET servers", "apply"})
+		self.assertEqual(spans["plan"]["args"], {"servers": 3})
+		self.assertEqual(spans["GET servers"]["cat"], "api")
+		self.assertIn("boom", spans["apply"]["args"]["error"])
+		self.assertLessEqual(spans["synchronise"]["ts"], spans["plan"]["ts"])
+		self.assertTrue(any(event["ph"] == "M" for event in events))
+		self.assertFalse(tracing.active())
+
+	def test_profile(self):
+		profile_path = os.path.join(self.directory, "profiles")
+		with tracing.instrumented(profile_path=profile_path):
+			with tracing.span("initialise"):
+				with tracing.span("inventory"):
+					sorted(range(1000))
+			with tracing.span("apply"):
+				pass
+
+		self.assertEqual(sorted(os.listdir(profile_path)), [
+			"01-initialise.prof", "01-initialise.tracemalloc", "02-apply.prof", "02-apply.tracemalloc"])
+		pstats.Stats(os.path.join(profile_path, "01-initialise.prof"))
+		tracemalloc.Snapshot.load(os.path.join(profile_path, "02-apply.tracemalloc"))
+		self.assertFalse(tracemalloc.is_tracing())
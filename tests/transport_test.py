@@ -0,0 +1,29 @@
+import unittest
+from unittest import mock
+from requests.adapters import HTTPAdapter
+from newrelic_alerting import transport
+
+class TestCreateSession(unittest.TestCase):
+
+	def test_tuned_session(self):
+		session = transport.create_session("key", pool_size=32, connect_timeout=3, read_timeout=20)
+		adapter = session.get_adapter("https://api.newrelic.com/v2/servers.json")
+
+		self.assertEqual(session.headers["X-Api-Key"], "key")
+		self.assertEqual(session.headers["Accept-Encoding"], "gzip")
+		self.assertEqual(adapter._pool_maxsize, 32)
+		self.assertEqual(adapter.timeout, (3, 20))
+
+	def test_default_timeout_is_applied(self):
+		adapter = transport.create_adapter(connect_timeout=3, read_timeout=20)
+		with mock.patch.object(HTTPAdapter, "send") as send:
+			adapter.send(mock.Mock())
+			adapter.send(mock.Mock(), timeout=1)
+
+		self.assertEqual(send.call_args_list[0][1]["timeout"], (3, 20))
+		self.assertEqual(send.call_args_list[1][1]["timeout"], 1)
+
+	def test_wrap_adapter(self):
+		wrapped = []
+		session = transport.create_session("key", wrap_adapter=lambda adapter: wrapped.append(adapter) or adapter)
+		self.assertIs(session.get_adapter("https://api.newrelic.com"), wrapped[0])